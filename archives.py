@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+try:
+    import zstandard
+except ImportError:  # optional: tar.zst downloads are unavailable without it
+    zstandard = None
+
+ARCHIVE_CACHE_DIR = os.getenv("ARCHIVE_CACHE_DIR", "/tmp/terraform-bot/archives")
+ARCHIVE_CACHE_MAX_BYTES = int(os.getenv("ARCHIVE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# format -> (file extension, media type)
+FORMATS = {
+    "zip": ("zip", "application/x-zip-compressed"),
+    "tar.gz": ("tar.gz", "application/gzip"),
+    "tar.zst": ("tar.zst", "application/zstd"),
+}
+
+# Fixed timestamp, so the same files always produce byte-identical archives.
+EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def archive_key(files: dict, hashes: dict = None) -> str:
+    """Content hash of a file set; the stored per-file hashes are reused when they match."""
+    if not hashes or set(hashes) != set(files):
+        hashes = {name: hashlib.sha256(content.encode()).hexdigest() for name, content in files.items()}
+    return hashlib.sha256(json.dumps(sorted(hashes.items())).encode()).hexdigest()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if an If-None-Match header covers etag (weak comparison, as RFC 9110 asks for)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != "tar.zst" or zstandard is not None]
+
+
+def write_archive(files: dict, fileobj, fmt: str):
+    """Writes files (sorted, fixed timestamps) to fileobj as fmt, one file at a time."""
+    names = sorted(files)
+    if fmt == "zip":
+        with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name in names:
+                info = zipfile.ZipInfo(name, date_time=EPOCH)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                archive.writestr(info, files[name])
+        return
+
+    def add_all(tar):
+        for name in names:
+            data = files[name].encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+
+    if fmt == "tar.gz":
+        with gzip.GzipFile(filename="", fileobj=fileobj, mode="wb", mtime=0) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                add_all(tar)
+    else:
+        with zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                add_all(tar)
+
+
+class ArchiveCache:
+    """Built archives on disk, keyed by content hash and format.
+
+    An archive is built once (off the event loop, straight to a file) and
+    then served from disk for every later download of the same file set.
+    Concurrent requests for the same archive wait for a single build; the
+    least recently used archives are removed beyond `max_bytes`.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_CACHE_DIR, max_bytes: int = ARCHIVE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._builds = {}  # path -> asyncio.Lock
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    async def get(self, files: dict, key: str, fmt: str) -> str:
+        """Path of the fmt archive of files, building it if needed."""
+        path = os.path.join(self.directory, f"{key}.{FORMATS[fmt][0]}")
+        if self._touch(path):
+            self.hits += 1
+            return path
+        lock = self._builds.setdefault(path, asyncio.Lock())
+        async with lock:
+            if self._touch(path):
+                self.hits += 1
+                return path
+            await asyncio.to_thread(self._build, files, path, fmt)
+            self.builds += 1
+        self._builds.pop(path, None)
+        await asyncio.to_thread(self._evict)
+        return path
+
+    @staticmethod
+    def _touch(path) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _build(self, files, path, fmt):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write_archive(files, f, fmt)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "builds": self.builds, "evictions": self.evictions}
@@ -0,0 +1,388 @@
+"""Offline end-to-end benchmark of the backend.
+
+Drives the FastAPI app (and with it graph_app) in-process with a scripted
+stand-in for ChatGroq, stub terraform/infracost/gcloud executables and an
+in-memory GCS for the archive upload, so no network, API key or cloud
+account is needed. Every session asks for a
+bucket, waits for the approval prompt, approves and waits for the apply.
+
+    python benchmark.py --sessions 50 --concurrency 10 --llm-latency 0.2
+    python benchmark.py --json bench_output.txt   # also save the results
+
+Reports sessions/sec, p50/p95/p99 time-to-plan, time-to-approval and
+apply time, peak thread count and RSS. Set GRAPH_WORKERS etc. in the
+environment as usual to benchmark other settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+WORKDIR = tempfile.mkdtemp(prefix="terraform-bot-bench-")
+STUB_DIR = os.path.join(WORKDIR, "bin")
+
+# Stub CLIs: each sleeps BENCH_CLI_LATENCY seconds and prints what the real tool would.
+STUBS = {
+    "terraform": r"""#!/bin/sh
+sleep "${BENCH_CLI_LATENCY:-0}"
+case "$1" in
+  validate) echo '{"format_version":"1.0","valid":true,"error_count":0,"warning_count":0,"diagnostics":[]}';;
+  plan)
+    for arg in "$@"; do case "$arg" in -out=*) : > "${arg#-out=}";; esac; done
+    echo "Plan: 1 to add, 0 to change, 0 to destroy.";;
+  show) echo '{"format_version":"1.2","planned_values":{"root_module":{}}}';;
+  apply) echo "Apply complete! Resources: 1 added, 0 changed, 0 destroyed.";;
+  *) echo "terraform $*";;
+esac
+""",
+    "infracost": r"""#!/bin/sh
+sleep "${BENCH_CLI_LATENCY:-0}"
+echo '{"totalMonthlyCost":"0.52","currency":"USD","projects":[{"breakdown":{"resources":[{"name":"google_storage_bucket.bucket","monthlyCost":"0.52"}]}}]}'
+""",
+    "gcloud": r"""#!/bin/sh
+sleep "${BENCH_CLI_LATENCY:-0}"
+echo "gcloud $*"
+""",
+}
+
+
+def install_stubs():
+    os.makedirs(STUB_DIR, exist_ok=True)
+    for name, script in STUBS.items():
+        path = os.path.join(STUB_DIR, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = STUB_DIR + os.pathsep + os.environ.get("PATH", "")
+
+
+def isolate_environment(llm_cache: bool):
+    """Keeps the run off the real checkpoint/cache/log files; must run before main is imported."""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("INFRACOST_API_KEY", "benchmark")
+    os.environ["LLM_CACHE"] = "1" if llm_cache else "0"
+    os.environ["LLM_CACHE_DB"] = os.path.join(WORKDIR, "llm-cache.db")
+    os.environ["CHECKPOINT_DB"] = os.path.join(WORKDIR, "checkpoints.db")
+    os.environ["TF_PLUGIN_CACHE_DIR"] = os.path.join(WORKDIR, "plugin-cache")
+    os.environ["TF_BOT_CLI_CONFIG_FILE"] = os.path.join(WORKDIR, "terraformrc")
+    os.environ["LOG_FILE"] = os.path.join(WORKDIR, "backend.log")
+    os.environ["LOG_CONSOLE"] = "0"
+    os.environ["TRACE_DIR"] = ""
+
+
+def bucket_config(name: str) -> dict:
+    return {
+        "main.tf": (
+            f'resource "google_storage_bucket" "bucket" {{\n'
+            f'  name                        = "{name}"\n'
+            f'  location                    = var.region\n'
+            f'  uniform_bucket_level_access = true\n'
+            f'  public_access_prevention    = "enforced"\n'
+            f'}}\n'
+        ),
+        "variables.tf": 'variable "region" {\n  default = "us-central1"\n}\n',
+        "outputs.tf": 'output "bucket" {\n  value = google_storage_bucket.bucket.name\n}\n',
+    }
+
+
+class ScriptedChatModel:
+    """Stand-in for ChatGroq that answers each of the bot's prompts from a script.
+
+    Every call sleeps `latency` seconds (+/- `jitter`) and reports token
+    usage estimated from the prompt and answer length.
+    """
+
+    model_name = "scripted"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    @staticmethod
+    def answer(prompt: str) -> str:
+        if "intent classifier for a cloud" in prompt:
+            return "DEPLOYMENT"
+        if "Terraform approval workflow" in prompt:
+            return "APPROVE"
+        if "extracts structured cloud deployment" in prompt:
+            return json.dumps({"provider": "GCP", "region": "us-central1", "instance_type": "",
+                               "resource_type": "GCS bucket"})
+        if "cloud security expert" in prompt:
+            return json.dumps({"severity": "LOW", "issues": []})
+        if "Generate a professional" in prompt or "Terraform expert" in prompt:
+            return json.dumps(bucket_config(f"bench-{random.getrandbits(32):08x}"))
+        return "Sounds good."
+
+    def _reply(self, messages):
+        from langchain_core.messages import AIMessage
+
+        prompt = "\n".join(str(getattr(m, "content", m)) for m in messages)
+        content = self.answer(prompt)
+        self.calls += 1
+        usage = {"input_tokens": len(prompt) // 4 + 1, "output_tokens": len(content) // 4 + 1}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return AIMessage(content=content, usage_metadata=usage)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def invoke(self, messages, *args, **kwargs):
+        time.sleep(self._delay())
+        return self._reply(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._reply(messages)
+
+
+class FakeGCS:
+    """In-memory stand-in for the GCS JSON API calls of the archive upload (an httpx.MockTransport handler)."""
+
+    def __init__(self):
+        self.buckets = set()
+        self.objects = {}  # (bucket, name) -> bytes
+
+    def __call__(self, request):
+        import base64
+        import hashlib
+
+        import httpx
+
+        parts = request.url.path.strip("/").split("/")
+        params = request.url.params
+        if parts[:4] == ["upload", "storage", "v1", "b"] and params.get("uploadType") == "media":
+            self.objects[(parts[4], params["name"])] = request.content
+            return httpx.Response(200, json={"name": params["name"]})
+        if parts == ["storage", "v1", "b"] and request.method == "POST":
+            self.buckets.add(json.loads(request.content)["name"])
+            return httpx.Response(200, json={})
+        if parts[:3] == ["storage", "v1", "b"] and len(parts) == 4:
+            return httpx.Response(200 if parts[3] in self.buckets else 404, json={})
+        if parts[:3] == ["storage", "v1", "b"] and parts[4:] == ["o"]:
+            items = [
+                {"name": name, "md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode()}
+                for (bucket, name), data in self.objects.items()
+                if bucket == parts[3] and name.startswith(params.get("prefix", ""))
+            ]
+            return httpx.Response(200, json={"items": items})
+        return httpx.Response(400, json={"error": f"unsupported: {request.method} {request.url.path}"})
+
+
+def install_gcs():
+    import httpx
+
+    import gcs_upload
+
+    gcs_upload.uploader = gcs_upload.GCSUploader(endpoint="http://fake-gcs", transport=httpx.MockTransport(FakeGCS()))
+
+
+def install_llm(main, fake):
+    """Replaces the ChatGroq at the bottom of main.llm's wrappers, keeping cache/metrics/tracing."""
+    import llm_cache
+    import metrics
+    import tracing
+
+    wrappers = (tracing.TracedChatModel, llm_cache.CachedChatModel, metrics.InstrumentedChatModel)
+    if not isinstance(main.llm, wrappers):
+        main.llm = fake
+        return
+    target = main.llm
+    while isinstance(target.llm, wrappers):
+        target = target.llm
+    target.llm = fake
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+class Benchmark:
+    def __init__(self, main, client, poll_interval: float, timeout: float):
+        self.main = main
+        self.client = client
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.peak_threads = threading.active_count()
+        self.peak_rss_mb = rss_mb()
+
+    async def wait_for(self, thread_id, done):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            r = await self.client.get(f"/chat/{thread_id}")
+            if r.status_code == 200:
+                status = r.json()
+                if done(status):
+                    return status
+            await asyncio.sleep(self.poll_interval)
+        raise TimeoutError(f"session {thread_id} timed out")
+
+    def run_times(self, thread_id):
+        """(plan finished, run finished) as unix times for each of the thread's graph runs."""
+        import tracing
+
+        out = []
+        for run in tracing.tracer.traces(thread_id):
+            plan_end = None
+            for span in run["spans"]:
+                if span["name"] == "plan_agent":
+                    plan_end = run["started_at"] + (span["offset_ms"] + span["duration_ms"]) / 1000
+            out.append((plan_end, run["started_at"] + run["duration_ms"] / 1000))
+        return out
+
+    async def session(self, index: int) -> dict:
+        started = time.time()
+        r = await self.client.post("/chat", json={"message": f"Deploy a GCS bucket named bench-{index} in us-central1"})
+        if r.status_code != 200:
+            return {"ok": False, "error": f"POST /chat returned {r.status_code}"}
+        thread_id = r.json()["thread_id"]
+        try:
+            status = await self.wait_for(thread_id, lambda s: s["waiting_for_approval"] or s["next_action"] == "end")
+            if not status["waiting_for_approval"]:
+                return {"ok": False, "error": "session ended without asking for approval"}
+            runs = self.run_times(thread_id)
+            plan_end, first_run_end = runs[0] if runs else (None, time.time())
+
+            r = await self.client.post(f"/chat/{thread_id}/approve", json={"approved": True})
+            if r.status_code != 200:
+                return {"ok": False, "error": f"approve returned {r.status_code}"}
+            approved = time.time()
+            await self.wait_for(thread_id, lambda s: s["next_action"] == "end")
+        except TimeoutError as e:
+            return {"ok": False, "error": str(e)}
+        finished = time.time()
+        return {
+            "ok": True,
+            "time_to_plan": (plan_end or first_run_end) - started,
+            "time_to_approval": first_run_end - started,
+            "apply_time": finished - approved,
+            "session_time": finished - started,
+        }
+
+    async def sample_resources(self, stop: asyncio.Event):
+        while not stop.is_set():
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb())
+            await asyncio.sleep(0.1)
+
+    async def run(self, sessions: int, concurrency: int) -> list:
+        gate = asyncio.Semaphore(concurrency)
+
+        async def limited(index):
+            async with gate:
+                return await self.session(index)
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self.sample_resources(stop))
+        try:
+            return await asyncio.gather(*(limited(i) for i in range(sessions)))
+        finally:
+            stop.set()
+            await sampler
+
+
+def summarize(results, elapsed, bench, fake, args) -> dict:
+    ok = [r for r in results if r["ok"]]
+    summary = {
+        "sessions": len(results),
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": sorted({r["error"] for r in results if not r["ok"]})[:5],
+        "concurrency": args.concurrency,
+        "graph_workers": bench.main.GRAPH_WORKERS,
+        "llm_latency": args.llm_latency,
+        "cli_latency": args.cli_latency,
+        "llm_cache": args.llm_cache,
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "llm_calls": fake.calls,
+        "peak_threads": bench.peak_threads,
+        "peak_rss_mb": round(bench.peak_rss_mb, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    for metric in ("time_to_plan", "time_to_approval", "apply_time", "session_time"):
+        values = [r[metric] for r in ok]
+        summary[metric] = {f"p{int(p * 100)}": round(percentile(values, p), 4) for p in (0.50, 0.95, 0.99)}
+    return summary
+
+
+def print_summary(summary):
+    print(f"sessions        {summary['completed']}/{summary['sessions']} completed "
+          f"(concurrency {summary['concurrency']}, GRAPH_WORKERS {summary['graph_workers']})")
+    for error in summary["errors"]:
+        print(f"  failed: {error}")
+    print(f"throughput      {summary['sessions_per_second']} sessions/sec over {summary['elapsed_seconds']}s")
+    print(f"{'':16}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for metric in ("time_to_plan", "time_to_approval", "apply_time", "session_time"):
+        row = summary[metric]
+        print(f"{metric:16}{row['p50']:>10.3f}{row['p95']:>10.3f}{row['p99']:>10.3f}")
+    print(f"llm calls       {summary['llm_calls']}")
+    print(f"threads         {summary['peak_threads']} peak")
+    print(f"rss             {summary['peak_rss_mb']} MB peak ({summary['max_rss_mb']} MB max)")
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+    import main
+
+    fake = ScriptedChatModel(args.llm_latency, args.llm_jitter)
+    install_llm(main, fake)
+    install_gcs()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+        bench = Benchmark(main, client, args.poll_interval, args.timeout)
+        if args.warmup:
+            await bench.run(args.warmup, args.concurrency)
+            fake.calls = 0
+        started = time.perf_counter()
+        results = await bench.run(args.sessions, args.concurrency)
+        elapsed = time.perf_counter() - started
+    return summarize(results, elapsed, bench, fake, args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=20, help="measured sessions")
+    parser.add_argument("--concurrency", type=int, default=5, help="sessions in flight at once")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured sessions run first")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="seconds per LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="+/- seconds added to each LLM call")
+    parser.add_argument("--cli-latency", type=float, default=0.0, help="seconds per terraform/infracost/gcloud call")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--poll-interval", type=float, default=0.02, help="seconds between status polls")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before a session counts as failed")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON to PATH")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    install_stubs()
+    os.environ["BENCH_CLI_LATENCY"] = str(args.cli_latency)
+    isolate_environment(args.llm_cache)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    summary = asyncio.run(run_benchmark(args))
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,451 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+"""
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """SQLite-backed checkpointer with eviction and a hot cache.
+
+    - Only the latest `keep_checkpoints` checkpoints per thread are kept.
+    - Threads idle for longer than `ttl_seconds` are deleted, and the least
+      recently used threads are deleted once there are more than `max_threads`.
+    - The latest checkpoint of the `cache_size` most recently used threads is
+      kept in memory, deserialized and with its pending writes, so the common
+      "load latest state" path skips SQLite and deserialization.
+
+    Callers get a copy of the cached checkpoint (as LangGraph copies it before
+    saving), so mutating it doesn't change the cache. Memory scales with
+    active sessions, not with every session ever created. Last access is
+    written at most every `touch_interval` seconds per thread, and sweeps
+    run in a worker thread when called through the async API.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        keep_checkpoints: int = 20,
+        ttl_seconds: float = 24 * 3600,
+        max_threads: int = 10000,
+        cache_size: int = 512,
+        sweep_interval: float = 60,
+        touch_interval: float = 60,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.cache_size = cache_size
+        self.sweep_interval = sweep_interval
+        self.touch_interval = touch_interval
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+
+        # (thread_id, checkpoint_ns) -> latest CheckpointTuple, in LRU order
+        self._cache = OrderedDict()
+        self._touched = {}  # thread_id -> monotonic time last_access was last written
+        self._last_sweep = time.monotonic()
+        self._sweeping = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.evicted_threads = 0
+        self.pruned_checkpoints = 0
+
+    # ----------------------
+    # Cache / eviction
+    # ----------------------
+    def _cache_get(self, key):
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        self._cache.move_to_end(key)
+        return item._replace(
+            checkpoint=copy_checkpoint(item.checkpoint),
+            metadata=dict(item.metadata),
+            pending_writes=list(item.pending_writes),
+        )
+
+    def _cache_put(self, key, item):
+        self._cache[key] = item
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cache_drop_thread(self, thread_id):
+        for key in [k for k in self._cache if k[0] == thread_id]:
+            del self._cache[key]
+
+    def _touch(self, thread_id, force=False):
+        now = time.monotonic()
+        if not force and now - self._touched.get(thread_id, -self.touch_interval) < self.touch_interval:
+            return
+        self._touched[thread_id] = now
+        self.conn.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _prune(self, thread_id, checkpoint_ns):
+        """Deletes all but the newest keep_checkpoints checkpoints of a thread."""
+        stale = self.conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_checkpoints),
+        ).fetchall()
+        if not stale:
+            return
+        ids = [(thread_id, checkpoint_ns, row[0]) for row in stale]
+        self.conn.executemany(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", ids
+        )
+        self.conn.executemany(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", ids
+        )
+        self.pruned_checkpoints += len(ids)
+
+    def _sweep_due(self):
+        return not self._sweeping and time.monotonic() - self._last_sweep >= self.sweep_interval
+
+    def sweep(self):
+        """Evicts threads past their TTL, then least recently used ones over max_threads.
+
+        Threads are deleted one at a time, so reads and writes of other
+        threads can go ahead in between.
+        """
+        with self.lock:
+            started = self._last_sweep = time.monotonic()
+            self._touched = {t: at for t, at in self._touched.items() if started - at < self.touch_interval}
+            expired = []
+            if self.ttl_seconds:
+                expired += [r[0] for r in self.conn.execute(
+                    "SELECT thread_id FROM threads WHERE last_access < ?",
+                    (time.time() - self.ttl_seconds,),
+                )]
+            if self.max_threads:
+                expired += [r[0] for r in self.conn.execute(
+                    "SELECT thread_id FROM threads WHERE last_access >= ? "
+                    "ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                    (time.time() - self.ttl_seconds if self.ttl_seconds else 0, self.max_threads),
+                )]
+        evicted = 0
+        for thread_id in expired:
+            with self.lock:
+                if self._touched.get(thread_id, started) > started:
+                    continue  # used again since it was selected
+                self.delete_thread(thread_id)
+                self.evicted_threads += 1
+                evicted += 1
+        return evicted
+
+    # ----------------------
+    # Row helpers
+    # ----------------------
+    def _select_row(self, thread_id, checkpoint_ns, checkpoint_id=None):
+        query = (
+            "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        if checkpoint_id:
+            return self.conn.execute(
+                query + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)
+            ).fetchone()
+        return self.conn.execute(
+            query + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)
+        ).fetchone()
+
+    def _load_writes(self, thread_id, checkpoint_ns, checkpoint_id):
+        rows = self.conn.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        rows.sort(key=lambda r: writes_sort_key(r[5], r[0], r[1]))
+        return [(r[0], r[2], self.serde.loads_typed((r[3], r[4]))) for r in rows]
+
+    def _to_tuple(self, thread_id, checkpoint_ns, row):
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        return self._make_tuple(
+            thread_id, checkpoint_ns, checkpoint_id, parent_id,
+            self.serde.loads_typed((type_, checkpoint)),
+            self.serde.loads_typed((metadata_type, metadata)),
+            self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    @staticmethod
+    def _make_tuple(thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata, pending_writes):
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint=checkpoint,
+            metadata=metadata,
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": parent_id,
+                }}
+                if parent_id
+                else None
+            ),
+            pending_writes=pending_writes,
+        )
+
+    # ----------------------
+    # BaseCheckpointSaver API
+    # ----------------------
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self.lock:
+            item = self._cache_get((thread_id, checkpoint_ns)) if not checkpoint_id else None
+            if item is not None:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+                row = self._select_row(thread_id, checkpoint_ns, checkpoint_id)
+                if row is None:
+                    return None
+                item = self._to_tuple(thread_id, checkpoint_ns, row)
+                if not checkpoint_id:
+                    self._cache_put((thread_id, checkpoint_ns), item)
+                    item = self._cache_get((thread_id, checkpoint_ns))
+            self._touch(thread_id)
+            return item
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                item = self._to_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+        yield from results
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = self._put(config, checkpoint, metadata)
+        if self._sweep_due():
+            self.sweep()
+        return result
+
+    def _put(self, config, checkpoint, metadata):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        metadata = get_checkpoint_metadata(config, metadata)
+        type_, data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = self.serde.dumps_typed(metadata)
+        row = (checkpoint["id"], parent_id, type_, data, metadata_type, metadata_data)
+
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                    "metadata_type, metadata, thread_id, checkpoint_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    row + (thread_id, checkpoint_ns),
+                )
+                self._prune(thread_id, checkpoint_ns)
+                self._touch(thread_id)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                self._touched.pop(thread_id, None)
+                raise
+            self._cache_put((thread_id, checkpoint_ns), self._make_tuple(
+                thread_id, checkpoint_ns, checkpoint["id"], parent_id,
+                copy_checkpoint(checkpoint), dict(metadata), [],
+            ))
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.serde.dumps_typed(value)
+            rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id,
+                WRITES_IDX_MAP.get(channel, idx), channel, type_, data, task_path,
+            ))
+        # Regular writes are idempotent per (task, idx); special writes
+        # (errors, interrupts) use negative indexes and overwrite.
+        columns = "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)"
+        with self.lock:
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO writes {columns} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for r in rows if r[4] >= 0],
+            )
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO writes {columns} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for r in rows if r[4] < 0],
+            )
+            # The cached tuple's pending writes are stale now; the next read reloads them.
+            cached = self._cache.get((thread_id, checkpoint_ns))
+            if cached is not None and cached.config["configurable"]["checkpoint_id"] == checkpoint_id:
+                del self._cache[(thread_id, checkpoint_ns)]
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+            self._cache_drop_thread(thread_id)
+            self._touched.pop(thread_id, None)
+
+    # SQLite calls are short and local, so the async API runs them inline
+    # the same way MemorySaver does.
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        result = self._put(config, checkpoint, metadata)
+        if self._sweep_due():
+            self._sweeping = True
+            asyncio.get_running_loop().run_in_executor(None, self._background_sweep)
+        return result
+
+    def _background_sweep(self):
+        try:
+            self.sweep()
+        finally:
+            self._sweeping = False
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return self.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def stats(self) -> dict:
+        with self.lock:
+            threads = self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "threads": threads,
+            "cached_threads": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "evicted_threads": self.evicted_threads,
+            "pruned_checkpoints": self.pruned_checkpoints,
+        }
+
+
+def make_checkpointer():
+    """Builds the checkpoint backend selected by CHECKPOINT_BACKEND (sqlite | memory)."""
+    backend = os.getenv("CHECKPOINT_BACKEND", "sqlite").lower()
+    if backend == "memory":
+        return MemorySaver()
+    if backend != "sqlite":
+        raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
+    return SQLiteCheckpointSaver(
+        os.getenv("CHECKPOINT_DB", "/tmp/terraform-bot/checkpoints.db"),
+        keep_checkpoints=int(os.getenv("CHECKPOINT_KEEP", "20")),
+        ttl_seconds=float(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600))),
+        max_threads=int(os.getenv("CHECKPOINT_MAX_THREADS", "10000")),
+        cache_size=int(os.getenv("CHECKPOINT_CACHE_SIZE", "512")),
+    )
@@ -0,0 +1,168 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+# Inputs scoring below this fall back to the LLM.
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER", "1") != "0"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:['.\-][a-z0-9]+)*|\?")
+
+
+class LocalClassifier:
+    """Deterministic keyword classifier that answers the easy cases locally.
+
+    Full-match regex rules are tried first. Otherwise every label is scored
+    from a weighted lexicon of words and phrases, and the confidence is
+    derived from the margin between the best and second-best label, scaled
+    down by the share of the evidence that points elsewhere. Labels in
+    `strict_labels` are only given when every word of the message is in the
+    lexicon or in `fillers`; anything left over (a new instance type, a
+    rename) may change the meaning, so the LLM decides. When the confidence
+    is below the threshold the label is None and the caller asks the LLM
+    instead.
+    """
+
+    def __init__(self, name: str, rules: List[Tuple[str, str]], lexicon: Dict[str, Dict[str, float]],
+                 threshold: float = LOCAL_CLASSIFIER_THRESHOLD, strict_labels=(), fillers=()):
+        self.name = name
+        self.rules = [(re.compile(pattern, re.IGNORECASE), label) for pattern, label in rules]
+        self.lexicon = lexicon
+        self.threshold = threshold
+        self.strict_labels = set(strict_labels)
+        self.fillers = set(fillers)
+        self.words = {term for terms in lexicon.values() for term in terms if " " not in term}
+        self.phrases = {term for terms in lexicon.values() for term in terms if " " in term}
+
+        self.calls = 0
+        self.local_hits = 0
+        self.fallbacks = 0
+        self.confidence_total = 0.0
+        self.label_counts = {label: 0 for label in lexicon}
+
+    def score(self, text: str) -> Tuple[Optional[str], float]:
+        """Returns the best label and its confidence, without the threshold."""
+        text = " ".join(text.lower().split())
+        for pattern, label in self.rules:
+            if pattern.fullmatch(text):
+                return label, 0.99
+
+        tokens = TOKEN_RE.findall(text)
+        padded = f" {' '.join(tokens)} "
+        scores = {}
+        for label, terms in self.lexicon.items():
+            total = 0.0
+            for term, weight in terms.items():
+                if " " in term:
+                    total += weight * padded.count(f" {term} ")
+                else:
+                    total += weight * tokens.count(term)
+            scores[label] = total
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        (best, top), (_, second) = ranked[0], ranked[1]
+        if top <= 0:
+            return None, 0.0
+        if best in self.strict_labels and self.leftover(tokens):
+            return None, 0.0
+        margin = top - second
+        return best, (1 - math.exp(-margin)) * margin / top
+
+    def leftover(self, tokens: List[str]) -> List[str]:
+        """Tokens not covered by a lexicon word or phrase, or a filler."""
+        covered = [token in self.words or token in self.fillers for token in tokens]
+        for phrase in self.phrases:
+            words = phrase.split()
+            for i in range(len(tokens) - len(words) + 1):
+                if tokens[i:i + len(words)] == words:
+                    covered[i:i + len(words)] = [True] * len(words)
+        return [token for token, ok in zip(tokens, covered) if not ok]
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """Returns (label, confidence); label is None when the LLM should decide."""
+        self.calls += 1
+        label, confidence = self.score(text or "") if LOCAL_CLASSIFIER_ENABLED else (None, 0.0)
+        self.confidence_total += confidence
+        if label is None or confidence < self.threshold:
+            self.fallbacks += 1
+            metrics.classifier_decisions.inc(self.name, "llm_fallback")
+            metrics.classifier_confidence.observe(confidence, self.name, "llm_fallback")
+            return None, confidence
+        self.local_hits += 1
+        metrics.classifier_decisions.inc(self.name, "local")
+        metrics.classifier_confidence.observe(confidence, self.name, "local")
+        self.label_counts[label] += 1
+        return label, confidence
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "local_hits": self.local_hits,
+            "llm_fallbacks": self.fallbacks,
+            "hit_rate": round(self.local_hits / self.calls, 4) if self.calls else 0.0,
+            "avg_confidence": round(self.confidence_total / self.calls, 4) if self.calls else 0.0,
+            "labels": dict(self.label_counts),
+        }
+
+
+intent_classifier = LocalClassifier(
+    "intent",
+    rules=[
+        (r"(hi|hello|hey|yo|hiya|good (morning|afternoon|evening))( there)?[!. ]*", "GENERAL"),
+        (r"(thanks|thank you|thx|cheers|bye|goodbye|cool|nice|great)( a lot| so much)?[!. ]*", "GENERAL"),
+    ],
+    lexicon={
+        "DEPLOYMENT": {
+            "deploy": 2, "create": 1.5, "provision": 2, "set up": 1.5, "setup": 1.5, "spin up": 2,
+            "launch": 1.5, "build": 1, "need": 0.5, "want": 0.5, "terraform": 1,
+            "bucket": 1.5, "vm": 1.5, "instance": 1, "server": 1, "cluster": 1.5, "vpc": 1.5,
+            "database": 1, "db": 0.5, "s3": 1.5, "ec2": 1.5, "gke": 1.5, "gcs": 1.5, "eks": 1.5,
+            "subnet": 1, "network": 0.5, "load balancer": 1, "lambda": 1, "cloud run": 1.5,
+        },
+        "CONSULTATION": {
+            "?": 1, "recommend": 2, "recommendation": 2, "advice": 2, "advise": 2,
+            "best practice": 2.5, "best practices": 2.5, "best": 1, "should": 1.5, "which": 1,
+            "what": 0.5, "how": 0.5, "vs": 2, "versus": 2, "compare": 2, "difference": 2,
+            "better": 1.5, "cheapest": 1.5, "pros": 1.5, "cons": 1.5, "explain": 1.5, "why": 1,
+        },
+        "GENERAL": {
+            "hi": 1.5, "hello": 1.5, "hey": 1.5, "thanks": 2, "thank": 2, "bye": 2,
+        },
+    },
+)
+
+approval_classifier = LocalClassifier(
+    "approval",
+    rules=[
+        (r"(yes|yeah|yep|yup|y|sure|ok|okay|approve[d]?|apply( it)?|go( ahead)?|proceed|lgtm|"
+         r"looks good( to me)?|ship it|do it|confirm(ed)?|let'?s go|deploy( it)?)"
+         r"([,!. ]+(please|thanks|thank you))?[!. ]*", "APPROVE"),
+        (r"(no|nope|n|wait|stop|cancel|not yet|hold on|don'?t)[!. ]*", "REVISE"),
+    ],
+    lexicon={
+        "APPROVE": {
+            "yes": 2, "yeah": 2, "yep": 2, "sure": 1.5, "go ahead": 2, "apply": 2, "approve": 2.5,
+            "approved": 2.5, "proceed": 2, "looks good": 2, "lgtm": 2.5, "ok": 1, "okay": 1,
+            "fine": 1, "perfect": 1.5, "great": 1, "deploy": 1,
+        },
+        "REVISE": {
+            "no": 2.5, "not": 2, "don't": 2.5, "dont": 2.5, "wait": 2, "change": 2.5, "fix": 2.5,
+            "instead": 2, "but": 1.5, "modify": 2, "add": 1.5, "remove": 2, "use": 1, "?": 2,
+            "why": 1.5, "stop": 2.5, "cancel": 2.5, "update": 1.5, "larger": 1, "smaller": 1,
+        },
+    },
+    # Applying runs the plan as it stands, so "yes, but ..." or "go ahead with X" must reach the LLM.
+    strict_labels=["APPROVE"],
+    fillers=["it", "and", "please", "thanks", "thank", "you", "the", "this", "that", "me", "to", "all",
+             "now", "just", "so", "let's", "lets", "let", "go", "do", "ship", "sounds", "looks", "good"],
+)
+
+
+def stats() -> dict:
+    return {
+        "intent": intent_classifier.stats(),
+        "approval": approval_classifier.stats(),
+    }
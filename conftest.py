@@ -0,0 +1,2 @@
+# test_download.py is a manual script against a running server (python test_download.py <thread_id>).
+collect_ignore = ["test_download.py"]
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+
+
+class EventBus:
+    """Fans out graph events to the SSE subscribers of each thread.
+
+    Every subscriber gets its own bounded queue. A slow client drops its
+    oldest events rather than holding up the graph run; it can resync from
+    the snapshot it receives on reconnect.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers = {}  # thread_id -> set of asyncio.Queue
+
+    def subscribe(self, thread_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.setdefault(thread_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, thread_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(thread_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[thread_id]
+
+    def has_subscribers(self, thread_id: str) -> bool:
+        return thread_id in self._subscribers
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, thread_id: str, event: str, data: dict):
+        for queue in self._subscribers.get(thread_id, ()):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait((event, data))
+
+
+class LogBuffer:
+    """Bounded per-thread ring buffer of command output lines.
+
+    Every line gets an offset that keeps counting up for the life of the
+    thread, so a client that reconnects with the offset after the last line
+    it saw gets only what it missed. Only the newest `max_lines` lines per
+    thread are kept, and the least recently written threads are dropped
+    beyond `max_threads`.
+    """
+
+    def __init__(self, max_lines: int = 5000, max_threads: int = 1000, max_line_chars: int = 4096):
+        self.max_lines = max_lines
+        self.max_threads = max_threads
+        self.max_line_chars = max_line_chars
+        self._threads = OrderedDict()  # thread_id -> {"next": offset, "lines": deque, "changed": asyncio.Event}
+
+    def _buffer(self, thread_id: str) -> dict:
+        buffer = self._threads.pop(thread_id, None)
+        if buffer is None:
+            buffer = {"next": 0, "lines": deque(maxlen=self.max_lines), "changed": asyncio.Event()}
+        self._threads[thread_id] = buffer
+        while len(self._threads) > self.max_threads:
+            _, evicted = self._threads.popitem(last=False)
+            evicted["changed"].set()
+        return buffer
+
+    def append(self, thread_id: str, command: str, stream: str, line: str):
+        buffer = self._buffer(thread_id)
+        buffer["lines"].append({
+            "offset": buffer["next"],
+            "ts": round(time.time(), 3),
+            "command": command,
+            "stream": stream,
+            "line": line[:self.max_line_chars],
+        })
+        buffer["next"] += 1
+        changed, buffer["changed"] = buffer["changed"], asyncio.Event()
+        changed.set()
+
+    def has(self, thread_id: str) -> bool:
+        return thread_id in self._threads
+
+    def read(self, thread_id: str, offset: int = 0):
+        """Returns (lines at or after offset, next offset, lines dropped before the first one).
+
+        An offset past the end (e.g. from before a restart) starts at the end.
+        """
+        buffer = self._threads.get(thread_id)
+        if buffer is None:
+            return [], 0, 0
+        lines = buffer["lines"]
+        oldest = lines[0]["offset"] if lines else buffer["next"]
+        start = min(max(offset, oldest), buffer["next"])
+        return list(lines)[start - oldest:], buffer["next"], max(0, oldest - offset)
+
+    async def wait(self, thread_id: str, offset: int, timeout: float) -> bool:
+        """Waits up to timeout seconds for a line at or after offset; True if there is one."""
+        buffer = self._threads.get(thread_id)
+        if buffer is not None and buffer["next"] > offset:
+            return True
+        changed = (buffer or self._buffer(thread_id))["changed"]
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self._threads.get(thread_id, {"next": 0})["next"] > offset
+
+    def stats(self) -> dict:
+        return {
+            "threads": len(self._threads),
+            "lines": sum(len(b["lines"]) for b in self._threads.values()),
+        }
+
+
+class StateVersions:
+    """Latest checkpoint version of each thread, with what the recent ones contained.
+
+    A version is the checkpoint step, which only ever grows for a thread.
+    For each of the last `max_versions` versions the message count and file
+    hashes are kept, so a client that saw version v can be sent only what
+    changed since. Least recently recorded threads are dropped beyond
+    `max_threads`; a dropped or unknown version means the client gets the
+    full state again.
+    """
+
+    def __init__(self, max_versions: int = 50, max_threads: int = 1000):
+        self.max_versions = max_versions
+        self.max_threads = max_threads
+        self._threads = OrderedDict()  # thread_id -> {"latest": version, "versions": OrderedDict, "changed": asyncio.Event}
+
+    def record(self, thread_id: str, version: int, message_count: int, hashes: dict):
+        thread = self._threads.pop(thread_id, None)
+        if thread is None:
+            thread = {"latest": -1, "versions": OrderedDict(), "changed": asyncio.Event()}
+        self._threads[thread_id] = thread
+        while len(self._threads) > self.max_threads:
+            _, evicted = self._threads.popitem(last=False)
+            evicted["changed"].set()
+
+        versions = thread["versions"]
+        if version not in versions:
+            versions[version] = (message_count, hashes)
+            while len(versions) > self.max_versions:
+                versions.popitem(last=False)
+        if version > thread["latest"]:
+            thread["latest"] = version
+            changed, thread["changed"] = thread["changed"], asyncio.Event()
+            changed.set()
+
+    def latest(self, thread_id: str):
+        """The newest recorded version of the thread, None if it is not tracked."""
+        thread = self._threads.get(thread_id)
+        return thread["latest"] if thread else None
+
+    def get(self, thread_id: str, version: int):
+        """(message count, file hashes) at version, None if it is no longer known."""
+        thread = self._threads.get(thread_id)
+        return thread["versions"].get(version) if thread else None
+
+    async def wait(self, thread_id: str, version: int, timeout: float) -> bool:
+        """Waits up to timeout seconds for a version newer than version; True if there is one."""
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            return False
+        if thread["latest"] > version:
+            return True
+        try:
+            await asyncio.wait_for(thread["changed"].wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self._threads.get(thread_id, {"latest": -1})["latest"] > version
+
+    def stats(self) -> dict:
+        return {"threads": len(self._threads)}
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encodes one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
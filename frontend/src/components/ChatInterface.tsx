@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useRef, useMemo } from 'react';
 import axios from 'axios';
 import { Bot, User, Sparkles, ArrowRight } from 'lucide-react';
 import ReactMarkdown from 'react-markdown';
@@ -16,7 +16,7 @@ interface Message {
 
 interface ChatState {
     messages: string[];
-    terraform_config: string;
+    terraform_config: Record<string, string>;
     validate_result: string;
     approve_result: string;
     next_action: string;
@@ -28,6 +28,24 @@ interface ChatState {
     waiting_for_security_review: boolean;
 }
 
+const isInternalJSON = (content: string) => {
+    const trimmed = content.trim();
+    // Check if it's a JSON object (possibly multi-line)
+    if (trimmed.startsWith('{') && trimmed.endsWith('}')) {
+        try {
+            JSON.parse(trimmed);
+            return true;
+        } catch (e) {
+            return false;
+        }
+    }
+    // Check if it's a markdown code block containing JSON
+    if (trimmed.startsWith('```') && trimmed.endsWith('```') && trimmed.includes('{') && trimmed.includes('}')) {
+        return true;
+    }
+    return false;
+};
+
 interface ChatInterfaceProps {
     user: any;
 }
@@ -35,11 +53,17 @@ interface ChatInterfaceProps {
 export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
     const [input, setInput] = useState('');
     const [threadId, setThreadId] = useState<string | null>(null);
-    const [messages, setMessages] = useState<Message[]>([]);
+    // Raw thread messages, including internal extraction replies; filtered for display below.
+    const [threadMessages, setThreadMessages] = useState<Message[]>([]);
     const [loading, setLoading] = useState(false);
     const [chatState, setChatState] = useState<ChatState | null>(null);
     const messagesEndRef = useRef<HTMLDivElement>(null);
 
+    const messages = useMemo(
+        () => threadMessages.filter(m => !isInternalJSON(m.content)),
+        [threadMessages]
+    );
+
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     };
@@ -48,56 +72,39 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
         scrollToBottom();
     }, [messages, chatState]);
 
+    // Live updates over Server-Sent Events instead of polling GET /chat/{id}
     useEffect(() => {
-        let interval: number;
-        if (threadId && (loading || chatState?.waiting_for_approval || chatState?.waiting_for_missing_info || chatState?.waiting_for_security_review)) {
-            interval = setInterval(checkStatus, 2000);
-        }
-        return () => clearInterval(interval);
-    }, [threadId, loading, chatState?.waiting_for_approval, chatState?.waiting_for_missing_info, chatState?.waiting_for_security_review]);
-
-    const checkStatus = async () => {
         if (!threadId) return;
-        try {
-            const res = await axios.get(`${API_URL}/chat/${threadId}`);
-            const data = res.data;
-
-            const isInternalJSON = (content: string) => {
-                const trimmed = content.trim();
-                // Check if it's a JSON object (possibly multi-line)
-                if (trimmed.startsWith('{') && trimmed.endsWith('}')) {
-                    try {
-                        JSON.parse(trimmed);
-                        return true;
-                    } catch (e) {
-                        return false;
-                    }
-                }
-                // Check if it's a markdown code block containing JSON
-                if (trimmed.startsWith('```') && trimmed.endsWith('```') && trimmed.includes('{') && trimmed.includes('}')) {
-                    return true;
-                }
-                return false;
-            };
-
-            const msgs: Message[] = data.messages
-                .filter((m: any) => !isInternalJSON(m.content))
-                .map((m: any) => ({
-                    role: m.role,
-                    content: m.content
-                }));
-            setMessages(msgs);
-            setChatState(data);
+        const source = new EventSource(`${API_URL}/chat/${threadId}/events`);
+        const on = (event: string, handler: (data: any) => void) =>
+            source.addEventListener(event, (e) => handler(JSON.parse((e as MessageEvent).data)));
 
+        const applyStatus = (data: any, finished: boolean) => {
+            setChatState(prev => ({ ...(prev ?? {}), ...data } as ChatState));
             if (data.waiting_for_approval || data.waiting_for_missing_info || data.waiting_for_security_review) {
                 setLoading(false);
-            } else if (data.next_action === 'end') {
+            } else if (finished && data.next_action === 'end') {
                 setLoading(false);
             }
-        } catch (err) {
-            console.error("Error polling status:", err);
-        }
-    };
+        };
+
+        on('snapshot', (data) => {
+            setThreadMessages(data.messages);
+            applyStatus(data, !data.running);
+        });
+        on('messages', (data) => {
+            // Splice at the server's offset; this also replaces the optimistic user message.
+            setThreadMessages(prev => [...prev.slice(0, data.offset), ...data.messages]);
+        });
+        on('config', (data) => {
+            setChatState(prev => ({ ...(prev ?? {}), terraform_config: data.terraform_config } as ChatState));
+        });
+        on('status', (data) => applyStatus(data, false));
+        on('run_finished', (data) => applyStatus(data, true));
+        on('run_error', () => setLoading(false));
+
+        return () => source.close();
+    }, [threadId]);
 
     const handleSend = async () => {
         if (!input.trim()) return;
@@ -106,7 +113,7 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
         const userMsg = input;
         setInput('');
 
-        setMessages(prev => [...prev, { role: 'user', content: userMsg }]);
+        setThreadMessages(prev => [...prev, { role: 'user', content: userMsg }]);
 
         try {
             if (!threadId) {
@@ -114,11 +121,9 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
                 setThreadId(res.data.thread_id);
             } else if (chatState?.waiting_for_missing_info) {
                 await axios.post(`${API_URL}/chat/${threadId}/missing_info`, { answer: userMsg });
-                await checkStatus();
             } else {
                 // Interactive chat / Revision
                 await axios.post(`${API_URL}/chat/${threadId}/message`, { message: userMsg });
-                await checkStatus();
             }
         } catch (err) {
             console.error("Error sending message:", err);
@@ -131,7 +136,6 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
         setLoading(true);
         try {
             await axios.post(`${API_URL}/chat/${threadId}/approve`, { approved: true });
-            await checkStatus();
         } catch (err) {
             console.error("Error approving:", err);
             setLoading(false);
@@ -154,7 +158,6 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
         setLoading(true);
         try {
             await axios.post(`${API_URL}/chat/${threadId}/security`, { action });
-            await checkStatus();
         } catch (err) {
             console.error("Error sending security decision:", err);
             setLoading(false);
@@ -236,7 +239,7 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ user }) => {
                         className="ml-14"
                     >
                         <CodePreview
-                            files={chatState.terraform_config as unknown as Record<string, string>}
+                            files={chatState.terraform_config}
                             threadId={threadId}
                         />
                     </motion.div>
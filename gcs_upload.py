@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import time
+from urllib.parse import quote
+
+import httpx
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Set to e.g. http://localhost:4443 to upload to a local fake-gcs-server (no credentials needed).
+STORAGE_EMULATOR_HOST = os.getenv("STORAGE_EMULATOR_HOST", "")
+GCS_UPLOAD_CONCURRENCY = int(os.getenv("GCS_UPLOAD_CONCURRENCY", "8"))
+# Files above this are sent in chunks through a resumable upload session (multiple of 256 KiB).
+GCS_CHUNK_SIZE = int(os.getenv("GCS_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Matched against every path component: the .terraform dir (providers, init fingerprint) and plan binaries.
+# .terraform.lock.hcl is kept, so a restored archive installs the same provider versions.
+GCS_UPLOAD_EXCLUDE = [p.strip() for p in os.getenv("GCS_UPLOAD_EXCLUDE", ".terraform,tfplan,*.tfplan").split(",") if p.strip()]
+GCS_BUCKET_LOCATION = os.getenv("GCS_BUCKET_LOCATION", "us-central1")
+
+METADATA_TOKEN_URL = "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token"
+
+
+class GCSError(Exception):
+    pass
+
+
+def md5_base64(path: str) -> str:
+    """MD5 of a file as GCS reports it (md5Hash)."""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return base64.b64encode(digest.digest()).decode()
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def collect_files(root: str, exclude=GCS_UPLOAD_EXCLUDE):
+    """Relative paths of the files under root, minus excluded files and directories."""
+    def excluded(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in exclude)
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not excluded(d))
+        for name in sorted(filenames):
+            if not excluded(name):
+                files.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return files
+
+
+class AccessToken:
+    """OAuth token for the GCS API, refreshed shortly before it expires.
+
+    Comes from the metadata server (Cloud Run, GCE); off GCP, falls back to
+    `gcloud auth print-access-token` once per token lifetime.
+    """
+
+    def __init__(self):
+        self.token = None
+        self.expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, client: httpx.AsyncClient) -> str:
+        async with self._lock:
+            if self.token is None or time.time() > self.expires_at - 300:
+                self.token, lifetime = await self._fetch(client)
+                self.expires_at = time.time() + lifetime
+            return self.token
+
+    @staticmethod
+    async def _fetch(client):
+        try:
+            r = await client.get(METADATA_TOKEN_URL, headers={"Metadata-Flavor": "Google"}, timeout=2)
+            r.raise_for_status()
+            data = r.json()
+            return data["access_token"], data.get("expires_in", 3600)
+        except (httpx.HTTPError, KeyError, ValueError):
+            import terraform_utils as tf_utils  # not on GCP: ask the local gcloud login
+
+            token = await tf_utils.run_command_async(["gcloud", "auth", "print-access-token"], os.getcwd())
+            return token.strip(), 3000
+
+
+class GCSUploader:
+    """Uploads directories to GCS through the JSON API, in process.
+
+    Uses one pooled HTTP client, remembers which buckets exist for the life
+    of the process, uploads up to `concurrency` files at once (large files
+    in resumable chunks) and skips files whose MD5 matches the object
+    already stored under the same name.
+    """
+
+    def __init__(self, endpoint: str = None, concurrency: int = GCS_UPLOAD_CONCURRENCY,
+                 chunk_size: int = GCS_CHUNK_SIZE, transport: httpx.AsyncBaseTransport = None):
+        self.endpoint = (endpoint or STORAGE_EMULATOR_HOST or "https://storage.googleapis.com").rstrip("/")
+        if "://" not in self.endpoint:
+            self.endpoint = f"http://{self.endpoint}"
+        self.emulated = bool(endpoint or STORAGE_EMULATOR_HOST)
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.transport = transport  # e.g. httpx.MockTransport in tests
+        self.known_buckets = set()
+        self.token = AccessToken()
+        self._client = None
+        self._client_loop = None
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60, connect=10),
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+                transport=self.transport,
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def _request(self, method, url, **kwargs):
+        client = self.client()
+        headers = kwargs.pop("headers", {})
+        if not self.emulated:
+            headers["Authorization"] = f"Bearer {await self.token.get(client)}"
+        return await client.request(method, url, headers=headers, **kwargs)
+
+    async def ensure_bucket(self, bucket: str, project_id: str):
+        if bucket in self.known_buckets:
+            return
+        r = await self._request("GET", f"{self.endpoint}/storage/v1/b/{quote(bucket, safe='')}")
+        if r.status_code == 404:
+            logger.info(f"Bucket {bucket} not found. Creating...")
+            r = await self._request("POST", f"{self.endpoint}/storage/v1/b", params={"project": project_id},
+                                    json={"name": bucket, "location": GCS_BUCKET_LOCATION})
+            ok = r.status_code < 400 or r.status_code == 409  # 409: created concurrently
+        else:
+            ok = r.status_code < 400
+        if not ok:
+            raise GCSError(f"Bucket {bucket}: HTTP {r.status_code} {r.text[:300]}")
+        self.known_buckets.add(bucket)
+
+    async def existing_hashes(self, bucket: str, prefix: str) -> dict:
+        """{object name: md5Hash} of the objects under prefix."""
+        hashes, params = {}, {"prefix": prefix, "fields": "items(name,md5Hash),nextPageToken"}
+        while True:
+            r = await self._request("GET", f"{self.endpoint}/storage/v1/b/{quote(bucket, safe='')}/o", params=params)
+            if r.status_code >= 400:
+                raise GCSError(f"Listing gs://{bucket}/{prefix}: HTTP {r.status_code} {r.text[:300]}")
+            data = r.json()
+            hashes.update({item["name"]: item.get("md5Hash") for item in data.get("items", [])})
+            if not data.get("nextPageToken"):
+                return hashes
+            params["pageToken"] = data["nextPageToken"]
+
+    async def upload_file(self, bucket: str, name: str, path: str, size: int):
+        url = f"{self.endpoint}/upload/storage/v1/b/{quote(bucket, safe='')}/o"
+        if size <= self.chunk_size:
+            data = await asyncio.to_thread(read_file, path)
+            r = await self._request("POST", url, params={"uploadType": "media", "name": name}, content=data,
+                                    headers={"Content-Type": "application/octet-stream"})
+            if r.status_code >= 400:
+                raise GCSError(f"Upload of {name}: HTTP {r.status_code} {r.text[:300]}")
+            return
+
+        r = await self._request("POST", url, params={"uploadType": "resumable", "name": name},
+                                content=json.dumps({"name": name}),
+                                headers={"Content-Type": "application/json", "X-Upload-Content-Length": str(size)})
+        session = r.headers.get("location")
+        if r.status_code >= 400 or not session:
+            raise GCSError(f"Upload session for {name}: HTTP {r.status_code} {r.text[:300]}")
+        with open(path, "rb") as f:
+            offset = 0
+            while offset < size:
+                chunk = await asyncio.to_thread(f.read, self.chunk_size)
+                end = offset + len(chunk) - 1
+                r = await self._request("PUT", session, content=chunk,
+                                        headers={"Content-Range": f"bytes {offset}-{end}/{size}"})
+                if r.status_code not in (200, 201, 308):
+                    raise GCSError(f"Upload of {name} at byte {offset}: HTTP {r.status_code} {r.text[:300]}")
+                offset = end + 1
+
+    async def upload_directory(self, root: str, bucket: str, prefix: str, project_id: str) -> dict:
+        """Uploads root to gs://bucket/prefix; returns counts of uploaded and unchanged files and uploaded bytes."""
+        started = time.perf_counter()
+        files = collect_files(root)
+        with tracing.tracer.span("gcs upload", "http", bucket=bucket, files=len(files)) as span:
+            await self.ensure_bucket(bucket, project_id)
+            stored = await self.existing_hashes(bucket, prefix)
+            gate = asyncio.Semaphore(self.concurrency)
+            counts = {"uploaded": 0, "unchanged": 0, "bytes": 0}
+
+            async def upload(relative):
+                path = os.path.join(root, relative)
+                name = prefix + relative.replace(os.sep, "/")
+                async with gate:
+                    if stored.get(name) and stored[name] == await asyncio.to_thread(md5_base64, path):
+                        counts["unchanged"] += 1
+                        return
+                    size = os.path.getsize(path)
+                    await self.upload_file(bucket, name, path, size)
+                    counts["uploaded"] += 1
+                    counts["bytes"] += size
+
+            await asyncio.gather(*(upload(relative) for relative in files))
+            span["attributes"].update(counts)
+        metrics.record_upload(time.perf_counter() - started, counts)
+        return counts
+
+
+uploader = GCSUploader()
@@ -0,0 +1,226 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+HEREDOC_RE = re.compile(r"<<-?\s*([A-Za-z_][A-Za-z0-9_]*)[ \t]*\n")
+BLOCK_HEADER_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_-]*)((?:\s+"[^"\n]*"|\s+[A-Za-z_][A-Za-z0-9_-]*)*)\s*\{')
+
+# Top-level block types of a .tf file and how many labels each takes.
+TOP_LEVEL_BLOCKS = {
+    "terraform": 0, "locals": 0, "moved": 0, "import": 0, "removed": 0,
+    "provider": 1, "variable": 1, "output": 1, "module": 1, "check": 1,
+    "resource": 2, "data": 2, "ephemeral": 2,
+}
+BRACKETS = {"{": "}", "[": "]", "(": ")"}
+
+
+class Block(NamedTuple):
+    kind: str          # resource, data, module, ingress, ...
+    labels: List[str]  # e.g. ["aws_s3_bucket", "logs"]
+    body: str          # text between the braces
+    line: int          # 1-based line of the block header
+    start: int         # offset of the header in the parsed text
+
+
+def skip_token(content: str, i: int) -> int:
+    """If a string, heredoc or comment starts at i, returns the offset after it, else i."""
+    ch = content[i]
+    if ch == '"':
+        i += 1
+        while i < len(content) and content[i] != '"':
+            if content[i] == "\\":
+                i += 1
+            elif content.startswith("${", i):
+                i = find_closing(content, i + 1, "{", "}")
+                continue
+            i += 1
+        return i + 1
+    if ch == "#" or content.startswith("//", i):
+        end = content.find("\n", i)
+        return len(content) if end == -1 else end
+    if content.startswith("/*", i):
+        end = content.find("*/", i + 2)
+        return len(content) if end == -1 else end + 2
+    if content.startswith("<<", i):
+        match = HEREDOC_RE.match(content, i)
+        if match:
+            end = re.compile(rf"^[ \t]*{match.group(1)}[ \t]*$", re.MULTILINE).search(content, match.end())
+            return len(content) if end is None else end.end()
+    return i
+
+
+def find_closing(content: str, open_index: int, opener: str = "{", closer: str = "}") -> int:
+    """Returns the offset just past the bracket matching content[open_index].
+
+    Returns len(content) + 1 when the bracket is never closed.
+    """
+    depth, i = 0, open_index
+    while i < len(content):
+        skipped = skip_token(content, i)
+        if skipped != i:
+            i = skipped
+            continue
+        ch = content[i]
+        if ch == opener:
+            depth += 1
+        elif ch == closer:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(content) + 1
+
+
+def blocks(content: str, base_line: int = 1) -> List[Block]:
+    """Parses the blocks at the top level of content (a file or a block body)."""
+    found = []
+    i = 0
+    while i < len(content):
+        skipped = skip_token(content, i)
+        if skipped != i:
+            i = skipped
+            continue
+        if content[i] in "{[(":
+            # attribute values (objects, lists, calls) are not blocks
+            i = find_closing(content, i, content[i], {"{": "}", "[": "]", "(": ")"}[content[i]])
+            continue
+        line_start = content.rfind("\n", 0, i) + 1
+        if i == line_start or content[line_start:i].strip() == "":
+            match = BLOCK_HEADER_RE.match(content, i)
+            if match:
+                end = find_closing(content, match.end() - 1)
+                labels = [label.strip('"') for label in match.group(2).split()]
+                found.append(Block(
+                    kind=match.group(1),
+                    labels=labels,
+                    body=content[match.end():end - 1],
+                    line=base_line + content.count("\n", 0, i),
+                    start=i,
+                ))
+                i = end
+                continue
+            # skip the rest of an attribute line; its value may open brackets
+            eq = re.match(r"[A-Za-z_][A-Za-z0-9_-]*\s*=\s*", content[i:])
+            if eq:
+                i += eq.end()
+                continue
+        i += 1
+    return found
+
+
+def nested_blocks(block: Block, kind: str) -> List[Block]:
+    """Direct child blocks of a given kind, with line numbers relative to the file."""
+    return [b for b in blocks(block.body, block.line) if b.kind == kind]
+
+
+def block_bodies(content: str, header_pattern: str) -> List[str]:
+    """Bodies of all `<header> { ... }` blocks matching header_pattern, at any depth."""
+    bodies = []
+    for match in re.finditer(header_pattern + r"\s*\{", content):
+        end = find_closing(content, match.end() - 1)
+        bodies.append(content[match.end():end - 1])
+    return bodies
+
+
+def attribute(block: Block, name: str) -> Optional[str]:
+    """Raw value of a top-level attribute of a block, or None if it isn't set."""
+    body = block.body
+    # Blank out nested blocks so only the block's own attributes can match.
+    for child in reversed(blocks(body)):
+        end = find_closing(body, body.index("{", child.start))
+        body = body[:child.start] + " " * (end - child.start) + body[end:]
+
+    match = re.search(rf"^[ \t]*{re.escape(name)}[ \t]*=[ \t]*", body, re.MULTILINE)
+    if not match:
+        return None
+    start = match.end()
+    if start < len(body) and body[start] in "[{":
+        return body[start:find_closing(body, start, body[start], "]" if body[start] == "[" else "}")]
+    end = body.find("\n", start)
+    return body[start:end if end != -1 else len(body)].strip()
+
+
+def string_values(raw: Optional[str]) -> List[str]:
+    """The quoted string literals in a raw attribute value."""
+    return re.findall(r'"((?:[^"\\]|\\.)*)"', raw or "")
+
+
+def is_true(raw: Optional[str]) -> bool:
+    return (raw or "").strip().strip('"').lower() == "true"
+
+
+def is_false(raw: Optional[str]) -> bool:
+    return (raw or "").strip().strip('"').lower() == "false"
+
+
+def syntax_errors(content: str, top_level: bool = True) -> List[Tuple[int, str]]:
+    """Structural errors in an HCL file as (line, message) pairs.
+
+    Catches what generated files usually get wrong: unbalanced brackets,
+    unterminated strings, heredocs and comments, stray text such as
+    markdown fences, and unknown or mislabelled top-level blocks (only
+    when top_level is set, i.e. for .tf files). Semantic checks are left
+    to `terraform validate`.
+    """
+    def line_of(index):
+        return content.count("\n", 0, index) + 1
+
+    errors = []
+    stack = []  # (bracket, offset)
+    i = 0
+    while i < len(content):
+        ch = content[i]
+        if ch == '"' or ch == "#" or content.startswith(("//", "/*", "<<"), i):
+            end = skip_token(content, i)
+            if ch == '"' and end > len(content):
+                errors.append((line_of(i), "Unterminated string"))
+                return errors
+            if content.startswith("/*", i) and content.find("*/", i + 2) == -1:
+                errors.append((line_of(i), "Unterminated comment"))
+                return errors
+            heredoc = HEREDOC_RE.match(content, i) if content.startswith("<<", i) else None
+            if heredoc and not re.compile(rf"^[ \t]*{heredoc.group(1)}[ \t]*$", re.MULTILINE).search(content, heredoc.end()):
+                errors.append((line_of(i), f"Heredoc is missing its closing {heredoc.group(1)} marker"))
+                return errors
+            if end != i:
+                i = end
+                continue
+        if ch in BRACKETS:
+            stack.append((ch, i))
+        elif ch in BRACKETS.values():
+            if not stack or BRACKETS[stack[-1][0]] != ch:
+                errors.append((line_of(i), f"Unexpected '{ch}'"))
+                return errors
+            stack.pop()
+        i += 1
+    if stack:
+        errors.append((line_of(stack[-1][1]), f"Unclosed '{stack[-1][0]}'"))
+        return errors
+
+    if not top_level:
+        return errors
+    i = 0
+    while i < len(content):
+        skipped = skip_token(content, i)
+        if skipped != i:
+            i = skipped
+            continue
+        if content[i].isspace():
+            i += 1
+            continue
+        match = BLOCK_HEADER_RE.match(content, i)
+        if not match:
+            text = content[i:].split("\n", 1)[0].strip()
+            errors.append((line_of(i), f"Unexpected text outside of a block: {text[:60]!r}"))
+            return errors
+        kind, labels = match.group(1), match.group(2).split()
+        if kind not in TOP_LEVEL_BLOCKS:
+            errors.append((line_of(i), f"Unsupported block type {kind!r}"))
+        elif len(labels) != TOP_LEVEL_BLOCKS[kind]:
+            errors.append((line_of(i), f"{kind!r} block takes {TOP_LEVEL_BLOCKS[kind]} label(s), got {len(labels)}"))
+        i = find_closing(content, match.end() - 1)
+    return errors
+
+
+def outline(content: str) -> List[str]:
+    """Headers of the top-level blocks, e.g. 'resource "aws_s3_bucket" "logs"'."""
+    return [" ".join([b.kind] + [f'"{label}"' for label in b.labels]) for b in blocks(content)]
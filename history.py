@@ -0,0 +1,130 @@
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+# understand_request's JSON replies are tagged with this name; they are
+# bookkeeping for the graph and never sent back to the LLM.
+EXTRACTION_MESSAGE_NAME = "extraction"
+
+# Prompt budget (estimated tokens) for the conversation part of each node's prompt.
+HISTORY_BUDGETS = {
+    "understand_request": int(os.getenv("HISTORY_BUDGET_UNDERSTAND", "1500")),
+    "consultant": int(os.getenv("HISTORY_BUDGET_CONSULTANT", "3000")),
+}
+DEFAULT_BUDGET = 2000
+SUMMARY_SHARE = 0.25  # part of the budget reserved for the rolling summary
+OMITTED_RE = re.compile(r"- \.\.\. \((\d+) earlier turns omitted\)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); no tokenizer needed."""
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    return estimate_tokens(content) + 4  # role/formatting overhead
+
+
+def is_internal(message: BaseMessage) -> bool:
+    """True for extraction replies, including untagged ones from older sessions."""
+    if getattr(message, "name", None) == EXTRACTION_MESSAGE_NAME:
+        return True
+    if isinstance(message, AIMessage) and isinstance(message.content, str):
+        text = message.content.strip()
+        if text.startswith("{") and text.endswith("}"):
+            try:
+                return isinstance(json.loads(text), dict)
+            except ValueError:
+                return False
+    return False
+
+
+def summary_line(message: BaseMessage) -> str:
+    role, limit = ("User", 200) if isinstance(message, HumanMessage) else ("Assistant", 120)
+    text = " ".join(str(message.content).split())
+    return f"- {role}: {text[:limit]}{'...' if len(text) > limit else ''}"
+
+
+class HistoryManager:
+    """Fits a conversation into a per-node token budget.
+
+    Internal extraction messages are dropped, the newest turns are kept
+    verbatim, and everything older is folded into a compact rolling summary.
+    The summary is cached in state per node ({"text", "covered"}) and only
+    extended with the turns that fell out of the window since the last call,
+    so the work per turn stays constant as the conversation grows.
+    """
+
+    def __init__(self, budgets: Dict[str, int] = None):
+        self.budgets = budgets if budgets is not None else HISTORY_BUDGETS
+        self.counters = {}  # node -> calls / tokens_full / tokens_sent
+
+    def build(self, node: str, messages: List[BaseMessage], summaries: Dict[str, dict]
+              ) -> Tuple[str, List[BaseMessage], Dict[str, dict]]:
+        """Returns (summary text, recent messages, updated summaries for state)."""
+        budget = self.budgets.get(node, DEFAULT_BUDGET)
+        summary_budget = int(budget * SUMMARY_SHARE)
+        visible = [m for m in messages if not is_internal(m)]
+
+        # Keep the newest messages that fit, always at least the last one
+        kept, used = 0, 0
+        for message in reversed(visible):
+            cost = message_tokens(message)
+            if kept and used + cost > budget - summary_budget:
+                break
+            kept += 1
+            used += cost
+        cut = len(visible) - kept
+
+        cached = (summaries or {}).get(node) or {"text": "", "covered": 0}
+        if cut < cached["covered"]:
+            cached = {"text": "", "covered": 0}  # window grew back (e.g. budget changed): rebuild
+        lines = cached["text"].splitlines() if cached["text"] else []
+        lines += [summary_line(m) for m in visible[cached["covered"]:cut]]
+        summary = "\n".join(self._fit(lines, summary_budget))
+
+        sent = estimate_tokens(summary) + used if summary else used
+        full = sum(message_tokens(m) for m in messages)
+        counts = self.counters.setdefault(node, {"calls": 0, "tokens_full": 0, "tokens_sent": 0})
+        counts["calls"] += 1
+        counts["tokens_full"] += full
+        counts["tokens_sent"] += sent
+
+        updated = {**(summaries or {}), node: {"text": summary, "covered": cut}}
+        return summary, visible[cut:], updated
+
+    @staticmethod
+    def _fit(lines: List[str], budget: int) -> List[str]:
+        """Keeps the first line (the original request) and as many recent lines as fit."""
+        if sum(estimate_tokens(line) for line in lines) <= budget or len(lines) <= 2:
+            return lines
+        # an earlier elision marker is folded into the new one
+        omitted, body = 0, []
+        for line in lines[1:]:
+            marker = OMITTED_RE.match(line)
+            if marker:
+                omitted += int(marker.group(1))
+            else:
+                body.append(line)
+        total = estimate_tokens(lines[0]) + 10
+        tail = []
+        for line in reversed(body):
+            total += estimate_tokens(line)
+            if total > budget:
+                break
+            tail.append(line)
+        omitted += len(body) - len(tail)
+        return [lines[0], f"- ... ({omitted} earlier turns omitted)"] + tail[::-1]
+
+    def stats(self) -> dict:
+        return {
+            node: {**c, "tokens_saved": c["tokens_full"] - c["tokens_sent"]}
+            for node, c in self.counters.items()
+        }
+
+
+history_manager = HistoryManager()
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langgraph.config import get_config
+
+import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    node TEXT NOT NULL DEFAULT '',
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access);
+"""
+
+# response_metadata entry holding the cache key of a reply that is not committed yet
+PENDING_KEY = "cache_pending_key"
+
+
+def normalize_messages(messages):
+    """Role + whitespace-normalized content for each message of a prompt."""
+    if isinstance(messages, str):
+        messages = [("human", messages)]
+    normalized = []
+    for message in messages:
+        if isinstance(message, BaseMessage):
+            role, content = message.type, message.content
+        else:
+            role, content = message
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True)
+        normalized.append([role, " ".join(content.split())])
+    return normalized
+
+
+class LLMResponseCache:
+    """Two-tier cache of LLM responses keyed by a content hash.
+
+    An in-memory LRU of `memory_size` entries sits in front of a SQLite
+    table. Disk entries expire `ttl_seconds` after they were written, and
+    the least recently used ones are evicted once the table holds more than
+    `max_bytes` of responses. The byte total is kept as a running count;
+    expired rows are purged, and the count resynced with the table, every
+    `purge_interval` seconds rather than on every write.
+    """
+
+    def __init__(self, path: str, *, memory_size: int = 256, ttl_seconds: float = 7 * 24 * 3600,
+                 max_bytes: int = 64 * 1024 * 1024, purge_interval: float = 60):
+        self.path = path
+        self.memory_size = memory_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.purge_interval = purge_interval
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+
+        self._memory = OrderedDict()  # key -> (response, created)
+        self.evictions = 0
+        self.total_bytes = 0
+        self._last_purge = 0.0
+        self._purge(time.time())
+
+    @staticmethod
+    def make_key(model: str, messages) -> str:
+        payload = json.dumps({"model": model, "messages": normalize_messages(messages)}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _remember(self, key, response, created):
+        self._memory[key] = (response, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Returns (response, tier) with tier "memory" or "disk", or (None, None)."""
+        now = time.time()
+        with self.lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    return entry[0], "memory"
+                del self._memory[key]
+
+            row = self.conn.execute("SELECT response, created, size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            if now - row[1] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.total_bytes -= row[2]
+                self.evictions += 1
+                return None, None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1])
+            return row[0], "disk"
+
+    def put(self, key: str, model: str, node: str, response: str):
+        now = time.time()
+        size = len(response.encode())
+        with self.lock:
+            self._remember(key, response, now)
+            old = self.conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, node, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, node or "", response, size, now, now),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if now - self._last_purge >= self.purge_interval:
+                self._purge(now)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _purge(self, now):
+        """Deletes expired rows and resyncs the byte total (other processes may share the table)."""
+        self._last_purge = now
+        self.evictions += self.conn.execute(
+            "DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _evict(self):
+        """Deletes least recently used rows until the table is back under max_bytes."""
+        excess = self.total_bytes - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+        for (key,) in stale:
+            self._memory.pop(key, None)
+        self.total_bytes -= freed
+        self.evictions += len(stale)
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": entries,
+            "disk_bytes": self.total_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class CachedChatModel:
+    """Wraps a chat model and answers repeated prompts from an LLMResponseCache.
+
+    Only safe for deterministic (temperature=0) models. The calling graph
+    node is read from the LangGraph run config; `nodes` ("*" for all) and
+    `exclude` decide which nodes use the cache. A fresh reply is only
+    cached once the node calls `commit` with it. Any other attribute is
+    forwarded to the wrapped model.
+    """
+
+    def __init__(self, llm, cache: LLMResponseCache, nodes="*", exclude=()):
+        self.llm = llm
+        self.cache = cache
+        self.nodes = nodes if nodes == "*" else set(nodes)
+        self.exclude = set(exclude)
+        self.counters = {}  # node -> {"hits", "misses", "bypassed"}
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    @property
+    def model(self) -> str:
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None) or type(self.llm).__name__
+
+    @staticmethod
+    def current_node() -> str:
+        try:
+            return get_config().get("metadata", {}).get("langgraph_node", "")
+        except RuntimeError:  # called outside a graph run
+            return ""
+
+    def enabled_for(self, node: str) -> bool:
+        if node in self.exclude:
+            return False
+        return self.nodes == "*" or node in self.nodes
+
+    def _count(self, node, outcome):
+        counts = self.counters.setdefault(node or "<none>", {"hits": 0, "misses": 0, "bypassed": 0})
+        counts[outcome] += 1
+        metrics.llm_cache_lookups.inc(node or "<none>", outcome)
+
+    def _lookup(self, messages):
+        node = self.current_node()
+        if not self.enabled_for(node):
+            self._count(node, "bypassed")
+            return None, None
+        key = self.cache.make_key(self.model, messages)
+        response, tier = self.cache.get(key)
+        if response is None:
+            self._count(node, "misses")
+            return key, None
+        self._count(node, "hits")
+        return key, AIMessage(content=response, response_metadata={"cache": tier})
+
+    def _mark(self, key, result):
+        # A fresh reply only carries its key; commit() caches it once the caller has parsed it.
+        if key is not None and isinstance(result.content, str) and result.content:
+            result.response_metadata[PENDING_KEY] = key
+
+    def commit(self, response):
+        """Caches a fresh reply the calling node parsed successfully.
+
+        Replies that are never committed (unparseable, rejected) are not
+        replayed on the next identical prompt. Cached replies are no-ops.
+        """
+        key = response.response_metadata.pop(PENDING_KEY, None)
+        if key is not None:
+            self.cache.put(key, self.model, self.current_node(), response.content)
+
+    def invoke(self, messages, *args, **kwargs):
+        key, cached = self._lookup(messages)
+        if cached is not None:
+            return cached
+        result = self.llm.invoke(messages, *args, **kwargs)
+        self._mark(key, result)
+        return result
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        key, cached = self._lookup(messages)
+        if cached is not None:
+            return cached
+        result = await self.llm.ainvoke(messages, *args, **kwargs)
+        self._mark(key, result)
+        return result
+
+    def stats(self) -> dict:
+        hits = sum(c["hits"] for c in self.counters.values())
+        misses = sum(c["misses"] for c in self.counters.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "nodes": {node: dict(c) for node, c in self.counters.items()},
+            **self.cache.stats(),
+        }
+
+
+def make_cached_llm(llm):
+    """Wraps llm with the response cache configured by the LLM_CACHE_* env vars."""
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return llm
+    nodes = os.getenv("LLM_CACHE_NODES", "*").strip()
+    cache = LLMResponseCache(
+        os.getenv("LLM_CACHE_DB", "/tmp/terraform-bot/llm-cache.db"),
+        memory_size=int(os.getenv("LLM_CACHE_MEMORY_SIZE", "256")),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
+    return CachedChatModel(
+        llm,
+        cache,
+        nodes="*" if nodes == "*" else [n.strip() for n in nodes.split(",") if n.strip()],
+        exclude=[n.strip() for n in os.getenv("LLM_CACHE_EXCLUDE", "").split(",") if n.strip()],
+    )
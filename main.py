@@ -1,6 +1,5 @@
 from typing import TypedDict, List, Optional, Dict, Any
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from dotenv import load_dotenv
@@ -8,16 +7,28 @@ import os
 import uuid
 import json
 import re
-import threading
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import RedirectResponse, StreamingResponse
+from starlette.responses import FileResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 import httpx
-import zipfile
-import io
 import terraform_utils as tf_utils
+import hcl_utils as hcl
+from scheduler import GraphRunScheduler, SchedulerFull
+from events import EventBus, LogBuffer, StateVersions, format_sse
+from checkpointer import make_checkpointer
+import classifier as local_classifier
+import security_scanner
+import slots
+from llm_cache import make_cached_llm
+from history import history_manager, EXTRACTION_MESSAGE_NAME
+import asyncio
+import logging
+import structured_logging
+import metrics
+import tracing
+import archives
 
 # ======================
 # Load Environment
@@ -33,6 +44,12 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 SESSION_SECRET = os.getenv("SESSION_SECRET", "super-secret-session-key")
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
+GRAPH_WORKERS = int(os.getenv("GRAPH_WORKERS", "8"))
+GRAPH_QUEUE_SIZE = int(os.getenv("GRAPH_QUEUE_SIZE", "200"))
+COMMAND_LOG_LINES = int(os.getenv("COMMAND_LOG_LINES", "5000"))  # plan/apply lines kept per thread for /logs
+STATUS_MAX_WAIT_SECONDS = float(os.getenv("STATUS_MAX_WAIT_SECONDS", "30"))  # cap on GET /chat/{id}?wait=
+# Set to 1 to have the LLM review the config after the local security scanner
+SECURITY_LLM_REVIEW = os.getenv("SECURITY_LLM_REVIEW", "0") == "1"
 
 # ======================
 # Define State
@@ -40,10 +57,12 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 class GraphState(TypedDict):
     thread_id: str
     messages: List
-    terraform_config: str
+    terraform_config: Dict[str, str]  # {filename: content}, validated on generate/revise
+    terraform_hashes: Dict[str, str]  # {filename: sha256 of content}
     retries: int
     approved: bool
     validate_result: str
+    validation_diagnostics: List  # [{file, line, severity, message, source}]
     approve_result: str
     next_action: str
     missing_field: str         
@@ -51,38 +70,68 @@ class GraphState(TypedDict):
     security_issues: str
     security_severity: str
     security_action: str
+    security_findings: List  # structured findings from the local scanner
     extracted_provider: str
     extracted_region: str
     extracted_instance_type: str
     extracted_resource_type: str
+    extracted_upto: int    # messages[:extracted_upto] have been through extraction
+    asked_field: str       # slot the last missing_question asked for, until answered
+    needs_instance: bool   # a user message mentioned a VM/server-like resource
     intent: str  # DEPLOYMENT, CONSULTATION, GENERAL
+    history_summaries: Dict[str, dict]  # node -> rolling summary of older turns
     plan_output: str
     cost_estimate: str
     apply_output: str
 
 
 # ======================
-# Initialize LLM (Groq)
-def log_to_file(message: str):
-    with open("backend.log", "a") as f:
-        f.write(message + "\n")
-        f.flush()
+# Logging
+# ======================
+# JSON lines via a background writer thread; records are tagged with the
+# graph thread_id and node (see structured_logging).
+structured_logging.configure_logging()
+logger = logging.getLogger("terraform_bot")
 
+# ======================
+# Initialize LLM (Groq)
 # ======================
 llm = ChatGroq(
     model="llama-3.3-70b-versatile",
     temperature=0,
     groq_api_key=api_key
 )
+# temperature=0, so identical prompts are answered from the response cache;
+# only calls that reach the model show up in the LLM metrics
+llm = tracing.TracedChatModel(make_cached_llm(metrics.InstrumentedChatModel(llm)))
+
+def cache_reply(response):
+    """Caches an LLM reply once the node has parsed it; bad replies are never replayed."""
+    commit = getattr(llm, "commit", None)  # absent when LLM_CACHE=0
+    if commit is not None:
+        commit(response)
 
 # ======================
 # AGENT: Intent Classifier
 # ======================
-def intent_classifier(state: GraphState) -> GraphState:
-    log_to_file(f"\n[intent_classifier] Analyzing intent...")
+async def intent_classifier(state: GraphState) -> GraphState:
+    logger.info(f"[intent_classifier] Analyzing intent...")
     try:
         last_msg = state["messages"][-1].content
-        response = llm.invoke([
+
+        # An answer to the question we just asked is part of the deployment
+        asked = state.get("asked_field", "")
+        if asked and slots.normalize_answer(asked, last_msg):
+            logger.info(f"[intent_classifier] Answer to the {asked} question")
+            return {**state, "intent": "DEPLOYMENT"}
+
+        # Fast path: clear-cut inputs are classified locally without the LLM
+        intent, confidence = local_classifier.intent_classifier.classify(last_msg)
+        if intent:
+            logger.info(f"[intent_classifier] Local intent: {intent} (confidence {confidence:.2f})")
+            return {**state, "intent": intent}
+
+        response = await llm.ainvoke([
             SystemMessage(content="""
 You are an intent classifier for a cloud infrastructure bot.
 Classify the user's message into one of these categories:
@@ -99,50 +148,88 @@ Return ONLY the category name.
         # Fallback for safety
         if intent not in ["DEPLOYMENT", "CONSULTATION", "GENERAL"]:
             intent = "GENERAL"
+        else:
+            cache_reply(response)
             
-        log_to_file(f"[intent_classifier] Detected intent: {intent}")
+        logger.info(f"[intent_classifier] Detected intent: {intent}")
         return {**state, "intent": intent}
     except Exception as e:
-        log_to_file(f"[Error] intent_classifier failed: {e}")
+        logger.error(f"[Error] intent_classifier failed: {e}")
         return {**state, "intent": "GENERAL"}
 
 # ======================
 # AGENT: Consultant
 # ======================
-def consultant_agent(state: GraphState) -> GraphState:
-    log_to_file(f"\n[consultant_agent] Providing advice...")
+async def consultant_agent(state: GraphState) -> GraphState:
+    logger.info(f"[consultant_agent] Providing advice...")
     try:
-        response = llm.invoke(
+        summary, recent, summaries = history_manager.build(
+            "consultant", state["messages"], state.get("history_summaries", {})
+        )
+        response = await llm.ainvoke(
             [
                 SystemMessage(content="""
 You are an expert Cloud Architect. The user is asking for advice.
 Provide a professional, concise recommendation.
 After your advice, ask if they would like to proceed with a specific deployment based on your suggestion.
-"""),
-            ] + state["messages"]
+""" + (f"\nSummary of the earlier conversation:\n{summary}\n" if summary else "")),
+            ] + recent
         )
+        cache_reply(response)
         return {
             **state,
+            "history_summaries": summaries,
             "messages": state["messages"] + [response],
             "next_action": "wait_for_input" # Wait for user to confirm or ask more
         }
     except Exception as e:
-        log_to_file(f"[Error] consultant_agent failed: {e}")
+        logger.error(f"[Error] consultant_agent failed: {e}")
         return {**state, "next_action": "end"}
 
 # ======================
 # AGENT: Understand Request
 # ======================
-def understand_request(state: GraphState) -> GraphState:
-    log_to_file(f"\n[understand_request] Processing {len(state['messages'])} messages.")
+def extracted_slots(state: GraphState) -> Dict[str, str]:
+    return {slot: state.get(f"extracted_{slot}", "") or "" for slot in slots.SLOTS}
+
+def slot_updates(state: GraphState, merged: Dict[str, str], new_messages: List) -> dict:
+    """State keys written after an extraction; messages up to here count as processed."""
+    user_text = " ".join(m.content for m in new_messages if isinstance(m, HumanMessage)).upper()
+    return {
+        # tagged so the history manager never sends it back to the LLM
+        "messages": state["messages"] + [AIMessage(content=json.dumps(merged), name=EXTRACTION_MESSAGE_NAME)],
+        "extracted_upto": len(state["messages"]) + 1,
+        "asked_field": "",
+        "needs_instance": state.get("needs_instance", False)
+            or any(x in user_text for x in ["EC2", "RDS", "COMPUTE", "VM", "SERVER"]),
+        **{f"extracted_{slot}": value for slot, value in merged.items()},
+    }
+
+async def understand_request(state: GraphState) -> GraphState:
+    # Only messages added since the last extraction are looked at; earlier
+    # turns are already reflected in the extracted_* slots.
+    new_messages = state["messages"][state.get("extracted_upto", 0):]
+    current = extracted_slots(state)
+    logger.info(f"[understand_request] Processing {len(new_messages)} new of {len(state['messages'])} messages.")
+
+    # Fast path: a short answer to the question we asked is parsed locally
+    asked = state.get("asked_field", "")
+    user_messages = [m for m in new_messages if isinstance(m, HumanMessage)]
+    if asked and len(user_messages) == 1:
+        local = slots.normalize_answer(asked, user_messages[0].content, current)
+        if local:
+            logger.info(f"[understand_request] Local answer for {asked}: {local}")
+            return {**state, **slot_updates(state, slots.merge_slots(current, local), new_messages)}
+
     try:
-        # Use full history to extract structured data
-        response = llm.invoke(
+        # New turns verbatim (within the node's token budget) plus what is already known
+        summary, recent, _ = history_manager.build("understand_request", new_messages, {})
+        known = json.dumps({slot: value for slot, value in current.items() if value})
+        response = await llm.ainvoke(
             [
                 SystemMessage(
                     content="""
 You are a helpful assistant that extracts structured cloud deployment information from a conversation.
-Look at the ENTIRE conversation history provided below.
 You are an expert infrastructure assistant.
 Extract the following fields into a JSON object from the user's request:
 - provider: (e.g., AWS, GCP, Azure). If implied (e.g., "S3" -> AWS, "GKE" -> GCP), infer it.
@@ -154,7 +241,9 @@ IMPORTANT:
 1. Be robust to TYPOS (e.g., "Googel" -> "GCP", "Amazn" -> "AWS", "t2micro" -> "t2.micro").
 2. INFER provider if obvious from resource name (e.g., "Droplet" -> DigitalOcean, "S3" -> AWS).
 3. If the user input is VAGUE (e.g., "I need a server"), extract what you can (e.g., resource_type="server") and leave others empty.
-4. Return ONLY the JSON object. No other text.
+4. Only the newest messages of the conversation are shown below. Fields already known from earlier
+   messages are listed; keep them unless the new messages change them.
+5. Return ONLY the JSON object. No other text.
 
 Format:
 {
@@ -163,38 +252,30 @@ Format:
   "instance_type": "...",
   "resource_type": "..."
 }
-"""
+""" + f"\nAlready known: {known}\n" + (f"\nSummary of the earlier conversation:\n{summary}\n" if summary else "")
                 )
-            ] + state["messages"]
+            ] + recent
         )
-        log_to_file(f"[understand_request] LLM Response: {response.content}")
-        data = parse_json_robustly(response.content)
-        return {
-            **state,
-            "messages": state["messages"] + [response],
-            "extracted_provider": data.get("provider", ""),
-            "extracted_region": data.get("region", ""),
-            "extracted_instance_type": data.get("instance_type", ""),
-            "extracted_resource_type": data.get("resource_type", ""),
-        }
+        logger.info(f"[understand_request] LLM Response: {response.content}", extra={"verbose": True})
+        data = parse_json_robustly(response.content, strict=True)
+        if data:
+            cache_reply(response)
+        return {**state, **slot_updates(state, slots.merge_slots(current, data), new_messages)}
     except Exception as e:
-        log_to_file(f"[Error] understand_request failed: {e}")
+        # Keep what was extracted before; the new messages are retried next time
+        logger.error(f"[Error] understand_request failed: {e}")
         return {
             **state,
-            "messages": state["messages"] + [AIMessage(content="{}")],
-            "extracted_provider": "",
-            "extracted_region": "",
-            "extracted_instance_type": "",
-            "extracted_resource_type": "",
+            "messages": state["messages"] + [AIMessage(content=json.dumps(current), name=EXTRACTION_MESSAGE_NAME)],
         }
 
 # ======================
 # AGENT: Generate Terraform
 # ======================
-def generate_tf(state: GraphState) -> GraphState:
+async def generate_tf(state: GraphState) -> GraphState:
     try:
         content = state["messages"][-1].content
-        response = llm.invoke([
+        response = await llm.ainvoke([
             HumanMessage(
                 content=f"""
 Generate a professional multi-file Terraform setup for this request:
@@ -214,48 +295,48 @@ Return ONLY valid JSON.
 """
             )
         ])
-        terraform = response.content
+        data = parse_json_robustly(response.content, strict=True)
+        terraform = tf_utils.normalize_terraform_files(data or parse_json_robustly(response.content))
+        if data and terraform:
+            cache_reply(response)
     except Exception as e:
-        print(f"[Error] generate_tf failed: {e}")
-        terraform = "{}"
+        logger.error(f"[Error] generate_tf failed: {e}")
+        # Count the failure so the supervisor stops after repeated attempts
+        return {**state, "terraform_config": {}, "terraform_hashes": {}, "retries": state.get("retries", 0) + 1}
 
-    print("\n[generate_tf] Multi-file Terraform config generated.")
+    logger.info("[generate_tf] Multi-file Terraform config generated.")
     return {
         **state,
         "terraform_config": terraform,
+        "terraform_hashes": tf_utils.file_hashes(terraform),
     }
 
 # ======================
 # AGENT: Validate Terraform
 # ======================
-def validate_tf(state: GraphState) -> GraphState:
-    terraform = state.get("terraform_config", "")
+# Parses the files locally, then runs `terraform validate` in a scratch
+# workspace through the async command runner.
+async def validate_tf(state: GraphState) -> GraphState:
+    terraform = state.get("terraform_config") or {}
     result = "NO"
+    diagnostics = []
 
     if terraform:
+        thread_id = state.get("thread_id", "default")
+        cwd = f"/tmp/terraform-bot/validate/{thread_id}"
         try:
-            resp = llm.invoke([
-                HumanMessage(
-                    content=f"""
-Check if this multi-file Terraform setup is valid:
-
-{terraform}
-
-Return ONLY:
-YES
-NO
-"""
-                )
-            ])
-            result = resp.content.strip()
+            diagnostics = await tf_utils.validate_config(cwd, terraform)
+            result = "NO" if any(d["severity"] == "error" for d in diagnostics) else "YES"
         except Exception as e:
-            print(f"[Error] validate_tf failed: {e}")
+            logger.error(f"[Error] validate_tf failed: {e}")
+            diagnostics = [{"file": "", "line": 0, "severity": "error", "message": f"Validation failed: {e}", "source": "bot"}]
 
-    print(f"[validate_tf] result = {result}")
+    logger.info(f"[validate_tf] result = {result}, diagnostics = {len(diagnostics)}")
 
+    # Runs in parallel with security_scan/prepare_workspace: return only own keys
     return {
-        **state,
-        "validate_result": result
+        "validate_result": result,
+        "validation_diagnostics": diagnostics
     }
 
 # ======================
@@ -268,29 +349,29 @@ def missing_info_agent(state: GraphState) -> GraphState:
         instance_type = state.get("extracted_instance_type", "")
         resource_type = state.get("extracted_resource_type", "")
         
-        log_to_file(f"[missing_info_agent] Extracted: provider='{provider}', region='{region}', instance_type='{instance_type}', resource_type='{resource_type}'")
+        logger.info(f"[missing_info_agent] Extracted: provider='{provider}', region='{region}', instance_type='{instance_type}', resource_type='{resource_type}'")
 
         if not provider:
-            return { **state, "missing_field": "provider", "missing_question": "Which cloud provider do you want? (AWS / GCP / Azure)" }
+            return { **state, "missing_field": "provider", "asked_field": "provider", "missing_question": "Which cloud provider do you want? (AWS / GCP / Azure)" }
 
         if not region:
-            return { **state, "missing_field": "region", "missing_question": f"I see you want to use {provider}. Which region should I deploy in?" }
+            return { **state, "missing_field": "region", "asked_field": "region", "missing_question": f"I see you want to use {provider}. Which region should I deploy in?" }
 
-        user_messages = " ".join([m.content for m in state["messages"] if isinstance(m, HumanMessage)])
-        needs_instance = any(x in resource_type.upper() or x in user_messages.upper() for x in ["EC2", "RDS", "COMPUTE", "VM", "SERVER"])
+        # needs_instance is updated by understand_request from new user messages only
+        needs_instance = state.get("needs_instance", False) or any(x in resource_type.upper() for x in ["EC2", "RDS", "COMPUTE", "VM", "SERVER"])
         
         if needs_instance and not instance_type:
-            return { **state, "missing_field": "instance_type", "missing_question": f"Which instance type do you want for your {provider} deployment?" }
+            return { **state, "missing_field": "instance_type", "asked_field": "instance_type", "missing_question": f"Which instance type do you want for your {provider} deployment?" }
 
         return { **state, "missing_field": "", "missing_question": "" }
     except Exception as e:
-        log_to_file(f"[missing_info_agent] ERROR: {e}")
+        logger.error(f"[missing_info_agent] ERROR: {e}")
         return { **state, "missing_field": "unknown", "missing_question": "An error occurred while checking for missing info." }
 
 def ask_user_info(state: GraphState) -> GraphState:
     """Node that appends the missing question to messages so the user sees it."""
     question = state.get("missing_question", "")
-    print(f"[ask_user_info] Question: {question}")
+    logger.info(f"[ask_user_info] Question: {question}")
     if question:
         return {
             **state,
@@ -302,8 +383,12 @@ def wait_for_input(state: GraphState) -> GraphState:
     """Dummy node to interrupt at, after the question has been added to messages."""
     return state
 
-def parse_json_robustly(content: str):
-    """Helper to parse JSON even if wrapped in markdown code blocks or has extra text."""
+def parse_json_robustly(content: str, strict: bool = False):
+    """Helper to parse JSON even if wrapped in markdown code blocks or has extra text.
+
+    A reply that holds no JSON object is returned as {"main.tf": content},
+    or as {} when strict.
+    """
     if not content:
         return {}
     content = content.strip()
@@ -317,7 +402,7 @@ def parse_json_robustly(content: str):
         data = json.loads(content)
         if isinstance(data, dict):
             return data
-        return {"main.tf": str(data)}
+        return {} if strict else {"main.tf": str(data)}
     except Exception as e:
         # Try one more time with regex if simple slicing failed
         import re
@@ -329,21 +414,31 @@ def parse_json_robustly(content: str):
                     return data
             except:
                 pass
-        return {"main.tf": content}
+        return {} if strict else {"main.tf": content}
 
-def security_scan_agent(state: GraphState) -> GraphState:
-    terraform = state.get("terraform_config", "")
+async def security_scan_agent(state: GraphState) -> GraphState:
+    terraform = state.get("terraform_config") or {}
 
-    if not terraform or terraform == "{}":
-        return { **state, "security_severity": "NONE", "security_issues": "" }
+    if not terraform:
+        return { "security_severity": "NONE", "security_issues": "", "security_findings": [] }
 
-    try:
-        resp = llm.invoke([
-            HumanMessage(
-                content=f"""
+    # Deterministic local rule pack; the LLM only runs as an optional deeper review.
+    result = security_scanner.scan(terraform)
+    severity = result["severity"]
+    issues = result["issues"]
+    logger.info(f"[security_scan_agent] Local scan: severity={severity}, findings={len(issues)}")
+
+    if SECURITY_LLM_REVIEW:
+        try:
+            resp = await llm.ainvoke([
+                HumanMessage(
+                    content=f"""
 You are a cloud security expert.
 
-Analyze the following multi-file Terraform setup for security risks.
+A static scanner already reported these findings for the multi-file Terraform setup below:
+{chr(10).join(issues) or "None"}
+
+Look only for additional security risks the scanner missed.
 Return JSON ONLY in this format:
 
 {{
@@ -355,25 +450,27 @@ Return JSON ONLY in this format:
 }}
 
 Terraform setup:
-{terraform}
+{json.dumps(terraform, indent=2)}
 """
-            )
-        ])
-        result = parse_json_robustly(resp.content)
-        print(f"[security_scan_agent] Parsed result: {result}")
-    except Exception as e:
-        print("[security_scan_agent] error:", e)
-        result = {"severity": "LOW", "issues": [f"Security scan failed to parse: {str(e)}"]}
+                )
+            ])
+            review = parse_json_robustly(resp.content, strict=True)
+            logger.info(f"[security_scan_agent] LLM review: {review}", extra={"verbose": True})
+            severity = security_scanner.max_severity(severity, str(review.get("severity", "NONE")).upper())
+            issues = issues + [f"[LLM] {issue}" for issue in review.get("issues", [])]
+            if "severity" in review:
+                cache_reply(resp)
+        except Exception as e:
+            logger.error(f"[security_scan_agent] LLM review failed: {e}")
 
     return {
-        **state,
-        "security_severity": result.get("severity", "LOW"),
-        "security_issues": "\n".join(result.get("issues", ["Scan failed"]))
+        "security_severity": severity,
+        "security_issues": "\n".join(issues),
+        "security_findings": result["findings"],
     }
 
 def security_review_agent(state: GraphState) -> GraphState:
-    print("[Security Review Needed]")
-    print("Security Issues Detected:\n", state["security_issues"])
+    logger.warning(f"[security_review] Security issues detected:\n{state['security_issues']}")
     # Interrupt handled via API
     return state
 
@@ -381,45 +478,76 @@ def security_review_agent(state: GraphState) -> GraphState:
 # ======================
 # AGENT: Plan Terraform
 # ======================
-def plan_agent(state: GraphState) -> GraphState:
-    thread_id = state.get("thread_id", "default") # We need to ensure thread_id is in state or passed via config
-    # Note: thread_id is usually in config, but we can infer or pass it. 
-    # For now, let's assume we can get it from the supervisor or context. 
-    # Actually, LangGraph state doesn't have thread_id by default unless we put it there.
-    # We will add thread_id to initial_state in start_chat.
-    
+# plan/cost/apply (and prepare_workspace) await the CLIs through
+# tf_utils.run_command_async, so the event loop keeps serving other sessions
+# while terraform runs, and a cancelled run kills the subprocess.
+async def setup_workspace(state: GraphState) -> str:
+    """Writes the config and GCS backend into the thread's workspace and runs init."""
+    thread_id = state.get("thread_id", "default")
     cwd = f"/tmp/terraform-bot/{thread_id}"
-    terraform_files = parse_json_robustly(state["terraform_config"])
-    
+    tf_utils.write_terraform_files(cwd, state["terraform_config"], prune=True)
+
+    # Setup GCS Backend
+    project_id = os.getenv("PROJECT_ID", "terraform-482108")
+    tf_utils.setup_gcs_backend(cwd, project_id, thread_id)
+
+    await tf_utils.terraform_init(cwd)
+    return cwd
+
+# Cost estimation starts in the background as soon as plan_agent has exported
+# the plan JSON. That only overlaps it with the supervisor hop between
+# plan_agent and cost_agent (checkpoint write + routing); cost_agent waits for
+# the result. A job is dropped when the supervisor routes anywhere but cost
+# and when the run ends, so abandoned threads never keep one.
+cost_jobs: Dict[str, asyncio.Task] = {}  # thread_id -> pending estimate_cost
+
+def drop_cost_job(thread_id: str):
+    job = cost_jobs.pop(thread_id, None)
+    if job is not None:
+        job.cancel()
+
+# Runs next to validate_tf/security_scan so `terraform init` is done (and
+# fingerprinted) by the time plan_agent runs. Failures are left to plan_agent.
+async def prepare_workspace(state: GraphState) -> GraphState:
     try:
-        log_to_file(f"[plan_agent] Setting up workspace in {cwd}")
-        tf_utils.write_terraform_files(cwd, terraform_files)
-        
-        # Setup GCS Backend
-        project_id = os.getenv("PROJECT_ID", "terraform-482108")
-        tf_utils.setup_gcs_backend(cwd, project_id, thread_id)
-        
-        log_to_file("[plan_agent] Init...")
-        tf_utils.terraform_init(cwd)
+        logger.info(f"[prepare_workspace] Initialising workspace for {state.get('thread_id', 'default')}")
+        await setup_workspace(state)
+    except Exception as e:
+        logger.error(f"[prepare_workspace] Init failed, plan_agent will retry: {e}")
+    return {}
+
+async def plan_agent(state: GraphState) -> GraphState:
+    thread_id = state.get("thread_id", "default")
+    drop_cost_job(thread_id)
+    try:
+        logger.info("[plan_agent] Setting up workspace and init...")
+        cwd = await setup_workspace(state)
         
-        log_to_file("[plan_agent] Planning...")
-        plan = tf_utils.terraform_plan(cwd)
+        logger.info("[plan_agent] Planning...")
+        plan = await tf_utils.terraform_plan(cwd, on_line=command_output(thread_id, "terraform plan"))
+        # the task inherits this node's context, so its logs and trace span stay attached to the run
+        cost_jobs[thread_id] = asyncio.create_task(tf_utils.estimate_cost(cwd))
         
         return {**state, "plan_output": plan}
     except Exception as e:
-        log_to_file(f"[Error] plan_agent failed: {e}")
+        logger.error(f"[Error] plan_agent failed: {e}")
         return {**state, "plan_output": f"Plan failed: {str(e)}"}
 
 # ======================
 # AGENT: Cost Estimation
 # ======================
-def cost_agent(state: GraphState) -> GraphState:
+async def cost_agent(state: GraphState) -> GraphState:
     thread_id = state.get("thread_id", "default")
     cwd = f"/tmp/terraform-bot/{thread_id}"
     
     try:
-        log_to_file("[cost_agent] Estimating cost...")
-        cost = tf_utils.estimate_cost(cwd)
+        job = cost_jobs.pop(thread_id, None)
+        if job is not None:
+            logger.info("[cost_agent] Waiting for the cost estimate started after planning...")
+            cost = await job
+        else:
+            logger.info("[cost_agent] Estimating cost...")
+            cost = await tf_utils.estimate_cost(cwd)
         
         # Ask user for approval
         msg = "I have generated the plan and cost estimate. Would you like to apply these changes to the cloud and archive them to GCS?"
@@ -435,17 +563,17 @@ def cost_agent(state: GraphState) -> GraphState:
 # ======================
 # AGENT: Apply Terraform
 # ======================
-def apply_agent(state: GraphState) -> GraphState:
+async def apply_agent(state: GraphState) -> GraphState:
     thread_id = state.get("thread_id", "default")
     cwd = f"/tmp/terraform-bot/{thread_id}"
     
     try:
-        log_to_file("[apply_agent] Applying changes...")
-        output = tf_utils.terraform_apply(cwd)
+        logger.info("[apply_agent] Applying changes...")
+        output = await tf_utils.terraform_apply(cwd, on_line=command_output(thread_id, "terraform apply"))
         
         # Upload to GCS
         project_id = os.getenv("PROJECT_ID", "terraform-482108")
-        upload_msg = tf_utils.upload_directory_to_gcs(cwd, project_id, thread_id)
+        upload_msg = await tf_utils.upload_directory_to_gcs(cwd, project_id, thread_id)
         
         return {**state, "apply_output": output + "\n\n" + upload_msg}
     except Exception as e:
@@ -454,14 +582,20 @@ def apply_agent(state: GraphState) -> GraphState:
 # ======================
 # AGENT: Check Approval Intent
 # ======================
-def check_approval_intent(state: GraphState) -> GraphState:
+async def check_approval_intent(state: GraphState) -> GraphState:
     messages = state.get("messages", [])
     last_msg = messages[-1].content if messages else ""
     
-    print(f"[check_approval_intent] Checking intent for: {last_msg}")
+    logger.info(f"[check_approval_intent] Checking intent for: {last_msg}", extra={"verbose": True})
     
+    # Fast path: "yes", "go ahead", "no, change X" etc. are decided locally
+    decision, confidence = local_classifier.approval_classifier.classify(last_msg)
+    if decision:
+        logger.info(f"[check_approval_intent] Local intent: {decision} (confidence {confidence:.2f})")
+        return {**state, "approve_result": "approved" if decision == "APPROVE" else "revise"}
+
     try:
-        response = llm.invoke([
+        response = await llm.ainvoke([
             SystemMessage(content="""
 You are an intent classifier for a Terraform approval workflow.
 The user has been asked: "Would you like to apply these changes?"
@@ -477,18 +611,20 @@ Return ONLY the category name.
         ])
         
         intent = response.content.strip().upper()
-        print(f"[check_approval_intent] Intent: {intent}")
+        logger.info(f"[check_approval_intent] Intent: {intent}")
         
         if "APPROVE" in intent:
+            cache_reply(response)
             return {**state, "approve_result": "approved"}
         elif "REVISE" in intent:
+            cache_reply(response)
             return {**state, "approve_result": "revise"}
         else:
             # Default to revise/chat if unclear
             return {**state, "approve_result": "revise"}
             
     except Exception as e:
-        print(f"[check_approval_intent] Error: {e}")
+        logger.error(f"[check_approval_intent] Error: {e}")
         return {**state, "approve_result": "revise"}
 
 # ======================
@@ -500,88 +636,123 @@ def approve_tf(state: GraphState) -> GraphState:
 # ======================
 # AGENT: Revise Terraform
 # ======================
-def revise_tf(state: GraphState) -> GraphState:
-    print(f"[revise_tf] Starting revision. Current retries: {state.get('retries', 0)}")
+def revision_targets(state: GraphState) -> List[str]:
+    """Files a revision has to look at: those named by diagnostics or findings.
+
+    User-requested changes, and issues that can't be tied to a file, need
+    the whole config.
+    """
+    files = state.get("terraform_config") or {}
+    if state.get("approve_result") == "revise":
+        return sorted(files)
+    issues = [d for d in state.get("validation_diagnostics", []) if d.get("severity") == "error"]
+    if state.get("security_action") == "fix" or not issues:
+        issues += state.get("security_findings", [])
+    targets = {issue.get("file", "") for issue in issues}
+    if not targets or not targets <= set(files) or "[LLM]" in state.get("security_issues", ""):
+        return sorted(files)
+    return sorted(targets)
+
+async def revise_tf(state: GraphState) -> GraphState:
+    logger.info(f"[revise_tf] Starting revision. Current retries: {state.get('retries', 0)}")
+    files = state.get("terraform_config") or {}
+    targets = revision_targets(state)
+    # Only the affected files are sent in full; the rest are summarized by their blocks
+    others = "\n".join(
+        f"- {name}: " + (", ".join(hcl.outline(content)) or "no blocks")
+        for name, content in files.items() if name not in targets
+    ) or "None"
+    feedback = ""
+    if state.get("approve_result") == "revise" and state.get("messages"):
+        feedback = f"\nUser Feedback: {state['messages'][-1].content}"
+    changed, deleted = [], []
     try:
-        response = llm.invoke([
-            HumanMessage(
-                content=f"""
+        prompt = f"""
 You are a Terraform expert. The user has requested changes or a security scan has failed.
 
-CURRENT CONFIGURATION:
-{state["terraform_config"]}
+FILES TO REVISE:
+{json.dumps({name: files[name] for name in targets}, indent=2)}
+
+OTHER FILES (unchanged, shown as their top-level blocks):
+{others}
 
 ISSUES TO FIX:
 Validation Result: {state["validate_result"]}
-Security Issues: {state["security_issues"]}
+Validation Diagnostics:
+{tf_utils.format_diagnostics(state.get("validation_diagnostics", [])) or "None"}
+Security Issues: {state["security_issues"]}{feedback}
 
 TASK:
 1. Revise the Terraform configuration to address ALL issues mentioned above.
 2. If the security scan failed due to public access, ensure you set appropriate private access (e.g., acl = "private").
-3. Return ONLY a valid JSON object mapping filenames to their updated content.
+3. Return ONLY a JSON object with the files you changed or added, each with its full new content. Leave unchanged files out. Use null to delete a file.
 4. Do NOT include any markdown formatting or extra text outside the JSON.
 
 Format:
 {{
-  "main.tf": "...",
-  "variables.tf": "...",
-  "outputs.tf": "..."
+  "main.tf": "..."
 }}
 """
-            )
-        ])
-        terraform = response.content
-        # Verify it's valid JSON
-        try:
-            parse_json_robustly(terraform)
-            print("[revise_tf] Successfully generated valid JSON revision.")
-        except Exception as e:
-            print(f"[revise_tf] Revision is not valid JSON: {e}")
-            # If it's not valid JSON, we might want to keep the old one or try to fix it
-            # For now, we'll just log it.
+        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        data = parse_json_robustly(response.content, strict=True)
+        terraform, changed, deleted = tf_utils.merge_file_changes(files, data or parse_json_robustly(response.content))
+        if data and (changed or deleted):
+            cache_reply(response)
+        logger.info(
+            f"[revise_tf] Sent {len(targets)}/{len(files)} files ({len(prompt)} prompt chars, "
+            f"{len(response.content)} reply chars); changed={changed}, deleted={deleted}"
+        )
     except Exception as e:
-        print(f"[Error] revise_tf failed: {e}")
-        terraform = state["terraform_config"]
+        # Keep the current files; validation runs again and retries are counted
+        logger.error(f"[Error] revise_tf failed: {e}")
+        terraform = files
 
-    return {
+    revision = {
         **state,
         "terraform_config": terraform,
+        "terraform_hashes": tf_utils.file_hashes(terraform),
         "retries": state["retries"] + 1,
         "approve_result": "",
         "validate_result": "PENDING",
         "security_severity": "",
         "security_issues": "",
+        "security_findings": [],
         "security_action": ""
     }
+    if changed or deleted:
+        # The existing plan and cost estimate describe the old files
+        revision.update({"plan_output": "", "cost_estimate": ""})
+    return revision
 
 
 def supervisor_node(state: GraphState) -> GraphState:
     validate = state.get("validate_result", "")
     approve = state.get("approve_result", "")
     retries = state.get("retries", 0)
-    terraform = state.get("terraform_config", "")
+    terraform = state.get("terraform_config") or {}
     missing = state.get("missing_field", "")
     
-    print(f"\n[Supervisor] validate={validate}, approve={approve}, retries={retries}, missing={missing}")
-    print(f"[Supervisor] missing_field='{missing}', next_action='{state.get('next_action')}'")
+    logger.info(f"[Supervisor] validate={validate}, approve={approve}, retries={retries}, missing={missing}")
+    logger.info(f"[Supervisor] missing_field='{missing}', next_action='{state.get('next_action')}'")
 
     # STEP 0: Missing Info?
     if missing:
-        print("[Supervisor] Routing to ask_user")
+        logger.info("[Supervisor] Routing to ask_user")
         return { **state, "next_action": "ask_user" }
 
     # Too many retries
     if retries >= 5:
-        print("[Supervisor] Too many retries → stopping.")
+        logger.warning("[Supervisor] Too many retries → stopping.")
         return { **state, "next_action": "end" }
 
     # STEP 1: If no Terraform yet → generate it
     if not terraform:
         return { **state, "next_action": "generate" }
 
-    # STEP 2: If validation never ran → run validate
+    # STEP 2: If validation never ran → run validate, security scan and
+    # workspace init in parallel
     if validate in ("", "PENDING"):
-        return { **state, "next_action": "validate" }
+        return { **state, "next_action": "check" }
 
     # STEP 3: If validation failed → revise
     if validate == "NO":
@@ -591,7 +762,7 @@ def supervisor_node(state: GraphState) -> GraphState:
     if validate == "YES" and approve == "":
         # Run security scan first if not done
         if not state.get("security_severity"):
-            return { **state, "next_action": "security_scan" }
+            return { **state, "next_action": "check" }
         
         # If security severity HIGH and no decision yet -> review
         if state.get("security_severity") == "HIGH" and state.get("security_action", "") == "":
@@ -639,29 +810,37 @@ def supervisor_node(state: GraphState) -> GraphState:
 # ======================
 graph = StateGraph(GraphState)
 
+
+def add_node(name, fn):
+    # every node reports its duration to /metrics and gets a span in the thread's trace
+    kind = "route" if name == "supervisor" else "node"
+    graph.add_node(name, metrics.instrument_node(name, tracing.trace_node(name, fn, kind)))
+
+
 # Add nodes
 try:
-    graph.add_node("intent_classifier", intent_classifier)
-    graph.add_node("consultant", consultant_agent)
-    graph.add_node("understand_request", understand_request)
-    graph.add_node("supervisor", supervisor_node)
-    graph.add_node("missing_info", missing_info_agent)
-    graph.add_node("ask_user_info", ask_user_info)
-    graph.add_node("wait_for_input", wait_for_input)
-    graph.add_node("generate_tf", generate_tf)
-    graph.add_node("validate_tf", validate_tf)
-    graph.add_node("security_scan", security_scan_agent)
-    graph.add_node("security_review", security_review_agent)
-    graph.add_node("plan_agent", plan_agent)
-    graph.add_node("cost_agent", cost_agent)
-    graph.add_node("apply_agent", apply_agent)
-    graph.add_node("check_approval_intent", check_approval_intent)
+    add_node("intent_classifier", intent_classifier)
+    add_node("consultant", consultant_agent)
+    add_node("understand_request", understand_request)
+    add_node("supervisor", supervisor_node)
+    add_node("missing_info", missing_info_agent)
+    add_node("ask_user_info", ask_user_info)
+    add_node("wait_for_input", wait_for_input)
+    add_node("generate_tf", generate_tf)
+    add_node("validate_tf", validate_tf)
+    add_node("security_scan", security_scan_agent)
+    add_node("security_review", security_review_agent)
+    add_node("prepare_workspace", prepare_workspace)
+    add_node("plan_agent", plan_agent)
+    add_node("cost_agent", cost_agent)
+    add_node("apply_agent", apply_agent)
+    add_node("check_approval_intent", check_approval_intent)
 except ValueError as e:
-    print(f"[Graph Error] Node addition failed: {e}")
+    logger.error(f"[Graph Error] Node addition failed: {e}")
 
 
-graph.add_node("approve_tf", approve_tf)
-graph.add_node("revise_tf", revise_tf)
+add_node("approve_tf", approve_tf)
+add_node("revise_tf", revise_tf)
 
 # Entry
 graph.add_edge(START, "intent_classifier")
@@ -696,29 +875,43 @@ graph.add_edge("ask_user_info", "wait_for_input")
 # wait_for_input -> intent_classifier (loop back to re-evaluate intent of new input)
 graph.add_edge("wait_for_input", "intent_classifier")
 
+# Independent checks fan out from the supervisor as parallel branches
+CHECK_BRANCHES = ["validate_tf", "security_scan", "prepare_workspace"]
+
+def route_supervisor(state: GraphState):
+    if state["next_action"] != "cost":
+        # Only cost_agent consumes the estimate plan_agent started
+        drop_cost_job(state.get("thread_id", "default"))
+    if state["next_action"] == "check":
+        return CHECK_BRANCHES
+    return state["next_action"]
+
 # supervisor dynamic routing
 graph.add_conditional_edges(
     "supervisor",
-    lambda state: state["next_action"],
+    route_supervisor,
     {
         "ask_user": "ask_user_info",
         "generate": "generate_tf",
-        "validate": "validate_tf",
+        "validate_tf": "validate_tf",
         "security_scan": "security_scan",
+        "prepare_workspace": "prepare_workspace",
         "security_review": "security_review",
         "plan": "plan_agent",
         "cost": "cost_agent",
         "apply": "apply_agent",
         "revise": "revise_tf",
         "approve": "approve_tf",
+        # set by send_message when the user answers the approval question in chat
+        "check_approval_intent": "check_approval_intent",
         "end": END
     }
 )
 
 # each agent returns control to supervisor
 graph.add_edge("generate_tf", "supervisor")
-graph.add_edge("validate_tf", "supervisor")
-graph.add_edge("security_scan", "supervisor")
+# join: supervisor runs once all parallel checks have finished
+graph.add_edge(CHECK_BRANCHES, "supervisor")
 graph.add_edge("security_review", "supervisor")
 graph.add_edge("plan_agent", "supervisor")
 graph.add_edge("cost_agent", "supervisor")
@@ -727,9 +920,10 @@ graph.add_edge("approve_tf", "supervisor")
 graph.add_edge("revise_tf", "supervisor")
 
 # ======================
-# Compile Graph with Memory
+# Compile Graph with Checkpointer
 # ======================
-memory = MemorySaver()
+# SQLite by default (CHECKPOINT_BACKEND=memory for the old in-process saver)
+memory = make_checkpointer()
 graph_app = graph.compile(
     checkpointer=memory,
     interrupt_before=[
@@ -740,6 +934,109 @@ graph_app = graph.compile(
 )
 
 
+# ======================
+# Graph Runner
+# ======================
+# Every run goes through the scheduler: a fixed pool of event-loop workers fed
+# by a bounded FIFO queue. State updates for a resume are applied by the worker
+# right before the run, so a rejected request leaves the thread untouched.
+# Updates that depend on the state (appending a message) are passed as a
+# function of the values at that point, after any earlier run of the thread.
+async def run_graph(inputs, config, updates=None):
+    """Applies pending state updates, then drives the graph with astream.
+
+    Node starts/finishes and checkpoint changes are published to the thread's
+    SSE subscribers as they happen.
+    """
+    thread_id = config["configurable"]["thread_id"]
+    structured_logging.bind_thread(thread_id)
+    with tracing.tracer.run(thread_id) as root:
+        try:
+            previous = (await graph_app.aget_state(config)).values
+            if callable(updates):
+                updates = updates(previous)
+            if updates:
+                await graph_app.aupdate_state(config, updates)
+                record_version(thread_id, await graph_app.aget_state(config))
+            run_config = {**config, "recursion_limit": 100}
+            async for event in graph_app.astream(inputs, run_config, stream_mode="debug"):
+                previous = publish_graph_event(thread_id, event, previous)
+        except Exception as e:
+            logger.error(f"Error in graph execution: {e}")
+            root["status"] = "error"
+            root["attributes"]["error"] = str(e)[:500]
+            event_bus.publish(thread_id, "run_error", {"detail": str(e)})
+        finally:
+            drop_cost_job(thread_id)  # plan_agent's estimate is consumed within the same run
+            state = await graph_app.aget_state(config)
+            record_version(thread_id, state)
+            event_bus.publish(thread_id, "run_finished", status_flags(state.values))
+
+def publish_graph_event(thread_id, event, previous):
+    """Turns one debug stream event into SSE events; returns the latest values."""
+    payload = event.get("payload", {})
+    if event["type"] == "task":
+        event_bus.publish(thread_id, "node_started", {"node": payload.get("name")})
+        return previous
+    if event["type"] == "task_result":
+        event_bus.publish(thread_id, "node_finished", {
+            "node": payload.get("name"),
+            "error": payload.get("error")
+        })
+        return previous
+    if event["type"] != "checkpoint":
+        return previous
+
+    values = payload.get("values") or {}
+    state_versions.record(thread_id, checkpoint_version(payload.get("metadata")),
+                          len(values.get("messages", [])), config_hashes(values))
+    old_messages = previous.get("messages", [])
+    new_messages = values.get("messages", [])
+    if new_messages is not old_messages:
+        # Messages are append-only, so send everything after the common prefix.
+        offset = 0
+        while offset < min(len(old_messages), len(new_messages)) and old_messages[offset] == new_messages[offset]:
+            offset += 1
+        if offset < len(new_messages) or offset < len(old_messages):
+            event_bus.publish(thread_id, "messages", {
+                "offset": offset,
+                "messages": format_messages(new_messages[offset:])
+            })
+
+    if values.get("terraform_hashes") != previous.get("terraform_hashes"):
+        event_bus.publish(thread_id, "config", {"terraform_config": values.get("terraform_config") or {}})
+
+    if status_flags(values) != status_flags(previous):
+        event_bus.publish(thread_id, "status", status_flags(values))
+    return values
+
+event_bus = EventBus()
+command_logs = LogBuffer(max_lines=COMMAND_LOG_LINES)
+state_versions = StateVersions()
+archive_cache = archives.ArchiveCache()
+
+def command_output(thread_id, command):
+    """on_line callback that streams a command's output to GET /chat/{thread_id}/logs."""
+    command_logs.append(thread_id, command, "command", f"$ {command}")
+    return lambda stream, line: command_logs.append(thread_id, command, stream, line)
+run_scheduler = GraphRunScheduler(run_graph, workers=GRAPH_WORKERS, max_queue=GRAPH_QUEUE_SIZE)
+metrics.registry.gauge(
+    "graph_runs_queued", "Graph runs waiting for a worker.", lambda: {(): run_scheduler.depth()})
+metrics.registry.gauge(
+    "graph_runs_running", "Graph runs in progress.", lambda: {(): run_scheduler.running})
+
+def schedule_run(config, inputs=None, updates=None):
+    """Queues a graph run for the thread in config, or rejects it with 429."""
+    try:
+        run_scheduler.submit(config["configurable"]["thread_id"], inputs, config, updates)
+    except SchedulerFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many graph runs in progress, please retry later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
 
 # ======================
 # FastAPI App
@@ -821,16 +1118,53 @@ class ApproveRequest(BaseModel):
     approved: bool
     feedback: Optional[str] = None
 
+def format_messages(messages):
+    return [{"role": "user" if isinstance(m, HumanMessage) else "assistant", "content": m.content} for m in messages]
+
+def status_flags(values):
+    """The routing/waiting part of a thread's status."""
+    return {
+        "next_action": values.get("next_action", "end"),
+        "waiting_for_approval": values.get("next_action") == "approve",
+        "waiting_for_missing_info": values.get("next_action") in ["ask_user", "wait_for_input"],
+        "waiting_for_security_review": values.get("next_action") == "security_review",
+        "security_issues": values.get("security_issues", ""),
+        "security_severity": values.get("security_severity", "NONE"),
+    }
+
+def checkpoint_version(metadata) -> int:
+    """State version of a checkpoint: its step, which grows with every checkpoint of a thread (0 = first input)."""
+    return (metadata or {}).get("step", -1) + 1
+
+def config_hashes(values):
+    files = values.get("terraform_config") or {}
+    hashes = values.get("terraform_hashes") or {}
+    return hashes if set(hashes) == set(files) else tf_utils.file_hashes(files)
+
+def record_version(thread_id, state):
+    """Records a StateSnapshot with state_versions; returns its version."""
+    version = checkpoint_version(state.metadata)
+    if state.values:
+        state_versions.record(thread_id, version, len(state.values.get("messages", [])), config_hashes(state.values))
+    return version
+
+def build_status(values):
+    """Full status payload shared by GET /chat/{id} and the SSE snapshot."""
+    return {
+        "messages": format_messages(values.get("messages", [])),
+        "terraform_config": values.get("terraform_config") or {},
+        **status_flags(values),
+    }
+
 @app.post("/chat")
 async def start_chat(req: ChatRequest):
-    import threading
-    
     thread_id = str(uuid.uuid4())
     config = {"configurable": {"thread_id": thread_id}}
     
     initial_state = {
         "messages": [HumanMessage(content=req.message)],
-        "terraform_config": "",
+        "terraform_config": {},
+        "terraform_hashes": {},
         "retries": 0,
         "approved": False,
         "validate_result": "",
@@ -844,6 +1178,9 @@ async def start_chat(req: ChatRequest):
         "extracted_instance_type": "",
         "extracted_resource_type": "",
         "extracted_resource_type": "",
+        "extracted_upto": 0,
+        "asked_field": "",
+        "needs_instance": False,
         "intent": "",
         "plan_output": "",
         "cost_estimate": "",
@@ -851,77 +1188,192 @@ async def start_chat(req: ChatRequest):
         "thread_id": thread_id
     }
     
-    # Run graph in background thread to avoid blocking
-    def run_graph():
-        try:
-            run_config = {**config, "recursion_limit": 100}
-            for event in graph_app.stream(initial_state, run_config):
-                pass
-        except Exception as e:
-            print(f"Error in graph execution: {e}")
-    
-    thread = threading.Thread(target=run_graph, daemon=True)
-    thread.start()
+    # Queue the run; the scheduler executes it on the event loop
+    schedule_run(config, inputs=initial_state)
         
     return {"thread_id": thread_id, "status": "started"}
 
+def status_delta(values, seen):
+    """Status with only what changed after a version the client saw.
+
+    seen is that version's (message count, file hashes); None (version no
+    longer known) gives the full status, flagged with "full": true.
+    """
+    files = values.get("terraform_config") or {}
+    if seen is None:
+        return {**build_status(values), "full": True, "messages_offset": 0, "removed_files": []}
+    message_count, old_hashes = seen
+    hashes = config_hashes(values)
+    return {
+        "full": False,
+        "messages_offset": message_count,
+        "messages": format_messages(values.get("messages", [])[message_count:]),
+        "terraform_config": {name: files[name] for name in files if old_hashes.get(name) != hashes.get(name)},
+        "removed_files": sorted(set(old_hashes) - set(files)),
+        **status_flags(values),
+    }
+
 @app.get("/chat/{thread_id}")
-async def get_chat_status(thread_id: str):
+async def get_chat_status(thread_id: str, since: Optional[int] = None, wait: float = 0):
+    """Status of a thread, with its state `version`.
+
+    With ?since=<version> only what changed after that version is returned
+    (messages to splice in at `messages_offset`, changed files and
+    `removed_files`), or 304 if nothing did. Adding ?wait=<seconds> holds
+    the request until the thread's next checkpoint, up to
+    STATUS_MAX_WAIT_SECONDS, before answering.
+    """
     config = {"configurable": {"thread_id": thread_id}}
-    state = graph_app.get_state(config)
+    if since is not None:
+        if state_versions.latest(thread_id) is None:
+            # Not tracked (first request, or evicted / restarted): start from the stored state.
+            state = await graph_app.aget_state(config)
+            if not state.values:
+                raise HTTPException(status_code=404, detail="Thread not found")
+            record_version(thread_id, state)
+        if wait > 0:
+            await state_versions.wait(thread_id, since, min(wait, STATUS_MAX_WAIT_SECONDS))
+        # Every checkpoint is recorded as it is written, so an unchanged thread is answered from memory.
+        if state_versions.latest(thread_id) == since:
+            return Response(status_code=304)
+
+    state = await graph_app.aget_state(config)
     
     if not state.values:
         raise HTTPException(status_code=404, detail="Thread not found")
-        
-    current_state = state.values
-    next_steps = state.next
-    
-    formatted_messages = [{"role": "user" if isinstance(m, HumanMessage) else "assistant", "content": m.content} for m in state.values.get("messages", [])]
-    
-    # Try to parse terraform_config as JSON for the frontend
-    raw_tf = state.values.get("terraform_config", "{}")
-    terraform_files = parse_json_robustly(raw_tf)
 
-    return {
-        "messages": formatted_messages,
-        "terraform_config": terraform_files,
-        "next_action": state.values.get("next_action", "end"),
-        "waiting_for_approval": state.values.get("next_action") == "approve",
-        "waiting_for_missing_info": state.values.get("next_action") in ["ask_user", "wait_for_input"],
-        "waiting_for_security_review": state.values.get("next_action") == "security_review",
-        "security_issues": state.values.get("security_issues", ""),
-        "security_severity": state.values.get("security_severity", "NONE"),
-    }
+    version = record_version(thread_id, state)
+    if since is None:
+        return {"version": version, **build_status(state.values)}
+    if version == since:
+        return Response(status_code=304)
+    seen = state_versions.get(thread_id, since) if since < version else None
+    return {"version": version, "since": since, **status_delta(state.values, seen)}
+
+@app.get("/chat/{thread_id}/events")
+async def chat_events(thread_id: str, request: Request):
+    """Server-Sent Events stream of a thread's progress.
+
+    Sends a full `snapshot` first, then node_started / node_finished,
+    messages (with the offset to splice at), config, status and
+    run_finished events (run_error if the run raised).
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    # Subscribe before reading state so nothing published in between is lost.
+    queue = event_bus.subscribe(thread_id)
+    state = await graph_app.aget_state(config)
+
+    if not state.values and not run_scheduler.is_pending(thread_id):
+        event_bus.unsubscribe(thread_id, queue)
+        raise HTTPException(status_code=404, detail="Thread not found")
+
+    async def stream():
+        try:
+            snapshot = build_status(state.values)
+            snapshot["running"] = run_scheduler.is_pending(thread_id)
+            yield format_sse("snapshot", snapshot)
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield format_sse(event, data)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            event_bus.unsubscribe(thread_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat/{thread_id}/logs")
+async def chat_logs(thread_id: str, request: Request, offset: int = 0, follow: bool = True):
+    """Chunked NDJSON stream of the thread's terraform plan/apply output.
+
+    Each line is {"offset", "ts", "command", "stream", "line"}; reconnect
+    with ?offset=<last offset + 1> to get only what was missed. If older
+    lines were already dropped from the buffer, the stream starts with
+    {"offset", "dropped"}. With follow (the default) the stream stays open
+    while the thread has a run queued or executing.
+    """
+    if not command_logs.has(thread_id) and not run_scheduler.is_pending(thread_id):
+        state = await graph_app.aget_state({"configurable": {"thread_id": thread_id}})
+        if not state.values:
+            raise HTTPException(status_code=404, detail="Thread not found")
+
+    async def stream():
+        position, idle = max(0, offset), 0
+        while True:
+            lines, next_offset, dropped = command_logs.read(thread_id, position)
+            if dropped:
+                yield json.dumps({"offset": position, "dropped": dropped}) + "\n"
+            if lines:
+                yield "".join(json.dumps(line) + "\n" for line in lines)
+            position = next_offset
+            if not follow:
+                return
+            while not await command_logs.wait(thread_id, position, timeout=1):
+                if not run_scheduler.is_pending(thread_id) or await request.is_disconnected():
+                    return
+                idle += 1
+                if idle % 15 == 0:
+                    yield "\n"  # keep-alive
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat/{thread_id}/trace")
+async def chat_trace(thread_id: str, format: str = "json"):
+    """Span timelines of the thread's recent graph runs.
+
+    Every run lists its node, routing (supervisor), LLM and subprocess spans
+    with parent ids, offsets from the run start and durations.
+    `?format=otlp` returns the finished runs as OTLP-JSON instead.
+    """
+    runs = tracing.tracer.traces(thread_id)
+    if not runs:
+        state = await graph_app.aget_state({"configurable": {"thread_id": thread_id}})
+        if not state.values:
+            raise HTTPException(status_code=404, detail="Thread not found")
+    if format == "otlp":
+        return tracing.tracer.otlp(thread_id)
+    return {"thread_id": thread_id, "runs": runs}
 
 @app.get("/chat/{thread_id}/download")
-async def download_tf(thread_id: str):
+async def download_tf(thread_id: str, request: Request, format: str = "zip"):
+    """The thread's Terraform files as a zip (default), tar.gz or tar.zst archive.
+
+    Archives are cached by content hash; a client sending back the ETag of an
+    unchanged file set gets a 304 without the archive being read.
+    """
+    if format not in archives.available_formats():
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(archives.available_formats())}")
+
     config = {"configurable": {"thread_id": thread_id}}
-    state = graph_app.get_state(config)
+    state = await graph_app.aget_state(config)
     
     if not state.values:
         raise HTTPException(status_code=404, detail="Thread not found")
         
-    raw_tf = state.values.get("terraform_config", "{}")
-    files = parse_json_robustly(raw_tf)
-        
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-        for filename, content in files.items():
-            zip_file.writestr(filename, content)
-            
-    zip_buffer.seek(0)
-    return StreamingResponse(
-        zip_buffer,
-        media_type="application/x-zip-compressed",
-        headers={"Content-Disposition": f"attachment; filename=terraform-{thread_id}.zip"}
-    )
+    files = state.values.get("terraform_config") or {}
+    key = archives.archive_key(files, state.values.get("terraform_hashes"))
+    etag = f'"{key[:40]}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if archives.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    extension, media_type = archives.FORMATS[format]
+    path = await archive_cache.get(files, key, format)
+    return FileResponse(path, media_type=media_type, filename=f"terraform-{thread_id}.{extension}", headers=headers)
 
 @app.post("/chat/{thread_id}/message")
 async def send_message(thread_id: str, req: ChatRequest):
-    import threading
-    
     config = {"configurable": {"thread_id": thread_id}}
-    state = graph_app.get_state(config)
+    state = await graph_app.aget_state(config)
     
     if not state.values:
         raise HTTPException(status_code=404, detail="Thread not found")
@@ -933,62 +1385,39 @@ async def send_message(thread_id: str, req: ChatRequest):
     # If we are in the middle of something, this might be tricky, but usually we are waiting.
     # If waiting for approval, this counts as a revision request.
     
-    current_action = state.values.get("next_action")
-    updates = {
-        "messages": state.values["messages"] + [new_msg],
-        "approve_result": "revise" if current_action == "approve" else state.values.get("approve_result", ""),
-        # If waiting for approval, check intent. Otherwise force revise.
-        "next_action": "check_approval_intent" if current_action == "approve" else "revise"
-    }
+    def updates(values):
+        current_action = values.get("next_action")
+        return {
+            "messages": values["messages"] + [new_msg],
+            # A chat reply to the approval question is classified by check_approval_intent
+            "approve_result": "" if current_action == "approve" else values.get("approve_result", ""),
+            # If waiting for approval, check intent. Otherwise force revise.
+            "next_action": "check_approval_intent" if current_action == "approve" else "revise"
+        }
 
-    graph_app.update_state(config, updates)
-    
-    # Resume graph
-    def resume_graph():
-        try:
-            run_config = {**config, "recursion_limit": 100}
-            for event in graph_app.stream(None, run_config):
-                pass
-        except Exception as e:
-            print(f"Error in graph execution: {e}")
-    
-    thread = threading.Thread(target=resume_graph, daemon=True)
-    thread.start()
+    # Resume graph with the new message, on top of whatever an earlier run added
+    schedule_run(config, updates=updates)
         
     return {"status": "message_received", "action": "revise"}
 
 @app.post("/chat/{thread_id}/approve")
 async def approve_chat(thread_id: str, req: ApproveRequest):
-    import threading
-    
     config = {"configurable": {"thread_id": thread_id}}
-    state = graph_app.get_state(config)
+    state = await graph_app.aget_state(config)
     
     if not state.values:
         raise HTTPException(status_code=404, detail="Thread not found")
         
     decision = "approved" if req.approved else "revise"
     
-    # Update state
-    updates = {"approve_result": decision}
-    
-    # If feedback provided, add it to messages
-    if req.feedback:
-        updates["messages"] = state.values["messages"] + [HumanMessage(content=req.feedback)]
-        
-    graph_app.update_state(config, updates)
-    
-    # Resume graph in background thread
-    def resume_graph():
-        try:
-            run_config = {**config, "recursion_limit": 100}
-            for event in graph_app.stream(None, run_config):
-                pass
-        except Exception as e:
-            print(f"Error in graph execution: {e}")
-    
-    thread = threading.Thread(target=resume_graph, daemon=True)
-    thread.start()
+    # Update state; feedback, if provided, is added to the messages as they are when the run starts
+    def updates(values):
+        if not req.feedback:
+            return {"approve_result": decision}
+        return {"approve_result": decision, "messages": values["messages"] + [HumanMessage(content=req.feedback)]}
+
+    # Resume graph with the decision
+    schedule_run(config, updates=updates)
         
     return {"status": "resumed", "decision": decision}
 
@@ -997,10 +1426,8 @@ class MissingInfoAnswer(BaseModel):
 
 @app.post("/chat/{thread_id}/missing_info")
 async def answer_missing(thread_id: str, req: MissingInfoAnswer):
-    import threading
-    
     config = {"configurable": {"thread_id": thread_id}}
-    state = graph_app.get_state(config)
+    state = await graph_app.aget_state(config)
 
     missing = state.values.get("missing_field")
     if not missing:
@@ -1009,24 +1436,13 @@ async def answer_missing(thread_id: str, req: MissingInfoAnswer):
     # Add user's answer as new message
     new_msg = HumanMessage(content=req.answer)
 
-    graph_app.update_state(config, {
-        "messages": state.values["messages"] + [new_msg],
+    # Resume graph execution with the answer
+    schedule_run(config, updates=lambda values: {
+        "messages": values["messages"] + [new_msg],
         "missing_field": "",
         "missing_question": ""
     })
 
-    # Resume graph execution in background thread
-    def resume_graph():
-        try:
-            run_config = {**config, "recursion_limit": 100}
-            for event in graph_app.stream(None, run_config):
-                pass
-        except Exception as e:
-            print(f"Error in graph execution: {e}")
-    
-    thread = threading.Thread(target=resume_graph, daemon=True)
-    thread.start()
-
     return {"status": "answered", "field": missing}
 
 class SecurityDecision(BaseModel):
@@ -1037,17 +1453,34 @@ class SecurityDecision(BaseModel):
 async def security_decision(thread_id: str, req: SecurityDecision):
     config = {"configurable": {"thread_id": thread_id}}
 
-    graph_app.update_state(config, {
+    schedule_run(config, updates={
         "security_action": req.action
     })
 
-    run_config = {**config, "recursion_limit": 100}
-    for event in graph_app.stream(None, run_config):
-        pass
-
     return {"status": "security decision applied"}
 
 
+@app.get("/stats")
+async def get_stats():
+    stats = {"scheduler": run_scheduler.stats(), "classifier": local_classifier.stats()}
+    if hasattr(memory, "stats"):
+        stats["checkpointer"] = memory.stats()
+    if hasattr(llm, "stats"):
+        stats["llm_cache"] = llm.stats()
+    stats["history"] = history_manager.stats()
+    stats["logging"] = structured_logging.stats()
+    stats["tracing"] = tracing.tracer.stats()
+    stats["command_logs"] = command_logs.stats()
+    stats["archives"] = archive_cache.stats()
+    stats["state_versions"] = state_versions.stats()
+    return stats
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Node, LLM and subprocess latencies in the Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 
 # ======================
 # Main Run
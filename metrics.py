@@ -0,0 +1,265 @@
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+from langgraph.config import get_config
+
+# Latencies here range from sub-millisecond local nodes to multi-minute applies.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.kind = "counter"
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.label_names, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.kind = "histogram"
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    out.append((f"{self.name}_bucket", _labels(self.label_names, key, [f'le="{_number(bound)}"']), cumulative))
+                out.append((f"{self.name}_bucket", _labels(self.label_names, key, ['le="+Inf"']), series[-1]))
+                out.append((f"{self.name}_sum", _labels(self.label_names, key), series[-2]))
+                out.append((f"{self.name}_count", _labels(self.label_names, key), series[-1]))
+        return out
+
+
+class CallbackGauge:
+    """Gauge whose values are read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, callback: Callable[[], Dict[Tuple, float]], labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.kind = "gauge"
+        self.callback = callback
+
+    def samples(self):
+        return [(self.name, _labels(self.label_names, key), value) for key, value in sorted(self.callback().items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, callback, labels=()):
+        return self.register(CallbackGauge(name, help, callback, labels))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+node_duration = registry.histogram(
+    "graph_node_duration_seconds", "Wall-clock time spent in a graph node.", ["node"])
+node_errors = registry.counter(
+    "graph_node_errors_total", "Graph node invocations that raised.", ["node"])
+llm_duration = registry.histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls that reached the model.", ["node", "model"])
+llm_requests = registry.counter(
+    "llm_requests_total", "LLM calls that reached the model, by outcome.", ["node", "model", "outcome"])
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Tokens reported by the model.", ["node", "model", "type"])
+command_duration = registry.histogram(
+    "subprocess_duration_seconds", "Duration of CLI commands run by terraform_utils.", ["command"])
+command_runs = registry.counter(
+    "subprocess_runs_total", "CLI commands run by terraform_utils, by exit code.", ["command", "exit_code"])
+upload_duration = registry.histogram(
+    "gcs_upload_duration_seconds", "Duration of workspace archive uploads to GCS.")
+upload_files = registry.counter(
+    "gcs_upload_files_total", "Files considered by archive uploads, by result.", ["result"])
+upload_bytes = registry.counter(
+    "gcs_upload_bytes_total", "Bytes sent by archive uploads.")
+classifier_decisions = registry.counter(
+    "classifier_decisions_total", "Messages seen by the local classifiers, decided locally or left to the LLM.",
+    ["classifier", "outcome"])
+classifier_confidence = registry.histogram(
+    "classifier_confidence", "Confidence of the local classifiers, by outcome.", ["classifier", "outcome"],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0))
+llm_cache_lookups = registry.counter(
+    "llm_cache_lookups_total", "LLM response cache lookups, by node and outcome.", ["node", "outcome"])
+scheduler_queue_wait = registry.histogram(
+    "scheduler_queue_wait_seconds", "Time graph runs waited in the scheduler queue for a worker.")
+
+
+def current_node() -> str:
+    try:
+        return get_config().get("metadata", {}).get("langgraph_node", "")
+    except RuntimeError:  # called outside a graph run
+        return ""
+
+
+# ======================
+# Graph nodes
+# ======================
+def instrument_node(name: str, fn):
+    """Wraps a (sync or async) node function to record its duration and errors."""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_node(state):
+            started = time.perf_counter()
+            try:
+                return await fn(state)
+            except Exception:
+                node_errors.inc(name)
+                raise
+            finally:
+                node_duration.observe(time.perf_counter() - started, name)
+        return async_node
+
+    @functools.wraps(fn)
+    def node(state):
+        started = time.perf_counter()
+        try:
+            return fn(state)
+        except Exception:
+            node_errors.inc(name)
+            raise
+        finally:
+            node_duration.observe(time.perf_counter() - started, name)
+    return node
+
+
+# ======================
+# LLM calls
+# ======================
+def token_usage(message) -> Tuple[int, int]:
+    """(prompt, completion) tokens from a chat model response, 0 if unknown."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage", {})
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class InstrumentedChatModel:
+    """Records latency, outcome and token counts of every call to a chat model.
+
+    Any other attribute is forwarded to the wrapped model.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    @property
+    def model(self) -> str:
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None) or type(self.llm).__name__
+
+    def _record(self, node, started, result=None, error=False):
+        llm_duration.observe(time.perf_counter() - started, node, self.model)
+        llm_requests.inc(node, self.model, "error" if error else "ok")
+        if result is not None:
+            prompt, completion = token_usage(result)
+            llm_tokens.inc(node, self.model, "prompt", amount=prompt)
+            llm_tokens.inc(node, self.model, "completion", amount=completion)
+
+    def invoke(self, messages, *args, **kwargs):
+        node, started = current_node(), time.perf_counter()
+        try:
+            result = self.llm.invoke(messages, *args, **kwargs)
+        except Exception:
+            self._record(node, started, error=True)
+            raise
+        self._record(node, started, result)
+        return result
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        node, started = current_node(), time.perf_counter()
+        try:
+            result = await self.llm.ainvoke(messages, *args, **kwargs)
+        except Exception:
+            self._record(node, started, error=True)
+            raise
+        self._record(node, started, result)
+        return result
+
+
+# ======================
+# Subprocesses
+# ======================
+def command_label(command) -> str:
+    """Low-cardinality label for a CLI command: the tool and its subcommand."""
+    words = command.split() if isinstance(command, str) else list(command)
+    words = [w for w in words[:3] if not w.startswith("-")]
+    return " ".join(words[:2])
+
+
+def record_command(command, duration: float, exit_code):
+    label = command_label(command)
+    command_duration.observe(duration, label)
+    command_runs.inc(label, str(exit_code))
+
+
+def record_upload(duration: float, counts: dict):
+    upload_duration.observe(duration)
+    upload_files.inc("uploaded", amount=counts["uploaded"])
+    upload_files.inc("unchanged", amount=counts["unchanged"])
+    upload_bytes.inc(amount=counts["bytes"])
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFull(Exception):
+    """Raised when the run queue is at capacity."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Graph run queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class GraphRunScheduler:
+    """Bounded FIFO scheduler for graph runs.
+
+    A fixed pool of worker tasks pulls runs off a FIFO queue, so at most
+    `workers` graph runs execute at once. Runs for the same thread are never
+    executed concurrently; a run submitted while its thread is busy waits
+    until the earlier one finishes.
+    """
+
+    def __init__(self, runner, workers: int = 8, max_queue: int = 200):
+        self.runner = runner  # async callable: runner(inputs, config, updates); updates may be a function of the state
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+
+        self._queue = None
+        self._worker_tasks = []
+        self._active_threads = set()
+        self._deferred = {}  # thread_id -> deque of jobs waiting on that thread
+        self._pending = {}  # thread_id -> runs submitted but not yet finished
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+        self.max_wait = 0.0
+
+    def _ensure_workers(self):
+        """Starts the worker pool on the running loop the first time it's needed."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._worker_tasks:
+            self._worker_tasks = [
+                asyncio.create_task(self._worker(), name=f"graph-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    def depth(self) -> int:
+        """Runs admitted but not yet started."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + sum(len(jobs) for jobs in self._deferred.values())
+
+    def is_pending(self, thread_id: str) -> bool:
+        """True while the thread has a run queued or executing."""
+        return thread_id in self._pending
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a queue slot frees up."""
+        avg_run = sum(self._run_times) / len(self._run_times) if self._run_times else 5.0
+        return max(1, min(120, math.ceil(avg_run * (self.depth() + 1) / self.workers)))
+
+    def submit(self, thread_id: str, inputs, config, updates=None):
+        """Queues a graph run, raising SchedulerFull if the queue is at capacity."""
+        self._ensure_workers()
+        if self.depth() >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerFull(self.retry_after())
+
+        self.submitted += 1
+        self._pending[thread_id] = self._pending.get(thread_id, 0) + 1
+        self._queue.put_nowait((thread_id, inputs, config, updates, time.monotonic()))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            thread_id = job[0]
+            if thread_id in self._active_threads:
+                self._deferred.setdefault(thread_id, deque()).append(job)
+                continue
+
+            self._active_threads.add(thread_id)
+            try:
+                while job is not None:
+                    await self._run(job)
+                    pending = self._deferred.get(thread_id)
+                    job = pending.popleft() if pending else None
+                    if pending is not None and not pending:
+                        del self._deferred[thread_id]
+            finally:
+                self._active_threads.discard(thread_id)
+
+    async def _run(self, job):
+        thread_id, inputs, config, updates, enqueued_at = job
+        started = time.monotonic()
+        wait = started - enqueued_at
+        self._wait_times.append(wait)
+        self.max_wait = max(self.max_wait, wait)
+        metrics.scheduler_queue_wait.observe(wait)
+
+        self.running += 1
+        try:
+            await self.runner(inputs, config, updates)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"[scheduler] Run for thread {thread_id} failed: {e}")
+        finally:
+            self.running -= 1
+            self._run_times.append(time.monotonic() - started)
+            remaining = self._pending.get(thread_id, 1) - 1
+            if remaining > 0:
+                self._pending[thread_id] = remaining
+            else:
+                self._pending.pop(thread_id, None)
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+
+        def pct(p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 4)
+
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.depth(),
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_seconds_p50": pct(0.50),
+            "wait_seconds_p95": pct(0.95),
+            "wait_seconds_max": round(self.max_wait, 4),
+        }
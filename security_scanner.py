@@ -0,0 +1,243 @@
+import re
+from typing import Dict, List
+
+import hcl_utils as hcl
+
+SEVERITY_ORDER = ["NONE", "LOW", "MEDIUM", "HIGH"]
+
+PUBLIC_ACLS = {"public-read", "public-read-write", "authenticated-read"}
+PUBLIC_MEMBERS = {"allUsers", "allAuthenticatedUsers"}
+PUBLIC_PREDEFINED_ACLS = {"publicRead", "publicReadWrite"}  # GCS predefined_acl values
+OPEN_CIDRS = {"0.0.0.0/0", "::/0"}
+ADMIN_PORTS = {22, 3389}
+PRIMITIVE_ROLES = {"roles/owner": "HIGH", "roles/editor": "MEDIUM"}
+
+
+def finding(rule, severity, filename, block, message):
+    return {
+        "rule": rule,
+        "severity": severity,
+        "file": filename,
+        "line": block.line,
+        "resource": ".".join(block.labels),
+        "message": message,
+    }
+
+
+# ======================
+# Rule Pack
+# ======================
+# Each rule gets (filename, resource block, all resource blocks) and yields findings.
+
+def public_bucket_acl(filename, block, resources):
+    rtype = block.labels[0]
+    if rtype in ("aws_s3_bucket", "aws_s3_bucket_acl"):
+        acl = set(hcl.string_values(hcl.attribute(block, "acl")))
+        if acl & PUBLIC_ACLS:
+            yield finding("PUBLIC_BUCKET_ACL", "HIGH", filename, block,
+                          f"S3 bucket ACL '{sorted(acl & PUBLIC_ACLS)[0]}' makes objects publicly readable")
+    if rtype == "aws_s3_bucket_public_access_block":
+        disabled = [a for a in ("block_public_acls", "block_public_policy", "ignore_public_acls", "restrict_public_buckets")
+                    if hcl.is_false(hcl.attribute(block, a))]
+        if disabled:
+            yield finding("PUBLIC_BUCKET_ACL", "MEDIUM", filename, block,
+                          f"S3 public access block disables {', '.join(disabled)}")
+    if rtype.startswith("google_storage_") or rtype.endswith(("_iam_member", "_iam_binding")):
+        members = set(hcl.string_values(hcl.attribute(block, "member")))
+        members |= set(hcl.string_values(hcl.attribute(block, "members")))
+        members |= set(hcl.string_values(hcl.attribute(block, "entity")))
+        # role_entity entries look like "READER:allUsers"
+        members |= {entry.rpartition(":")[2] for entry in hcl.string_values(hcl.attribute(block, "role_entity"))}
+        if members & PUBLIC_MEMBERS or any(m.startswith(("allUsers", "allAuthenticatedUsers")) for m in members):
+            yield finding("PUBLIC_BUCKET_ACL", "HIGH", filename, block,
+                          "Grants access to allUsers/allAuthenticatedUsers (public access)")
+        predefined = set(hcl.string_values(hcl.attribute(block, "predefined_acl"))) & PUBLIC_PREDEFINED_ACLS
+        if predefined:
+            yield finding("PUBLIC_BUCKET_ACL", "HIGH", filename, block,
+                          f"Predefined ACL '{sorted(predefined)[0]}' makes objects publicly readable")
+
+
+def _ports(block):
+    """Port range covered by an ingress rule, or None if it covers all ports."""
+    protocol = "".join(hcl.string_values(hcl.attribute(block, "protocol"))) or (hcl.attribute(block, "protocol") or "")
+    if protocol.strip() in ("-1", "all"):
+        return None
+    try:
+        low = int((hcl.attribute(block, "from_port") or "").strip())
+        high = int((hcl.attribute(block, "to_port") or "").strip())
+    except ValueError:
+        return None
+    return range(low, high + 1) if (low, high) != (0, 0) and (low, high) != (0, 65535) else None
+
+
+def _open_ingress_severity(ports):
+    if ports is None or any(p in ports for p in ADMIN_PORTS):
+        return "HIGH"
+    return "MEDIUM"
+
+
+def open_ingress(filename, block, resources):
+    rtype = block.labels[0]
+    if rtype == "aws_security_group":
+        for rule in hcl.nested_blocks(block, "ingress"):
+            cidrs = set(hcl.string_values(hcl.attribute(rule, "cidr_blocks")))
+            cidrs |= set(hcl.string_values(hcl.attribute(rule, "ipv6_cidr_blocks")))
+            if cidrs & OPEN_CIDRS:
+                ports = _ports(rule)
+                yield finding("OPEN_INGRESS", _open_ingress_severity(ports), filename, rule._replace(labels=block.labels),
+                              f"Ingress open to the internet ({describe_ports(ports)})")
+    elif rtype == "aws_security_group_rule" and "ingress" in hcl.string_values(hcl.attribute(block, "type")):
+        cidrs = set(hcl.string_values(hcl.attribute(block, "cidr_blocks")))
+        cidrs |= set(hcl.string_values(hcl.attribute(block, "ipv6_cidr_blocks")))
+        if cidrs & OPEN_CIDRS:
+            ports = _ports(block)
+            yield finding("OPEN_INGRESS", _open_ingress_severity(ports), filename, block,
+                          f"Ingress open to the internet ({describe_ports(ports)})")
+    elif rtype == "aws_vpc_security_group_ingress_rule":
+        cidrs = set(hcl.string_values(hcl.attribute(block, "cidr_ipv4")))
+        cidrs |= set(hcl.string_values(hcl.attribute(block, "cidr_ipv6")))
+        if cidrs & OPEN_CIDRS:
+            ports = _ports(block) if hcl.attribute(block, "from_port") else None
+            yield finding("OPEN_INGRESS", _open_ingress_severity(ports), filename, block,
+                          f"Ingress open to the internet ({describe_ports(ports)})")
+    elif rtype == "google_compute_firewall":
+        direction = "".join(hcl.string_values(hcl.attribute(block, "direction"))).upper()
+        if direction != "EGRESS" and set(hcl.string_values(hcl.attribute(block, "source_ranges"))) & OPEN_CIDRS:
+            allows = hcl.nested_blocks(block, "allow")
+            if not allows:
+                return  # deny-only rules block traffic, they don't expose anything
+            ports = set()
+            all_ports = False
+            for allow in allows:
+                values = hcl.string_values(hcl.attribute(allow, "ports"))
+                if not values:
+                    all_ports = True
+                for value in values:
+                    low, _, high = value.partition("-")
+                    if low.isdigit():
+                        ports.update(range(int(low), int(high or low) + 1))
+            ports = None if all_ports or not ports else ports
+            yield finding("OPEN_INGRESS", _open_ingress_severity(ports), filename, block,
+                          f"Firewall allows traffic from 0.0.0.0/0 ({describe_ports(ports)})")
+
+
+def describe_ports(ports):
+    if ports is None:
+        return "all ports"
+    ports = sorted(ports)
+    return f"port {ports[0]}" if len(ports) == 1 else f"ports {ports[0]}-{ports[-1]}"
+
+
+def unencrypted_storage(filename, block, resources):
+    rtype = block.labels[0]
+    if rtype == "aws_ebs_volume" and not hcl.is_true(hcl.attribute(block, "encrypted")):
+        yield finding("UNENCRYPTED_STORAGE", "MEDIUM", filename, block, "EBS volume is not encrypted")
+    elif rtype in ("aws_db_instance", "aws_rds_cluster") and not hcl.is_true(hcl.attribute(block, "storage_encrypted")):
+        yield finding("UNENCRYPTED_STORAGE", "MEDIUM", filename, block, "Database storage is not encrypted")
+    elif rtype == "aws_instance":
+        for kind in ("root_block_device", "ebs_block_device"):
+            for device in hcl.nested_blocks(block, kind):
+                if hcl.is_false(hcl.attribute(device, "encrypted")):
+                    yield finding("UNENCRYPTED_STORAGE", "MEDIUM", filename, device._replace(labels=block.labels),
+                                  f"{kind} has encryption disabled")
+    elif rtype == "aws_s3_bucket":
+        name = block.labels[1] if len(block.labels) > 1 else ""
+        has_sse = hcl.nested_blocks(block, "server_side_encryption_configuration") or any(
+            r.labels[0] == "aws_s3_bucket_server_side_encryption_configuration"
+            and re.search(rf"aws_s3_bucket\.{re.escape(name)}\b", r.body)
+            for _, r in resources
+        )
+        if not has_sse:
+            yield finding("UNENCRYPTED_STORAGE", "LOW", filename, block,
+                          "S3 bucket has no explicit server-side encryption configuration")
+    elif rtype in ("google_compute_disk", "google_storage_bucket"):
+        key_block = "disk_encryption_key" if rtype == "google_compute_disk" else "encryption"
+        if not hcl.nested_blocks(block, key_block):
+            yield finding("UNENCRYPTED_STORAGE", "LOW", filename, block,
+                          "Uses Google-managed keys only; consider a customer-managed encryption key")
+
+
+def public_ip(filename, block, resources):
+    rtype = block.labels[0]
+    if rtype == "aws_instance" and hcl.is_true(hcl.attribute(block, "associate_public_ip_address")):
+        yield finding("PUBLIC_IP", "MEDIUM", filename, block, "Instance gets a public IP address")
+    elif rtype == "aws_subnet" and hcl.is_true(hcl.attribute(block, "map_public_ip_on_launch")):
+        yield finding("PUBLIC_IP", "MEDIUM", filename, block, "Subnet assigns public IPs on launch")
+    elif rtype in ("aws_db_instance", "aws_rds_cluster_instance") and hcl.is_true(hcl.attribute(block, "publicly_accessible")):
+        yield finding("PUBLIC_IP", "HIGH", filename, block, "Database is publicly accessible")
+    elif rtype in ("google_compute_instance", "google_compute_instance_template"):
+        for nic in hcl.nested_blocks(block, "network_interface"):
+            if hcl.nested_blocks(nic, "access_config"):
+                yield finding("PUBLIC_IP", "MEDIUM", filename, nic._replace(labels=block.labels),
+                              "network_interface has an access_config, which assigns an external IP")
+    elif rtype == "google_sql_database_instance":
+        for settings in hcl.nested_blocks(block, "settings"):
+            for ip in hcl.nested_blocks(settings, "ip_configuration"):
+                if hcl.is_true(hcl.attribute(ip, "ipv4_enabled")):
+                    yield finding("PUBLIC_IP", "MEDIUM", filename, ip._replace(labels=block.labels),
+                                  "Cloud SQL instance has a public IPv4 address")
+
+
+WILDCARD_ACTION_RE = re.compile(r'"?Action"?\s*[:=]\s*(\[\s*)?"\*"')
+
+
+def wildcard_iam(filename, block, resources):
+    rtype = block.labels[0]
+    if block.kind == "data" and rtype == "aws_iam_policy_document":
+        for statement in hcl.nested_blocks(block, "statement"):
+            actions = hcl.string_values(hcl.attribute(statement, "actions"))
+            if "*" in actions:
+                yield finding("WILDCARD_IAM", "HIGH", filename, statement._replace(labels=block.labels),
+                              "IAM policy statement allows all actions (\"*\")")
+            elif any(a.endswith(":*") for a in actions):
+                yield finding("WILDCARD_IAM", "MEDIUM", filename, statement._replace(labels=block.labels),
+                              f"IAM policy statement allows service-wide wildcard actions ({', '.join(a for a in actions if a.endswith(':*'))})")
+    elif rtype.startswith("aws_iam_") and WILDCARD_ACTION_RE.search(block.body):
+        yield finding("WILDCARD_IAM", "HIGH", filename, block, "IAM policy allows all actions (\"Action\": \"*\")")
+    elif rtype.startswith("google_") and rtype.endswith(("_iam_member", "_iam_binding")):
+        role = "".join(hcl.string_values(hcl.attribute(block, "role")))
+        if role in PRIMITIVE_ROLES:
+            yield finding("WILDCARD_IAM", PRIMITIVE_ROLES[role], filename, block,
+                          f"Grants primitive role {role}; prefer a narrower predefined role")
+
+
+RULES = [public_bucket_acl, open_ingress, unencrypted_storage, public_ip, wildcard_iam]
+
+
+# ======================
+# Scanner
+# ======================
+def scan(files: Dict[str, str]) -> dict:
+    """Runs the rule pack over {filename: content}.
+
+    Returns the overall severity, human-readable issue lines and the
+    structured findings (rule, severity, file, line, resource, message).
+    """
+    resources = []
+    for filename, content in files.items():
+        if not isinstance(content, str):
+            continue
+        for block in hcl.blocks(content):
+            if block.kind in ("resource", "data") and block.labels:
+                resources.append((filename, block))
+
+    findings: List[dict] = []
+    for filename, block in resources:
+        for rule in RULES:
+            findings.extend(rule(filename, block, resources))
+
+    findings.sort(key=lambda f: (-SEVERITY_ORDER.index(f["severity"]), f["file"], f["line"]))
+    return {
+        "severity": max((f["severity"] for f in findings), key=SEVERITY_ORDER.index, default="NONE"),
+        "issues": [format_finding(f) for f in findings],
+        "findings": findings,
+    }
+
+
+def format_finding(f: dict) -> str:
+    return f"[{f['severity']}] {f['file']}:{f['line']} {f['resource']}: {f['message']} ({f['rule']})"
+
+
+def max_severity(*severities: str) -> str:
+    known = [s for s in severities if s in SEVERITY_ORDER]
+    return max(known, key=SEVERITY_ORDER.index, default="NONE")
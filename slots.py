@@ -0,0 +1,107 @@
+import re
+from typing import Dict, Optional
+
+# Slots understand_request extracts, in the order missing_info_agent asks for them.
+SLOTS = ["provider", "region", "instance_type", "resource_type"]
+
+# Answers longer than this are left to the LLM; a short reply to a question
+# ("us-east-1", "t3.micro please") is almost always just the value.
+MAX_ANSWER_WORDS = 8
+
+PROVIDER_ALIASES = {
+    "AWS": ["aws", "amazon", "amazon web services", "ec2", "s3"],
+    "GCP": ["gcp", "google", "google cloud", "gcloud", "gce", "gcs", "gke"],
+    "Azure": ["azure", "microsoft", "microsoft azure"],
+}
+
+DIRECTIONS = r"(?:north|south|east|west|central|northeast|southeast|northwest|southwest)"
+AWS_REGION_RE = re.compile(rf"\b((?:us|eu|ap|sa|ca|me|af|il|mx)-(?:gov-)?{DIRECTIONS}-\d)\b")
+GCP_REGION_RE = re.compile(
+    rf"\b((?:us|europe|asia|australia|northamerica|southamerica|me|africa)-{DIRECTIONS}\d{{1,2}})\b"
+)
+AZURE_REGIONS = {
+    "eastus", "eastus2", "westus", "westus2", "westus3", "centralus", "northcentralus", "southcentralus",
+    "westcentralus", "canadacentral", "canadaeast", "brazilsouth", "northeurope", "westeurope",
+    "uksouth", "ukwest", "francecentral", "germanywestcentral", "swedencentral", "switzerlandnorth",
+    "norwayeast", "eastasia", "southeastasia", "japaneast", "japanwest", "koreacentral",
+    "australiaeast", "australiasoutheast", "centralindia", "southindia", "uaenorth", "southafricanorth",
+}
+
+AWS_INSTANCE_RE = re.compile(
+    r"\b([a-z][a-z0-9]{0,5}\d[a-z0-9]*)\.?((?:nano|micro|small|medium|large|metal|\d*xlarge))\b"
+)
+GCP_INSTANCE_RE = re.compile(
+    r"\b((?:e2|n1|n2|n2d|n4|c2|c2d|c3|c3d|t2a|t2d|m1|m2|m3|a2|g2)-"
+    r"(?:standard|highmem|highcpu|micro|small|medium|ultramem|megamem)(?:-\d+)?|f1-micro|g1-small)\b"
+)
+AZURE_INSTANCE_RE = re.compile(r"\b(standard_[a-z]+\d+[a-z0-9_]*)\b", re.IGNORECASE)
+
+
+def provider_for_region(region: str) -> str:
+    if AWS_REGION_RE.fullmatch(region):
+        return "AWS"
+    if GCP_REGION_RE.fullmatch(region):
+        return "GCP"
+    if region in AZURE_REGIONS:
+        return "Azure"
+    return ""
+
+
+def find_provider(text: str) -> Optional[str]:
+    padded = f" {' '.join(re.findall(r'[a-z0-9]+', text.lower()))} "
+    found = {name for name, aliases in PROVIDER_ALIASES.items() if any(f" {a} " in padded for a in aliases)}
+    return found.pop() if len(found) == 1 else None
+
+
+def find_region(text: str) -> Optional[str]:
+    lowered = text.lower()
+    found = set(AWS_REGION_RE.findall(lowered)) | set(GCP_REGION_RE.findall(lowered))
+    found |= {word for word in re.findall(r"[a-z0-9]+", lowered) if word in AZURE_REGIONS}
+    return found.pop() if len(found) == 1 else None
+
+
+def find_instance_type(text: str) -> Optional[str]:
+    lowered = text.lower()
+    found = {f"{family}.{size}" for family, size in AWS_INSTANCE_RE.findall(lowered)}
+    found |= set(GCP_INSTANCE_RE.findall(lowered))
+    found |= {"Standard_" + m[len("standard_"):] for m in AZURE_INSTANCE_RE.findall(text)}
+    return found.pop() if len(found) == 1 else None
+
+
+FINDERS = {
+    "provider": find_provider,
+    "region": find_region,
+    "instance_type": find_instance_type,
+}
+
+
+def normalize_answer(field: str, text: str, current: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Fills the asked-for slot from a short answer without the LLM.
+
+    Every finder runs, so an answer that also names another value
+    ("us-east-1 with a t3.micro") fills both slots. Returns the slots that
+    could be read unambiguously (a region also implies its provider when
+    none is known yet), or {} when the answer should go to the LLM: the
+    asked slot isn't in it, or a named provider contradicts the region.
+    """
+    if field not in FINDERS or not text or len(text.split()) > MAX_ANSWER_WORDS:
+        return {}
+    slots = {slot: value for slot, finder in FINDERS.items() if (value := finder(text))}
+    if field not in slots:
+        return {}
+    implied = provider_for_region(slots["region"]) if "region" in slots else ""
+    if implied and slots.get("provider", implied) != implied:
+        return {}
+    if implied and "provider" not in slots and not (current or {}).get("provider"):
+        slots["provider"] = implied
+    return slots
+
+
+def merge_slots(current: Dict[str, str], update: Dict[str, str]) -> Dict[str, str]:
+    """Non-empty values in update replace the current ones; nothing is cleared."""
+    merged = dict(current)
+    for slot in SLOTS:
+        value = update.get(slot)
+        if isinstance(value, str) and value.strip():
+            merged[slot] = value.strip()
+    return merged
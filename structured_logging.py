@@ -0,0 +1,141 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from langgraph.config import get_config
+
+LOG_FILE = os.getenv("LOG_FILE", "backend.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1") != "0"
+# Share of verbose records (logged with extra={"verbose": True}, e.g. full
+# LLM responses) that are kept.
+LOG_VERBOSE_SAMPLE_RATE = float(os.getenv("LOG_VERBOSE_SAMPLE_RATE", "0.1"))
+
+# thread_id for records logged outside a graph node (run_graph, endpoints)
+_thread_id = contextvars.ContextVar("log_thread_id", default="")
+
+
+def bind_thread(thread_id: str):
+    """Tags records logged from the current context with thread_id."""
+    return _thread_id.set(thread_id)
+
+
+class ContextFilter(logging.Filter):
+    """Adds thread_id and node to each record and samples verbose records.
+
+    Runs in the caller's thread before the record is queued, so the
+    LangGraph run config (and with it the graph node) is still available.
+    """
+
+    def __init__(self, sample_rate: float = LOG_VERBOSE_SAMPLE_RATE):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if getattr(record, "verbose", False) and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        thread_id, node = _thread_id.get(), ""
+        try:
+            config = get_config()
+            node = config.get("metadata", {}).get("langgraph_node", "")
+            thread_id = config.get("configurable", {}).get("thread_id", thread_id)
+        except RuntimeError:  # not inside a graph run
+            pass
+        if not getattr(record, "thread_id", ""):
+            record.thread_id = thread_id
+        if not getattr(record, "node", ""):
+            record.node = node
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread_id": getattr(record, "thread_id", ""),
+            "node": getattr(record, "node", ""),
+            "msg": record.getMessage().strip(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_handler = None
+_listener = None
+
+
+def configure_logging():
+    """Routes all logging through a bounded queue to a background writer thread.
+
+    The writer appends JSON lines to LOG_FILE with size-based rotation and,
+    unless LOG_CONSOLE=0, also prints plain lines to stderr. Safe to call
+    more than once.
+    """
+    global _handler, _listener
+    if _handler is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter())
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if LOG_CONSOLE:
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+        handlers.append(console)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # flushes what is still queued
+
+
+def stats() -> dict:
+    if _handler is None:
+        return {}
+    context = _handler.filters[0]
+    return {
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "verbose_sampled_out": context.sampled_out,
+        "verbose_sample_rate": context.sample_rate,
+    }
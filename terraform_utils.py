@@ -1,36 +1,281 @@
-import subprocess
+import asyncio
 import os
+import signal
+import sys
 import json
 import logging
+import tempfile
+import re
+import hashlib
+import time
+import weakref
+
+import gcs_upload
+import hcl_utils as hcl
+import metrics
+import tracing
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def run_command(command, cwd):
-    """Runs a shell command and returns output or raises error."""
-    try:
-        result = subprocess.run(
-            command,
-            cwd=cwd,
-            shell=True,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+# Providers are shared across sessions instead of downloaded per workspace.
+TF_PLUGIN_CACHE_DIR = os.getenv("TF_PLUGIN_CACHE_DIR", "/tmp/terraform-bot/plugin-cache")
+# Optional local mirror (populated by `python terraform_utils.py prewarm`);
+# provider versions found there are installed from disk, any others from the registry.
+TF_PROVIDER_MIRROR_DIR = os.getenv("TF_PROVIDER_MIRROR_DIR", "")
+# Where the bot writes its CLI config; terraform subprocesses get it as TF_CLI_CONFIG_FILE.
+TF_BOT_CLI_CONFIG_FILE = os.getenv("TF_BOT_CLI_CONFIG_FILE", "/tmp/terraform-bot/terraformrc")
+# The operator's own CLI config (credentials, mirrors) is merged into it, never overwritten.
+OPERATOR_CLI_CONFIG_FILE = os.getenv("TF_CLI_CONFIG_FILE") or os.path.expanduser("~/.terraformrc")
+_cli_config = None
+
+# Written after a successful init; init reruns only when the fingerprint changes.
+INIT_FINGERPRINT_FILE = os.path.join(".terraform", ".bot-init-fingerprint")
+
+# The plan is exported as JSON once; cost estimation and other consumers read it.
+PLAN_FILE = "tfplan"
+PLAN_JSON_FILE = "tfplan.json"
+
+# Commands are killed after these many seconds (per tool and subcommand).
+COMMAND_TIMEOUT_SECONDS = float(os.getenv("COMMAND_TIMEOUT_SECONDS", "600"))
+COMMAND_TIMEOUTS = {
+    "terraform init": float(os.getenv("TF_INIT_TIMEOUT_SECONDS", "300")),
+    "terraform plan": float(os.getenv("TF_PLAN_TIMEOUT_SECONDS", "900")),
+    "terraform apply": float(os.getenv("TF_APPLY_TIMEOUT_SECONDS", "1800")),
+    "infracost breakdown": float(os.getenv("INFRACOST_TIMEOUT_SECONDS", "180")),
+}
+COMMAND_KILL_GRACE_SECONDS = float(os.getenv("COMMAND_KILL_GRACE_SECONDS", "10"))
+# Output beyond this (per stream) is spilled to a file instead of kept in memory.
+COMMAND_MAX_OUTPUT_BYTES = int(os.getenv("COMMAND_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+COMMAND_SPILL_DIR = os.getenv("COMMAND_SPILL_DIR", "/tmp/terraform-bot/command-output")
+
+PREWARM_PROVIDERS = {
+    "google": "hashicorp/google",
+    "aws": "hashicorp/aws",
+}
+
+class CommandError(Exception):
+    """A command exited non-zero (with check=True), could not start, or timed out."""
+
+    def __init__(self, message, returncode=None, stdout="", stderr=""):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+class CommandTimeout(CommandError):
+    pass
+
+class OutputCapture:
+    """Collects one output stream of a command.
+
+    Up to max_bytes are kept in memory. Beyond that the whole stream is
+    spilled to a file under COMMAND_SPILL_DIR and only its head and tail
+    stay in memory; text() then marks the gap and names the file.
+    """
+
+    def __init__(self, label, max_bytes=COMMAND_MAX_OUTPUT_BYTES):
+        self.label = label
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.spill_path = None
+        self._spill = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        keep = self.max_bytes // 2
+        if self._spill is None:
+            if self.size <= self.max_bytes:
+                self.head += chunk
+                return
+            os.makedirs(COMMAND_SPILL_DIR, exist_ok=True)
+            prefix = re.sub(r"[^A-Za-z0-9_.-]", "-", self.label)[:40] + "-"
+            fd, self.spill_path = tempfile.mkstemp(prefix=prefix, suffix=".log", dir=COMMAND_SPILL_DIR)
+            self._spill = os.fdopen(fd, "wb")
+            self._spill.write(self.head)
+            self.head += chunk
+            self.tail = self.head[keep:]
+            del self.head[keep:]
+        else:
+            self.tail += chunk
+        self._spill.write(chunk)
+        if len(self.tail) > keep:
+            del self.tail[:len(self.tail) - keep]
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def text(self):
+        if self.spill_path is None:
+            return self.head.decode(errors="replace")
+        skipped = self.size - len(self.head) - len(self.tail)
+        return (
+            self.head.decode(errors="replace")
+            + f"\n... [{skipped} bytes omitted, full output in {self.spill_path}] ...\n"
+            + self.tail.decode(errors="replace")
         )
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Command failed: {e.cmd}\nStderr: {e.stderr}")
-        raise Exception(f"Command failed: {e.stderr}")
 
-def write_terraform_files(cwd, files):
-    """Writes Terraform files from a dictionary to the specified directory."""
+async def _pump(stream, sink, name, on_line):
+    """Copies a pipe into sink, calling on_line(name, line) for each complete line."""
+    partial = b""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        sink.write(chunk)
+        if on_line is not None:
+            *lines, partial = (partial + chunk).split(b"\n")
+            for line in lines:
+                on_line(name, line.decode(errors="replace"))
+    if on_line is not None and partial:
+        on_line(name, partial.decode(errors="replace"))
+
+async def _terminate(process):
+    """SIGTERM to the command's process group (terraform then releases its state lock), SIGKILL after a grace period."""
+    for sig, grace in ((signal.SIGTERM, COMMAND_KILL_GRACE_SECONDS), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+async def run_command_async(argv, cwd, env=None, check=True, timeout=None, on_line=None,
+                            stdout_path=None, max_output=COMMAND_MAX_OUTPUT_BYTES):
+    """Runs argv (no shell) and returns its stdout.
+
+    Output is read as it is produced: on_line(stream, line) is called for
+    every stdout/stderr line, and each stream is capped at max_output bytes
+    in memory (see OutputCapture). With stdout_path, stdout is written to
+    that file instead and "" is returned. The command is killed after
+    timeout seconds (default from COMMAND_TIMEOUTS) with CommandTimeout, or
+    when the awaiting task is cancelled. With check=False the output is
+    returned even when the command fails (e.g. `terraform validate -json`
+    exits 1 but still prints its report).
+    """
+    label = metrics.command_label(argv)
+    if timeout is None:
+        timeout = COMMAND_TIMEOUTS.get(label, COMMAND_TIMEOUT_SECONDS)
+    started = time.perf_counter()
+    exit_code = "error"  # could not be started
+    stdout = open(stdout_path, "wb") if stdout_path else OutputCapture(label, max_output)
+    stderr = OutputCapture(label, max_output)
+    with tracing.tracer.span(label, "subprocess") as span:
+        try:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *argv, cwd=cwd, env=env, stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True,  # own process group, so children are killed too
+                )
+            except OSError as e:
+                logger.error(f"Command could not start: {argv[0]}: {e}")
+                raise CommandError(f"Command failed: {e}") from e
+            readers = asyncio.gather(
+                _pump(process.stdout, stdout, "stdout", on_line),
+                _pump(process.stderr, stderr, "stderr", on_line),
+                process.wait(),
+            )
+            readers.add_done_callback(lambda f: f.cancelled() or f.exception())
+            try:
+                await asyncio.wait_for(asyncio.shield(readers), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                exit_code = "timeout" if isinstance(e, asyncio.TimeoutError) else "cancelled"
+                await _terminate(process)
+                # the pipes close with the process group; keep what it printed last
+                await asyncio.wait([readers], timeout=1)
+                readers.cancel()
+                if exit_code == "cancelled":
+                    raise
+                logger.error(f"Command timed out after {timeout}s: {' '.join(argv)}")
+                raise CommandTimeout(f"Command timed out after {timeout}s: {label}", stderr=stderr.text())
+            exit_code = process.returncode
+        finally:
+            stdout.close()
+            stderr.close()
+            span["attributes"]["exit_code"] = exit_code
+            metrics.record_command(argv, time.perf_counter() - started, exit_code)
+
+    output = "" if stdout_path else stdout.text()
+    if check and process.returncode != 0:
+        logger.error(f"Command failed: {' '.join(argv)}\nStderr: {stderr.text()}")
+        raise CommandError(f"Command failed: {stderr.text()}", process.returncode, output, stderr.text())
+    return output
+
+def run_command(argv, cwd, env=None, check=True, **kwargs):
+    """Blocking run_command_async, for callers without an event loop (e.g. prewarm)."""
+    return asyncio.run(run_command_async(argv, cwd, env=env, check=check, **kwargs))
+
+def normalize_terraform_files(data):
+    """Validates a parsed {filename: content} mapping produced by the LLM.
+
+    Only plain file names (no directories, no dotfiles) with string content
+    are kept, so the mapping is safe to write into a workspace. Raises
+    ValueError when nothing usable is left.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Terraform config is not a {filename: content} mapping")
+    files = {}
+    for name, content in data.items():
+        if not isinstance(name, str) or not isinstance(content, str):
+            continue
+        name = name.strip()
+        if not name or name != os.path.basename(name) or name.startswith("."):
+            continue
+        files[name] = content
+    if not files:
+        raise ValueError("Terraform config contains no usable files")
+    return files
+
+def file_hashes(files):
+    """sha256 of each file's content, keyed by file name."""
+    return {name: hashlib.sha256(content.encode()).hexdigest() for name, content in files.items()}
+
+def write_terraform_files(cwd, files, prune=False):
+    """Writes Terraform files from a dictionary to the specified directory.
+
+    With prune=True, .tf files left over from an earlier revision are removed.
+    """
     os.makedirs(cwd, exist_ok=True)
+    if prune:
+        for name in os.listdir(cwd):
+            if name.endswith(".tf") and name not in files:
+                os.remove(os.path.join(cwd, name))
     for filename, content in files.items():
-        with open(os.path.join(cwd, filename), "w") as f:
+        path = os.path.join(cwd, filename)
+        # Unchanged files are left alone so their mtimes stay put
+        if os.path.exists(path):
+            with open(path) as f:
+                if f.read() == content:
+                    continue
+        with open(path, "w") as f:
             f.write(content)
 
+def merge_file_changes(files, changes):
+    """Merges a partial revision ({filename: new content, or None to delete}) into files.
+
+    Returns (merged, changed, deleted); files that aren't mentioned, or come
+    back identical, are kept as they are. Raises ValueError if the reply
+    isn't a mapping or would leave no files.
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("Revision is not a {filename: content} mapping")
+    deleted = sorted(name for name, content in changes.items() if content is None and name in files)
+    updates = {name: content for name, content in changes.items() if content is not None}
+    updates = normalize_terraform_files(updates) if updates else {}
+
+    merged = {name: content for name, content in files.items() if name not in deleted}
+    changed = sorted(name for name, content in updates.items() if files.get(name) != content)
+    merged.update(updates)
+    if not merged:
+        raise ValueError("Revision would delete every file")
+    return merged, changed, deleted
+
 def setup_gcs_backend(cwd, project_id, thread_id):
     """Creates a backend.tf file to store state in GCS."""
     bucket_name = f"terraform-bot-state-{project_id}"
@@ -45,28 +290,276 @@ terraform {{
     with open(os.path.join(cwd, "backend.tf"), "w") as f:
         f.write(backend_config)
 
-def terraform_init(cwd):
-    """Runs terraform init."""
-    return run_command("terraform init -reconfigure", cwd)
+def mirrored_providers(mirror_dir):
+    """Returns the provider source addresses present in a filesystem mirror."""
+    found = []
+    if not mirror_dir or not os.path.isdir(mirror_dir):
+        return found
+    for hostname in sorted(os.listdir(mirror_dir)):
+        host_dir = os.path.join(mirror_dir, hostname)
+        if not os.path.isdir(host_dir):
+            continue
+        for namespace in sorted(os.listdir(host_dir)):
+            ns_dir = os.path.join(host_dir, namespace)
+            if not os.path.isdir(ns_dir):
+                continue
+            for name in sorted(os.listdir(ns_dir)):
+                found.append(f"{hostname}/{namespace}/{name}")
+    return found
+
+def operator_cli_config():
+    """Contents of the operator's CLI config, "" if there is none (or it is the bot's own file)."""
+    if os.path.abspath(OPERATOR_CLI_CONFIG_FILE) == os.path.abspath(TF_BOT_CLI_CONFIG_FILE):
+        return ""
+    try:
+        with open(OPERATOR_CLI_CONFIG_FILE) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+def write_cli_config():
+    """Writes the Terraform CLI config for the shared plugin cache and mirror.
+
+    The operator's config is copied in first; settings it already makes
+    (its own plugin cache or provider_installation block) are left as they are.
+    """
+    operator = operator_cli_config()
 
-def terraform_plan(cwd):
-    """Runs terraform plan and returns the output."""
-    return run_command("terraform plan -no-color -out=tfplan", cwd)
+    def defined(name):
+        return re.search(rf"^\s*{name}\b", operator, re.MULTILINE) is not None
 
-def terraform_apply(cwd):
-    """Runs terraform apply."""
-    return run_command("terraform apply -no-color -auto-approve tfplan", cwd)
+    lines = [operator.rstrip("\n")] if operator.strip() else []
+    if not defined("plugin_cache_dir"):
+        os.makedirs(TF_PLUGIN_CACHE_DIR, exist_ok=True)
+        lines.append(f'plugin_cache_dir = "{TF_PLUGIN_CACHE_DIR}"')
+    if not defined("plugin_cache_may_break_dependency_lock_file"):
+        # Lets init reuse cached providers even when a workspace has no lock file yet.
+        lines.append("plugin_cache_may_break_dependency_lock_file = true")
+    mirrored = mirrored_providers(TF_PROVIDER_MIRROR_DIR)
+    if mirrored and not defined("provider_installation"):
+        include = ", ".join(f'"{p}"' for p in mirrored)
+        lines += [
+            "provider_installation {",
+            "  filesystem_mirror {",
+            f'    path    = "{TF_PROVIDER_MIRROR_DIR}"',
+            f"    include = [{include}]",
+            "  }",
+            # No exclude: versions the mirror lacks (e.g. an older pinned major) still come from the registry.
+            # Terraform picks from all matching methods and installs from the first one that has the version.
+            "  direct {}",
+            "}",
+        ]
+    content = "\n".join(lines) + "\n"
 
-def estimate_cost(cwd):
-    """Runs infracost to estimate costs."""
+    # Rewrite only when it changes, atomically, since concurrent sessions read it.
+    global _cli_config
+    if content != _cli_config or not os.path.exists(TF_BOT_CLI_CONFIG_FILE):
+        os.makedirs(os.path.dirname(TF_BOT_CLI_CONFIG_FILE), exist_ok=True)
+        tmp_path = f"{TF_BOT_CLI_CONFIG_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, TF_BOT_CLI_CONFIG_FILE)
+        _cli_config = content
+    return TF_BOT_CLI_CONFIG_FILE
+
+def terraform_env():
+    """Environment for terraform commands: shared plugin cache, no update checks."""
+    env = os.environ.copy()
+    env["TF_CLI_CONFIG_FILE"] = write_cli_config()
+    env["TF_IN_AUTOMATION"] = "1"
+    env["CHECKPOINT_DISABLE"] = "1"
+    return env
+
+def init_fingerprint(cwd):
+    """Hashes everything `terraform init` depends on in a workspace.
+
+    That is the required_providers blocks, module sources/versions, the
+    providers implied by resource/data/provider blocks, and backend.tf.
+    Resource bodies are deliberately left out so edits to them don't
+    trigger a new init.
+    """
+    parts = []
+    for name in sorted(os.listdir(cwd)):
+        if not name.endswith(".tf"):
+            continue
+        with open(os.path.join(cwd, name)) as f:
+            content = f.read()
+        if name == "backend.tf":
+            parts.append(f"backend:{content.strip()}")
+            continue
+        for body in hcl.block_bodies(content, r"required_providers"):
+            parts.append(f"required_providers:{' '.join(body.split())}")
+        for body in hcl.block_bodies(content, r'\bmodule\s+"[^"]*"'):
+            refs = re.findall(r'^\s*(source|version)\s*=\s*"([^"]*)"', body, re.MULTILINE)
+            parts.append(f"module:{refs}")
+        implied = re.findall(r'^\s*(?:resource|data)\s+"([a-zA-Z0-9]+)_', content, re.MULTILINE)
+        implied += re.findall(r'^\s*provider\s+"([^"]+)"', content, re.MULTILINE)
+        parts.append(f"providers:{sorted(set(implied))}")
+    return hashlib.sha256("\n".join(sorted(parts)).encode()).hexdigest()
+
+# terraform init writes to the shared TF_PLUGIN_CACHE_DIR, which Terraform
+# does not support being used by several inits at once.
+_init_locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock
+
+def init_lock():
+    loop = asyncio.get_running_loop()
+    lock = _init_locks.get(loop)
+    if lock is None:
+        lock = _init_locks[loop] = asyncio.Lock()
+    return lock
+
+async def terraform_init(cwd, backend=True, on_line=None):
+    """Runs terraform init, unless providers, modules and backend are unchanged.
+
+    Inits run one at a time per process, since they share the plugin cache.
+    """
+    fingerprint = init_fingerprint(cwd)
+    marker = os.path.join(cwd, INIT_FINGERPRINT_FILE)
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == fingerprint:
+                logger.info(f"Skipping terraform init in {cwd}: providers, modules and backend unchanged")
+                return "Terraform init skipped (providers, modules and backend unchanged)."
+
+    flags = "-reconfigure" if backend else "-backend=false"
+    async with init_lock():
+        output = await run_command_async(
+            ["terraform", "init", flags, "-input=false", "-no-color"], cwd, env=terraform_env(), on_line=on_line
+        )
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, "w") as f:
+        f.write(fingerprint)
+    return output
+
+async def validate_config(cwd, files):
+    """Validates generated files and returns a list of diagnostics.
+
+    Every .tf/.tfvars file is parsed locally first; only when that passes is
+    the config written to cwd (a scratch workspace without backend) and
+    checked with `terraform validate -json`. Each diagnostic is a dict with
+    file, line, severity ("error"/"warning"), message and source. If the
+    terraform CLI itself can't run (missing, timed out), the local parse
+    result stands; an init that fails on the config is an error diagnostic.
+    """
+    if not any(name.endswith(".tf") for name in files):
+        return [{"file": "", "line": 0, "severity": "error", "message": "No .tf files were generated", "source": "hcl"}]
+
+    diagnostics = []
+    for filename, content in files.items():
+        if not filename.endswith((".tf", ".tfvars")):
+            continue
+        for line, message in hcl.syntax_errors(content, top_level=filename.endswith(".tf")):
+            diagnostics.append({
+                "file": filename, "line": line, "severity": "error", "message": message, "source": "hcl",
+            })
+    if diagnostics:
+        return diagnostics
+
+    write_terraform_files(cwd, files, prune=True)
+    try:
+        await terraform_init(cwd, backend=False)
+        output = await run_command_async(
+            ["terraform", "validate", "-json", "-no-color"], cwd, env=terraform_env(), check=False
+        )
+        report = json.loads(output)
+    except CommandError as e:
+        if isinstance(e, CommandTimeout) or e.returncode is None:
+            logger.warning(f"terraform validate unavailable in {cwd}, using the local parse only: {e}")
+            return diagnostics
+        # init exited non-zero: the config itself is at fault (unknown provider,
+        # bad required_providers, a version constraint that can't be met)
+        return [{
+            "file": "", "line": 0, "severity": "error",
+            "message": f"terraform init failed: {(e.stderr or str(e)).strip()[:2000]}", "source": "terraform",
+        }]
+    except (OSError, ValueError) as e:  # no terraform binary, or output that isn't a validate report
+        logger.warning(f"terraform validate unavailable in {cwd}, using the local parse only: {e}")
+        return diagnostics
+
+    for d in report.get("diagnostics", []):
+        where = d.get("range") or {}
+        message = d.get("summary", "")
+        if d.get("detail"):
+            message += f": {d['detail']}"
+        diagnostics.append({
+            "file": where.get("filename", ""),
+            "line": (where.get("start") or {}).get("line", 0),
+            "severity": d.get("severity", "error"),
+            "message": message,
+            "source": "terraform",
+        })
+    return diagnostics
+
+def format_diagnostics(diagnostics):
+    """One `file:line: severity: message` line per diagnostic."""
+    return "\n".join(
+        f"{d['file'] or '<config>'}:{d['line']}: {d['severity']}: {d['message']}" for d in diagnostics
+    )
+
+async def terraform_plan(cwd, on_line=None):
+    """Runs terraform plan, exports it with export_plan_json and returns the plan output.
+
+    on_line(stream, line) receives the plan output as it is produced.
+    """
+    plan_json = os.path.join(cwd, PLAN_JSON_FILE)
+    if os.path.exists(plan_json):
+        os.remove(plan_json)  # never let a consumer read the previous plan
+    output = await run_command_async(
+        ["terraform", "plan", "-no-color", "-input=false", f"-out={PLAN_FILE}"], cwd, env=terraform_env(), on_line=on_line
+    )
+    await export_plan_json(cwd)
+    return output
+
+async def export_plan_json(cwd):
+    """Writes `terraform show -json tfplan` to tfplan.json and returns its path."""
+    path = os.path.join(cwd, PLAN_JSON_FILE)
+    # Streamed straight to disk: the JSON of a large plan can be many megabytes.
+    await run_command_async(
+        ["terraform", "show", "-json", PLAN_FILE], cwd, env=terraform_env(), stdout_path=path + ".tmp"
+    )
+    os.replace(path + ".tmp", path)
+    return path
+
+async def terraform_apply(cwd, on_line=None):
+    """Runs terraform apply; on_line(stream, line) receives its output as it is produced."""
+    return await run_command_async(
+        ["terraform", "apply", "-no-color", "-input=false", "-auto-approve", PLAN_FILE], cwd, env=terraform_env(),
+        on_line=on_line,
+    )
+
+def prewarm_providers(providers=None):
+    """Fills the provider mirror and plugin cache with the common providers.
+
+    Meant to run at image build (or container start) so that session inits
+    for these providers are local and take well under a second.
+    """
+    providers = providers or PREWARM_PROVIDERS
+    required = "\n".join(
+        f'    {name} = {{ source = "{source}" }}' for name, source in providers.items()
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, "versions.tf"), "w") as f:
+            f.write(f"terraform {{\n  required_providers {{\n{required}\n  }}\n}}\n")
+        if TF_PROVIDER_MIRROR_DIR:
+            logger.info(f"Mirroring providers into {TF_PROVIDER_MIRROR_DIR}...")
+            run_command(["terraform", "providers", "mirror", TF_PROVIDER_MIRROR_DIR], cwd, env=terraform_env())
+        logger.info(f"Populating plugin cache {TF_PLUGIN_CACHE_DIR}...")
+        run_command(["terraform", "init", "-backend=false", "-input=false"], cwd, env=terraform_env())
+
+async def estimate_cost(cwd):
+    """Runs infracost to estimate costs.
+
+    Uses the plan JSON exported by terraform_plan, so infracost doesn't
+    evaluate the Terraform directory a second time. Falls back to the
+    directory if there is no exported plan.
+    """
     api_key = os.getenv("INFRACOST_API_KEY")
     if not api_key:
         return "Infracost API Key not found. Skipping cost estimation."
     
     try:
-        # Ensure we have a plan first (though infracost can run on dir)
-        # We'll run on the directory
-        output = run_command("infracost breakdown --path . --format json", cwd)
+        path = PLAN_JSON_FILE if os.path.exists(os.path.join(cwd, PLAN_JSON_FILE)) else "."
+        output = await run_command_async(["infracost", "breakdown", "--path", path, "--format", "json"], cwd)
         data = json.loads(output)
         
         total_monthly = data.get("totalMonthlyCost", "0.00")
@@ -89,30 +582,31 @@ def estimate_cost(cwd):
         logger.error(f"Infracost failed: {e}")
         return f"Cost estimation failed: {str(e)}"
 
-def upload_directory_to_gcs(cwd, project_id, thread_id):
-    """Uploads the entire directory to a GCS bucket."""
+async def upload_directory_to_gcs(cwd, project_id, thread_id):
+    """Archives the workspace to gs://terraform-bot-archives-<project>/archives/<thread_id>/.
+
+    Uploads in process (see gcs_upload); the .terraform dir and the plan
+    binary are left out, and files already archived unchanged are skipped.
+    """
     bucket_name = f"terraform-bot-archives-{project_id}"
-    destination = f"gs://{bucket_name}/archives/{thread_id}/"
-    
-    try:
-        # 1. Create bucket if not exists
-        logger.info(f"Ensuring bucket {bucket_name} exists...")
-        # Try creating, ignore error if it exists (or check first)
-        # "gcloud storage buckets create" fails if exists. 
-        # "gcloud storage ls" to check.
-        try:
-            run_command(f"gcloud storage buckets describe gs://{bucket_name}", cwd)
-        except:
-            logger.info(f"Bucket {bucket_name} not found. Creating...")
-            run_command(f"gcloud storage buckets create gs://{bucket_name} --project={project_id} --location=us-central1", cwd)
+    prefix = f"archives/{thread_id}/"
+    destination = f"gs://{bucket_name}/{prefix}"
 
-        # 2. Upload files
+    try:
         logger.info(f"Uploading files from {cwd} to {destination}...")
-        # Exclude .terraform folder and other temp files if needed, but user asked for "terraform folder"
-        # We'll upload everything for now, maybe exclude .git if it were a repo, but this is a temp dir.
-        run_command(f"gcloud storage cp -r {cwd}/* {destination}", cwd)
-        
-        return f"Successfully uploaded files to {destination}"
+        counts = await gcs_upload.uploader.upload_directory(cwd, bucket_name, prefix, project_id)
+        return (
+            f"Successfully uploaded files to {destination} "
+            f"({counts['uploaded']} uploaded, {counts['unchanged']} unchanged)"
+        )
     except Exception as e:
         logger.error(f"GCS Upload failed: {e}")
         return f"GCS Upload failed: {str(e)}"
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["prewarm"]:
+        prewarm_providers()
+    else:
+        print("Usage: python terraform_utils.py prewarm")
+        sys.exit(1)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from checkpointer import SQLiteCheckpointSaver
+
+
+def config(thread_id, checkpoint_id=None):
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def put(saver, thread_id, step=0, values=None):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = dict(values or {})
+    return saver.put(config(thread_id), checkpoint, {"step": step}, {})
+
+
+def last_access(saver, thread_id):
+    row = saver.conn.execute("SELECT last_access FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+    return row[0] if row else None
+
+
+def test_keeps_only_the_newest_checkpoints_per_thread():
+    saver = SQLiteCheckpointSaver(":memory:", keep_checkpoints=3)
+    ids = [put(saver, "a", step)["configurable"]["checkpoint_id"] for step in range(5)]
+    put(saver, "b")
+
+    kept = [item.config["configurable"]["checkpoint_id"] for item in saver.list(config("a"))]
+    assert kept == ids[:-4:-1]
+    assert len(list(saver.list(config("b")))) == 1
+    assert saver.pruned_checkpoints == 2
+
+
+def test_sweep_evicts_idle_threads_after_ttl():
+    saver = SQLiteCheckpointSaver(":memory:", ttl_seconds=60)
+    put(saver, "idle")
+    put(saver, "active")
+    saver.conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = 'idle'", (time.time() - 120,))
+    saver._touched.clear()
+
+    assert saver.sweep() == 1
+    assert saver.get_tuple(config("idle")) is None
+    assert saver.get_tuple(config("active")) is not None
+
+
+def test_sweep_evicts_least_recently_used_threads_beyond_max_threads():
+    saver = SQLiteCheckpointSaver(":memory:", max_threads=2, ttl_seconds=0)
+    for thread_id in ("old", "middle", "new"):
+        put(saver, thread_id)
+    now = time.time()
+    for age, thread_id in enumerate(("new", "middle", "old")):
+        saver.conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = ?", (now - age, thread_id))
+    saver._touched.clear()
+
+    assert saver.sweep() == 1
+    assert saver.get_tuple(config("old")) is None
+    assert saver.get_tuple(config("middle")) is not None
+
+
+def test_sweep_skips_threads_used_after_selection():
+    saver = SQLiteCheckpointSaver(":memory:", ttl_seconds=60)
+    put(saver, "a")
+    saver.conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = 'a'", (time.time() - 120,))
+    saver._touched["a"] = time.monotonic() + 1  # written to after the sweep started
+
+    assert saver.sweep() == 0
+    assert saver.get_tuple(config("a")) is not None
+
+
+def test_reads_update_last_access_at_most_once_per_interval():
+    saver = SQLiteCheckpointSaver(":memory:", touch_interval=60)
+    put(saver, "a")
+    saver.conn.execute("UPDATE threads SET last_access = 0 WHERE thread_id = 'a'")
+
+    saver.get_tuple(config("a"))
+    assert last_access(saver, "a") == 0
+
+    saver._touched["a"] -= 61
+    saver.get_tuple(config("a"))
+    assert last_access(saver, "a") > 0
+
+
+def test_cache_hits_return_copies_with_pending_writes():
+    saver = SQLiteCheckpointSaver(":memory:")
+    saved = put(saver, "a", values={"next_action": "plan"})
+    saver.put_writes(saved, [("next_action", "apply")], "task-1")
+
+    first = saver.get_tuple(config("a"))
+    assert [(w[1], w[2]) for w in first.pending_writes] == [("next_action", "apply")]
+    first.checkpoint["channel_values"]["next_action"] = "mutated"
+    first.pending_writes.clear()
+
+    second = saver.get_tuple(config("a"))
+    assert saver.cache_hits == 1
+    assert second.checkpoint["channel_values"]["next_action"] == "plan"
+    assert [(w[1], w[2]) for w in second.pending_writes] == [("next_action", "apply")]
+
+
+def test_async_put_sweeps_in_the_background():
+    saver = SQLiteCheckpointSaver(":memory:", ttl_seconds=60, sweep_interval=0)
+    put(saver, "idle")
+    saver.conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = 'idle'", (time.time() - 120,))
+    saver._touched.clear()
+
+    async def main():
+        checkpoint = empty_checkpoint()
+        await saver.aput(config("b"), checkpoint, {"step": 0}, {})
+        while saver._sweeping:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert saver.get_tuple(config("idle")) is None
+    assert saver.evicted_threads == 1
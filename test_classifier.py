@@ -0,0 +1,62 @@
+import pytest
+
+import metrics
+from classifier import approval_classifier, intent_classifier
+
+
+@pytest.mark.parametrize("message", [
+    "yes",
+    "approved, thanks!",
+    "lgtm",
+    "sure, go ahead",
+    "ok proceed",
+    "yes, looks good, apply it",
+    "yes please go ahead and apply",
+    "that looks fine, deploy it",
+])
+def test_plain_approvals_are_decided_locally(message):
+    assert approval_classifier.classify(message)[0] == "APPROVE"
+
+
+@pytest.mark.parametrize("message", [
+    "Sure, deploy it with t3.large",
+    "go ahead with a t3.large",
+    "yes and make the bucket public",
+    "Approve, though rename the bucket to logs-prod",
+    "yes please make it private",
+    "go ahead with versioning enabled",
+])
+def test_approvals_with_extra_content_go_to_the_llm(message):
+    assert approval_classifier.classify(message) == (None, 0.0)
+
+
+def test_revisions_are_decided_locally():
+    assert approval_classifier.classify("no, use a t3.large instead")[0] == "REVISE"
+
+
+@pytest.mark.parametrize("message, label", [
+    ("deploy a gcs bucket in us-central1", "DEPLOYMENT"),
+    ("create an s3 bucket", "DEPLOYMENT"),
+    ("provision a vpc with two subnets", "DEPLOYMENT"),
+    ("hello", "GENERAL"),
+])
+def test_clear_intents_are_decided_locally(message, label):
+    assert intent_classifier.classify(message)[0] == label
+
+
+@pytest.mark.parametrize("message", [
+    "how do I deploy a vm?",
+    "what is the best instance type for a small db?",
+    "should I use gke or cloud run?",
+])
+def test_questions_are_not_classified_as_deployments(message):
+    assert intent_classifier.classify(message)[0] != "DEPLOYMENT"
+
+
+def test_decisions_are_exported_as_metrics():
+    approval_classifier.classify("lgtm")
+    approval_classifier.classify("go ahead with a t3.large")
+    rendered = metrics.registry.render()
+    assert 'classifier_decisions_total{classifier="approval",outcome="local"}' in rendered
+    assert 'classifier_decisions_total{classifier="approval",outcome="llm_fallback"}' in rendered
+    assert 'classifier_confidence_count{classifier="approval",outcome="local"}' in rendered
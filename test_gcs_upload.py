@@ -0,0 +1,17 @@
+from gcs_upload import collect_files
+
+
+def test_collect_files_keeps_the_lock_file_and_skips_terraform_state_dirs(tmp_path):
+    for name in ("main.tf", ".terraform.lock.hcl", "terraform.tfstate", "tfplan", "old.tfplan",
+                 ".terraform/.bot-init-fingerprint", ".terraform/providers/p/terraform-provider-google",
+                 "modules/net/main.tf"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x")
+
+    assert collect_files(str(tmp_path)) == [
+        ".terraform.lock.hcl",
+        "main.tf",
+        "terraform.tfstate",
+        "modules/net/main.tf",
+    ]
@@ -0,0 +1,58 @@
+from langchain_core.messages import AIMessage
+
+import metrics
+from llm_cache import PENDING_KEY, CachedChatModel, LLMResponseCache
+
+
+def table_bytes(cache):
+    return cache.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+
+def test_running_byte_total_matches_the_table():
+    cache = LLMResponseCache(":memory:", max_bytes=1000)
+    for i in range(30):
+        cache.put(f"k{i}", "model", "node", "x" * 100)
+    assert cache.total_bytes == table_bytes(cache) == 1000
+
+    cache.put("k29", "model", "node", "y" * 50)  # replaces an entry
+    assert cache.total_bytes == table_bytes(cache) == 950
+
+
+def test_least_recently_used_entries_are_evicted_beyond_max_bytes():
+    cache = LLMResponseCache(":memory:", max_bytes=250, memory_size=0)
+    for key in ("a", "b", "c"):
+        cache.put(key, "model", "node", "x" * 100)
+    assert cache.get("a") == (None, None)
+    assert cache.get("c") == ("x" * 100, "disk")
+    assert cache.total_bytes == table_bytes(cache) == 200
+
+
+class FakeModel:
+    model_name = "fake"
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return AIMessage(content=self.replies.pop(0))
+
+
+def test_only_committed_replies_are_replayed():
+    model = FakeModel(["not json", '{"main.tf": "ok"}', "unused"])
+    llm = CachedChatModel(model, LLMResponseCache(":memory:"))
+    prompt = [("human", "generate a bucket")]
+
+    assert llm.invoke(prompt).content == "not json"  # rejected by the caller, never committed
+    reply = llm.invoke(prompt)
+    assert reply.content == '{"main.tf": "ok"}'
+    llm.commit(reply)
+
+    replayed = llm.invoke(prompt)
+    assert replayed.content == '{"main.tf": "ok"}'
+    assert model.calls == 2
+    assert PENDING_KEY not in reply.response_metadata
+    llm.commit(replayed)  # cached replies are a no-op
+    assert llm.cache.stats()["disk_entries"] == 1
+    assert 'llm_cache_lookups_total{node="<none>",outcome="hits"}' in metrics.registry.render()
@@ -0,0 +1,79 @@
+import pytest
+
+from security_scanner import scan
+
+
+def rules(files):
+    return [(f["rule"], f["severity"]) for f in scan(files)["findings"]]
+
+
+def test_deny_only_firewall_from_anywhere_is_clean():
+    result = scan({"main.tf": """
+resource "google_compute_firewall" "deny_all" {
+  name          = "deny-all-ingress"
+  network       = "default"
+  direction     = "INGRESS"
+  source_ranges = ["0.0.0.0/0"]
+  deny {
+    protocol = "all"
+  }
+}
+"""})
+    assert result["severity"] == "NONE"
+    assert result["findings"] == []
+
+
+def test_firewall_allowing_ssh_from_anywhere_is_high():
+    assert rules({"main.tf": """
+resource "google_compute_firewall" "ssh" {
+  name          = "allow-ssh"
+  network       = "default"
+  source_ranges = ["0.0.0.0/0"]
+  allow {
+    protocol = "tcp"
+    ports    = ["22"]
+  }
+}
+"""}) == [("OPEN_INGRESS", "HIGH")]
+
+
+def test_firewall_allowing_https_from_anywhere_is_medium():
+    assert rules({"main.tf": """
+resource "google_compute_firewall" "https" {
+  name          = "allow-https"
+  network       = "default"
+  source_ranges = ["0.0.0.0/0"]
+  allow {
+    protocol = "tcp"
+    ports    = ["443"]
+  }
+}
+"""}) == [("OPEN_INGRESS", "MEDIUM")]
+
+
+@pytest.mark.parametrize("rtype", [
+    "google_storage_bucket_acl", "google_storage_default_object_acl", "google_storage_object_acl",
+])
+@pytest.mark.parametrize("attribute", [
+    'predefined_acl = "publicRead"',
+    'predefined_acl = "publicReadWrite"',
+    'role_entity    = ["OWNER:project-owners-123", "READER:allUsers"]',
+    'role_entity    = ["READER:allAuthenticatedUsers"]',
+])
+def test_public_gcs_acls_are_high(rtype, attribute):
+    assert rules({"main.tf": f"""
+resource "{rtype}" "acl" {{
+  bucket = "my-bucket"
+  {attribute}
+}}
+"""}) == [("PUBLIC_BUCKET_ACL", "HIGH")]
+
+
+def test_private_gcs_acl_is_clean():
+    assert rules({"main.tf": """
+resource "google_storage_bucket_acl" "acl" {
+  bucket         = "my-bucket"
+  predefined_acl = "projectPrivate"
+  role_entity    = ["OWNER:project-owners-123", "READER:group-readers@example.com"]
+}
+"""}) == []
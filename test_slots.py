@@ -0,0 +1,45 @@
+import pytest
+
+from slots import merge_slots, normalize_answer
+
+
+@pytest.mark.parametrize("field, text, expected", [
+    ("region", "us-east-1", {"region": "us-east-1", "provider": "AWS"}),
+    ("region", "europe-west1 please", {"region": "europe-west1", "provider": "GCP"}),
+    ("instance_type", "t3.micro", {"instance_type": "t3.micro"}),
+    ("instance_type", "e2-medium is fine", {"instance_type": "e2-medium"}),
+    ("provider", "google cloud", {"provider": "GCP"}),
+])
+def test_single_value_answers(field, text, expected):
+    assert normalize_answer(field, text) == expected
+
+
+def test_known_provider_is_not_overwritten_by_the_region():
+    assert normalize_answer("region", "us-east-1", {"provider": "AWS"}) == {"region": "us-east-1"}
+
+
+@pytest.mark.parametrize("field, text, expected", [
+    ("region", "us-east-1 with a t3.micro",
+     {"region": "us-east-1", "provider": "AWS", "instance_type": "t3.micro"}),
+    ("instance_type", "n1-standard-1 in us-central1",
+     {"instance_type": "n1-standard-1", "region": "us-central1", "provider": "GCP"}),
+    ("provider", "aws, eu-west-1", {"provider": "AWS", "region": "eu-west-1"}),
+])
+def test_multi_value_answers_fill_every_slot(field, text, expected):
+    assert normalize_answer(field, text) == expected
+
+
+@pytest.mark.parametrize("field, text", [
+    ("region", "not sure yet"),                      # asked slot not in the answer
+    ("region", "us-east-1 or us-west-2"),            # ambiguous
+    ("region", "azure in us-east-1"),                # provider contradicts the region
+    ("region", "us-east-1 " + "word " * 10),         # too long for the fast path
+    ("resource_type", "a bucket"),                   # no local finder
+])
+def test_answers_left_to_the_llm(field, text):
+    assert normalize_answer(field, text) == {}
+
+
+def test_merge_slots_keeps_existing_values():
+    merged = merge_slots({"provider": "AWS", "region": "us-east-1"}, {"region": " eu-west-1 ", "provider": ""})
+    assert merged == {"provider": "AWS", "region": "eu-west-1"}
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import terraform_utils as tf_utils
+
+CONFIG = {"main.tf": 'resource "google_storage_bucket" "b" {\n  name     = "b"\n  location = "US"\n}\n'}
+
+
+def validate(tmp_path, monkeypatch, init_error=None, validate_output='{"valid": true, "diagnostics": []}'):
+    async def fake_init(cwd, backend=True, on_line=None):
+        if init_error:
+            raise init_error
+
+    async def fake_run(argv, cwd, **kwargs):
+        return validate_output
+
+    monkeypatch.setattr(tf_utils, "terraform_init", fake_init)
+    monkeypatch.setattr(tf_utils, "run_command_async", fake_run)
+    return asyncio.run(tf_utils.validate_config(str(tmp_path), CONFIG))
+
+
+def test_init_failure_on_the_config_is_an_error_diagnostic(tmp_path, monkeypatch):
+    error = tf_utils.CommandError("Command failed", 1, "", "Error: Failed to query available provider packages")
+    [diagnostic] = validate(tmp_path, monkeypatch, init_error=error)
+    assert diagnostic["severity"] == "error"
+    assert diagnostic["source"] == "terraform"
+    assert "Failed to query available provider packages" in diagnostic["message"]
+
+
+@pytest.mark.parametrize("error", [
+    tf_utils.CommandError("Command failed: [Errno 2] No such file or directory: 'terraform'"),
+    tf_utils.CommandTimeout("Command timed out after 300s: terraform init"),
+])
+def test_unavailable_cli_falls_back_to_the_local_parse(tmp_path, monkeypatch, error):
+    assert validate(tmp_path, monkeypatch, init_error=error) == []
+
+
+def test_validate_diagnostics_are_returned(tmp_path, monkeypatch):
+    output = ('{"valid": false, "diagnostics": [{"severity": "error", "summary": "Missing required argument",'
+              ' "range": {"filename": "main.tf", "start": {"line": 2}}}]}')
+    [diagnostic] = validate(tmp_path, monkeypatch, validate_output=output)
+    assert (diagnostic["file"], diagnostic["line"], diagnostic["source"]) == ("main.tf", 2, "terraform")
+
+
+def cli_config(tmp_path, monkeypatch, operator):
+    operator_path = tmp_path / "operator.tfrc"
+    operator_path.write_text(operator)
+    monkeypatch.setattr(tf_utils, "OPERATOR_CLI_CONFIG_FILE", str(operator_path))
+    monkeypatch.setattr(tf_utils, "TF_BOT_CLI_CONFIG_FILE", str(tmp_path / "bot" / "terraformrc"))
+    monkeypatch.setattr(tf_utils, "TF_PLUGIN_CACHE_DIR", str(tmp_path / "plugin-cache"))
+    monkeypatch.setattr(tf_utils, "_cli_config", None)
+    env = tf_utils.terraform_env()
+    assert operator_path.read_text() == operator
+    with open(env["TF_CLI_CONFIG_FILE"]) as f:
+        return env["TF_CLI_CONFIG_FILE"], f.read()
+
+
+def test_cli_config_merges_the_operator_config_without_overwriting_it(tmp_path, monkeypatch):
+    operator = 'credentials "app.terraform.io" {\n  token = "secret"\n}\n'
+    path, content = cli_config(tmp_path, monkeypatch, operator)
+    assert path == str(tmp_path / "bot" / "terraformrc")
+    assert content.startswith(operator)
+    assert f'plugin_cache_dir = "{tmp_path / "plugin-cache"}"' in content
+
+
+def test_cli_config_keeps_the_operator_plugin_cache(tmp_path, monkeypatch):
+    _, content = cli_config(tmp_path, monkeypatch, 'plugin_cache_dir = "/opt/providers"\n')
+    assert content.count("plugin_cache_dir =") == 1
+    assert "/opt/providers" in content
@@ -0,0 +1,273 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TRACE_RUNS_PER_THREAD = int(os.getenv("TRACE_RUNS_PER_THREAD", "20"))
+TRACE_MAX_THREADS = int(os.getenv("TRACE_MAX_THREADS", "1000"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))  # per graph run
+# When set, every finished run is also written to TRACE_DIR/<thread_id>/<trace_id>.json as OTLP-JSON.
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+SERVICE_NAME = "terraform-bot"
+
+# (run, span) of the innermost open span; copied into executor threads with the context
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+def _new_span(name, kind, trace_id, parent_id, attributes):
+    return {
+        "trace_id": trace_id,
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent_id,
+        "name": name,
+        "kind": kind,
+        "start_ns": time.time_ns(),
+        "end_ns": None,
+        "status": "ok",
+        "attributes": {k: v for k, v in attributes.items() if v is not None},
+    }
+
+
+def _fail(span, error):
+    span["status"] = "error"
+    span["attributes"]["error"] = str(error)[:500]
+
+
+class Tracer:
+    """Keeps span timelines of the most recent graph runs of each thread.
+
+    Each run_graph call is one trace; node executions, supervisor routing
+    decisions, LLM calls and CLI subprocesses inside it become child spans,
+    linked through a context variable. Runs are kept in memory (the last
+    `runs_per_thread` per thread, least recently traced threads evicted
+    beyond `max_threads`) and optionally written to `trace_dir`.
+    """
+
+    def __init__(self, runs_per_thread: int = TRACE_RUNS_PER_THREAD, max_threads: int = TRACE_MAX_THREADS,
+                 max_spans: int = TRACE_MAX_SPANS, trace_dir: str = TRACE_DIR):
+        self.runs_per_thread = runs_per_thread
+        self.max_threads = max_threads
+        self.max_spans = max_spans
+        self.trace_dir = trace_dir
+        self._threads = OrderedDict()  # thread_id -> deque of runs
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-writer") if trace_dir else None
+        self.dropped_spans = 0
+
+    @contextmanager
+    def run(self, thread_id: str, **attributes):
+        """Traces one graph run of thread_id; spans opened inside become its children."""
+        root = _new_span("graph_run", "run", uuid.uuid4().hex, None, {"thread_id": thread_id, **attributes})
+        run = {"thread_id": thread_id, "root": root, "spans": []}
+        with self._lock:
+            runs = self._threads.pop(thread_id, None) or deque(maxlen=self.runs_per_thread)
+            runs.append(run)
+            self._threads[thread_id] = runs
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+
+        token = _current.set((run, root))
+        try:
+            yield root
+        except BaseException as e:
+            _fail(root, e)
+            raise
+        finally:
+            _current.reset(token)
+            root["end_ns"] = time.time_ns()
+            if self._writer is not None:
+                self._writer.submit(self._write, run)
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attributes):
+        """Child span of the innermost open span.
+
+        Outside a traced run this is a no-op; the yielded dict can still be
+        used to set attributes.
+        """
+        current = _current.get()
+        if current is None:
+            yield {"attributes": {}}
+            return
+        run, parent = current
+        span = _new_span(name, kind, parent["trace_id"], parent["span_id"], attributes)
+        token = _current.set((run, span))
+        try:
+            yield span
+        except BaseException as e:
+            _fail(span, e)
+            raise
+        finally:
+            _current.reset(token)
+            span["end_ns"] = time.time_ns()
+            with self._lock:
+                if len(run["spans"]) < self.max_spans:
+                    run["spans"].append(span)
+                else:
+                    self.dropped_spans += 1
+
+    def traces(self, thread_id: str) -> list:
+        """The thread's recent runs, oldest first, each with its spans ordered by start time."""
+        with self._lock:
+            runs = list(self._threads.get(thread_id, ()))
+            snapshots = [(run["root"], list(run["spans"])) for run in runs]
+        return [self._describe(root, spans) for root, spans in snapshots]
+
+    @staticmethod
+    def _describe(root, spans) -> dict:
+        now = time.time_ns()
+
+        def view(span):
+            end = span["end_ns"] or now
+            return {
+                "span_id": span["span_id"],
+                "parent_id": span["parent_id"],
+                "name": span["name"],
+                "kind": span["kind"],
+                "offset_ms": round((span["start_ns"] - root["start_ns"]) / 1e6, 3),
+                "duration_ms": round((end - span["start_ns"]) / 1e6, 3),
+                "status": span["status"] if span["end_ns"] else "running",
+                "attributes": span["attributes"],
+            }
+
+        return {
+            "trace_id": root["trace_id"],
+            "started_at": root["start_ns"] / 1e9,
+            "running": root["end_ns"] is None,
+            **{k: v for k, v in view(root).items() if k in ("duration_ms", "status")},
+            "spans": [view(root)] + [view(s) for s in sorted(spans, key=lambda s: s["start_ns"])],
+        }
+
+    def otlp(self, thread_id: str) -> dict:
+        """The thread's finished runs as one OTLP-JSON ExportTraceServiceRequest."""
+        with self._lock:
+            runs = [run for run in self._threads.get(thread_id, ()) if run["root"]["end_ns"]]
+            spans = [span for run in runs for span in [run["root"], *run["spans"]]]
+        return to_otlp(spans)
+
+    def _write(self, run):
+        thread_dir = os.path.join(self.trace_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", run["thread_id"]))
+        try:
+            os.makedirs(thread_dir, exist_ok=True)
+            path = os.path.join(thread_dir, f"{run['root']['trace_id']}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(to_otlp([run["root"], *run["spans"]]), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write trace for {run['thread_id']}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self._threads),
+                "runs": sum(len(runs) for runs in self._threads.values()),
+                "dropped_spans": self.dropped_spans,
+            }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": SERVICE_NAME},
+            "spans": [{
+                "traceId": span["trace_id"],
+                "spanId": span["span_id"],
+                **({"parentSpanId": span["parent_id"]} if span["parent_id"] else {}),
+                "name": span["name"],
+                "kind": 3 if span["kind"] in ("llm", "subprocess", "http") else 1,  # CLIENT / INTERNAL
+                "startTimeUnixNano": str(span["start_ns"]),
+                "endTimeUnixNano": str(span["end_ns"] or span["start_ns"]),
+                "attributes": [{"key": k, "value": _otlp_value(v)}
+                               for k, v in {"span.kind": span["kind"], **span["attributes"]}.items()],
+                "status": {"code": 2 if span["status"] == "error" else 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+tracer = Tracer()
+
+
+# ======================
+# Graph nodes
+# ======================
+def trace_node(name: str, fn, kind: str = "node"):
+    """Wraps a (sync or async) node function in a span; a routing decision
+    (a changed next_action) is recorded on the span."""
+    def annotate(span, state, result):
+        if not isinstance(result, dict) or "next_action" not in result:
+            return result
+        if kind == "route" or result["next_action"] != state.get("next_action"):
+            span["attributes"]["next_action"] = result["next_action"]
+        return result
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_node(state):
+            with tracer.span(name, kind) as span:
+                return annotate(span, state, await fn(state))
+        return async_node
+
+    @functools.wraps(fn)
+    def node(state):
+        with tracer.span(name, kind) as span:
+            return annotate(span, state, fn(state))
+    return node
+
+
+# ======================
+# LLM calls
+# ======================
+class TracedChatModel:
+    """Records a span for every call to a chat model, cached answers included.
+
+    Any other attribute is forwarded to the wrapped model.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    @staticmethod
+    def _annotate(span, result):
+        prompt, completion = metrics.token_usage(result)
+        span["attributes"].update({
+            "cache": (getattr(result, "response_metadata", None) or {}).get("cache", "miss"),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+        })
+        return result
+
+    def invoke(self, messages, *args, **kwargs):
+        with tracer.span("llm", "llm", model=self.model) as span:
+            return self._annotate(span, self.llm.invoke(messages, *args, **kwargs))
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        with tracer.span("llm", "llm", model=self.model) as span:
+            return self._annotate(span, await self.llm.ainvoke(messages, *args, **kwargs))